@@ -0,0 +1,229 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from uw_cache import UWDayCache
+# Daily aggregates of the rooftop obs, name -> (obs column, aggregation).
+# Insolation is the day's mean Radiation integrated over 24h, in MJ/m^2
+DAILY_METRICS = {
+    'Temperature Max': ('Temperature', 'max'),
+    'Temperature Min': ('Temperature', 'min'),
+    'Temperature Mean': ('Temperature', 'mean'),
+    'Rain': ('Rain', 'sum'),
+    'Gust Max': ('Gust', 'max'),
+    'Insolation': ('Radiation', 'mean')
+}
+DAILY_UNITS = {'Temperature Max': u'\N{DEGREE SIGN}F',
+    'Temperature Min': u'\N{DEGREE SIGN}F',
+    'Temperature Mean': u'\N{DEGREE SIGN}F',
+    'Rain': 'in.',
+    'Gust Max': 'kts',
+    'Insolation': 'MJ/m^2'}
+# Trailing windows in days, Rain is totalled over them, the rest averaged
+ROLLING_WINDOWS = (7, 30)
+# Days either side of a day of year pooled into its baseline, and the fewest
+# pooled days a baseline needs
+BASELINE_HALF_WINDOW = 7
+BASELINE_MIN_COUNT = 10
+
+def daily_summary(obs):
+    ''' Aggregates raw rooftop observations to one row per UTC day with a
+    single groupby.
+
+    Variables:
+        obs = dataframe of raw observations with a Time column
+
+    Returns:
+        df = float32 dataframe indexed by Day with the DAILY_METRICS and the
+        number of observations in Count
+
+    '''
+    temperature = obs['Temperature'].astype(np.float64).replace(0, np.nan)
+    data = pd.DataFrame({'Temperature': temperature,
+        'Rain': obs['Rain'].astype(np.float64),
+        'Gust': obs['Gust'].astype(np.float64),
+        'Radiation': obs['Radiation'].astype(np.float64)})
+    days = pd.DatetimeIndex(obs['Time'].values.astype('datetime64[D]'), name='Day')
+    grouped = data.groupby(days)
+    df = grouped.agg(**{name: (col, how) for name, (col, how) in DAILY_METRICS.items()
+        if name != 'Rain'})
+    # a day without any rain reading is missing, not dry
+    df['Rain'] = grouped['Rain'].sum(min_count=1)
+    df['Insolation'] *= 86400 / 1e6
+    df['Count'] = grouped.size()
+    return df[list(DAILY_METRICS) + ['Count']].astype(np.float32)
+
+class DailyAnalytics:
+    ''' Daily summaries of the rooftop obs with trailing 7/30-day statistics
+    and anomalies against a day-of-year baseline, kept up to date
+    incrementally: each update only aggregates the obs it is given, redoes
+    the trailing windows from the first changed day on and adds newly
+    finalized days to running per-day-of-year sums for the baseline.
+
+    Variables:
+        path = optional .npz file the daily summaries are kept in between runs
+
+    '''
+    def __init__(self, path=None):
+        self.path = path
+        self.daily = daily_summary(pd.DataFrame({col: pd.Series(dtype=np.float64)
+            for col in ('Temperature', 'Rain', 'Gust', 'Radiation')}).assign(
+            Time=pd.Series(dtype='datetime64[ns]')))
+        self.summary = None
+        self.final_through = None
+        # per day of year: number of final days, sum and sum of squares
+        shape = (366, len(DAILY_METRICS))
+        self._n = np.zeros(shape)
+        self._sum = np.zeros(shape)
+        self._sumsq = np.zeros(shape)
+        self._lock = threading.Lock()
+        self._load()
+
+    def update(self, obs):
+        ''' Adds the days covered by obs, replacing earlier rows for those days
+        unless they were already final.
+
+        Returns:
+            summary = the full summary dataframe, see summarize
+
+        '''
+        with self._lock:
+            new = daily_summary(obs)
+            if self.final_through is not None:
+                new = new[new.index > self.final_through]
+            if not len(new):
+                if self.summary is None:
+                    self.summary = self.summarize(self.daily)
+                return self.summary
+            self.daily = pd.concat([self.daily[~self.daily.index.isin(new.index)],
+                new]).sort_index()
+
+            final = new[[UWDayCache.is_final(day) for day in new.index]]
+            if len(final):
+                self._add_to_baseline(final)
+                self.final_through = final.index[-1]
+            self.summary = self._resummarize(new.index[0])
+            self._save()
+            return self.summary
+
+    def catch_up(self, store, chunk_days=31):
+        ''' Adds the days of a history.HistoryStore after the last final day,
+        a chunk at a time so memory stays bounded.
+        '''
+        first, last = store.first_time(), store.last_time()
+        if first is None:
+            return self.summary
+        start = first.normalize()
+        if self.final_through is not None:
+            start = max(start, self.final_through + pd.Timedelta(days=1))
+        while start <= last:
+            end = start + pd.Timedelta(days=chunk_days)
+            self.update(store.query(start, end))
+            start = end
+        return self.summary
+
+    def summarize(self, daily):
+        ''' Adds the trailing window statistics and the baseline and anomaly
+        of each metric to daily summaries.
+
+        Returns:
+            df = float32 dataframe indexed by Day, for each metric also
+            "<metric> 7d", "<metric> 30d", "<metric> Baseline" and
+            "<metric> Anomaly" (difference from the baseline)
+
+        '''
+        metrics = daily[list(DAILY_METRICS)].astype(np.float64)
+        columns = {col: daily[col] for col in daily}
+        for window in ROLLING_WINDOWS:
+            rolled = metrics.rolling('{}D'.format(window))
+            means, sums = rolled.mean(), rolled.sum()
+            for col in DAILY_METRICS:
+                columns['{} {}d'.format(col, window)] = sums[col] if col == 'Rain' else means[col]
+        mean, _ = self.baseline()
+        doy = np.minimum(daily.index.dayofyear.values - 1, 365)
+        for i, col in enumerate(DAILY_METRICS):
+            columns[col + ' Baseline'] = mean[doy, i]
+            columns[col + ' Anomaly'] = metrics[col].values - mean[doy, i]
+        return pd.DataFrame(columns, index=daily.index).astype(np.float32)
+
+    def baseline(self):
+        ''' Mean and standard deviation of each metric per day of year,
+        pooled over BASELINE_HALF_WINDOW days either side and NaN with fewer
+        than BASELINE_MIN_COUNT final days behind them.
+
+        Returns:
+            (mean, std): arrays of shape (366, number of metrics)
+
+        '''
+        offsets = range(-BASELINE_HALF_WINDOW, BASELINE_HALF_WINDOW + 1)
+        n = sum(np.roll(self._n, k, axis=0) for k in offsets)
+        total = sum(np.roll(self._sum, k, axis=0) for k in offsets)
+        sumsq = sum(np.roll(self._sumsq, k, axis=0) for k in offsets)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / n
+            std = np.sqrt(np.maximum(sumsq / n - mean ** 2, 0))
+        mean[n < BASELINE_MIN_COUNT] = np.nan
+        std[n < BASELINE_MIN_COUNT] = np.nan
+        return mean, std
+
+    def _add_to_baseline(self, final):
+        values = final[list(DAILY_METRICS)].values.astype(np.float64)
+        valid = ~np.isnan(values)
+        values = np.where(valid, values, 0)
+        doy = np.minimum(final.index.dayofyear.values - 1, 365)
+        # np.add.at sums repeated days of year instead of keeping the last
+        np.add.at(self._n, doy, valid)
+        np.add.at(self._sum, doy, values)
+        np.add.at(self._sumsq, doy, values ** 2)
+
+    def _resummarize(self, first_changed):
+        # rows before the first changed day keep their window statistics, the
+        # trailing windows only need the longest window of days before it
+        window = pd.Timedelta(days=max(ROLLING_WINDOWS) - 1)
+        tail = self.summarize(self.daily[self.daily.index >= first_changed - window])
+        tail = tail[tail.index >= first_changed]
+        if self.summary is None:
+            return tail if first_changed <= self.daily.index[0] else self.summarize(self.daily)
+        head = self.summary[self.summary.index < first_changed]
+        summary = pd.concat([head, tail])
+        # the baseline may have moved, refresh it and the anomalies everywhere
+        mean, _ = self.baseline()
+        doy = np.minimum(summary.index.dayofyear.values - 1, 365)
+        for i, col in enumerate(DAILY_METRICS):
+            summary[col + ' Baseline'] = mean[doy, i].astype(np.float32)
+            summary[col + ' Anomaly'] = (summary[col].values - mean[doy, i]).astype(np.float32)
+        return summary
+
+    def _load(self):
+        if self.path is None:
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as f:
+                daily = pd.DataFrame({col: f[col] for col in self.daily.columns},
+                    index=pd.DatetimeIndex(f['Day'], name='Day'))
+        except (IOError, KeyError, ValueError):
+            return
+        self.daily = daily
+        final = daily[[UWDayCache.is_final(day) for day in daily.index]]
+        if len(final):
+            self._add_to_baseline(final)
+            self.final_through = final.index[-1]
+        self.summary = self.summarize(daily) if len(daily) else None
+
+    def _save(self):
+        if self.path is None:
+            return
+        cache_dir = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, Day=self.daily.index.values,
+                    **{col: self.daily[col].values for col in self.daily.columns})
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.remove(tmp)
+            raise
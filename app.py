@@ -1,12 +1,27 @@
 import dash
-from dash import dcc, html, Output, Input
+from dash import dcc, html, dash_table, Output, Input, State, ClientsideFunction
 import dash_bootstrap_components as dbc
 import pandas as pd
 import numpy as np
+import json
+import logging
+import os
+import threading
 # from dash.dependencies import Output, Input
-import plotly.express as px
-import plotly.graph_objects as go
+from collections import OrderedDict
+from functools import lru_cache
+from dash.exceptions import PreventUpdate
 from uw_wx import *
+from rollups import ROLLUPS, pick_resolution, prepare_obs, rollup
+from live import LIVE_FEED, UW_LIVE_INTERVAL
+from downsample import downsample
+from openweather import OPENWEATHER_TTL
+from scheduler import Scheduler
+from analytics import DAILY_METRICS, DAILY_UNITS, ROLLING_WINDOWS
+from verification import ForecastArchive
+from stations import DEFAULT_STATION, STATIONS, load_current, load_forecasts
+from metrics import add_metrics_endpoint, timed
+from export import add_export_endpoint
 # Units Dictionary
 UNITS_DICT = {'Gust': 'kts',
     'Pressure': 'hPa',
@@ -29,6 +44,10 @@ external_stylesheets = [
 # Intialize the Dash object that serves everything
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 app.title = "UW ATG Rooftop Wx"
+# Latency, byte and cache counters for Prometheus at /metrics
+add_metrics_endpoint(app.server)
+# Bulk CSV/Parquet/Arrow downloads at /export
+add_export_endpoint(app.server)
 
 app.layout = html.Div(
     children=[
@@ -116,12 +135,69 @@ app.layout = html.Div(
                     ],
                     className="wrapper",
                 ),
+                # Daily summary section
+                html.Div(
+                    children=[
+                        html.Div(
+                            children=[
+                                html.Div(children="Daily Summary", className="menu-title"),
+                                dcc.Dropdown(
+                                    id="analytics-metric",
+                                    options=[
+                                        {"label": metric, "value": metric}
+                                        for metric in DAILY_METRICS
+                                    ],
+                                    value="Temperature Max",
+                                    clearable=False,
+                                    className="dropdown",
+                                ),
+                            ]
+                        ),
+                        html.Div(
+                            children=dcc.Graph(id="analytics-chart"),
+                            className="card",
+                        ),
+                    ],
+                    className="wrapper",
+                ),
                 # Current Wx section
+                dbc.Container(
+                    children=[
+                        html.Div(children="Station", className="menu-title"),
+                        dcc.Dropdown(
+                            id="station-filter",
+                            options=[{"label": name, "value": name} for name in STATIONS],
+                            value=next(iter(STATIONS)),
+                            clearable=False,
+                            className="dropdown",
+                        ),
+                    ],
+                    className='current-wx-container'
+                ),
                 dbc.Container(
                     id='current-weather',
                     className='current-wx-container'
                 ),
                 dbc.Container(
+                    children=[
+                        html.H3(id='forecast-title', className='current-wx-title'),
+                        # Only the rows in view are drawn, the data is the
+                        # one copy of the forecast the browser gets
+                        dash_table.DataTable(
+                            id='forecast-table',
+                            columns=[{'name': col, 'id': col} for col in FORECAST_COLUMNS],
+                            data=[],
+                            virtualization=True,
+                            fixed_rows={'headers': True},
+                            style_table={'height': '420px', 'overflowY': 'auto'},
+                            style_cell={'minWidth': '110px', 'width': '110px',
+                                'maxWidth': '110px', 'overflow': 'hidden',
+                                'textOverflow': 'ellipsis', 'textAlign': 'left'},
+                            style_header={'fontWeight': 'bold'},
+                            style_data_conditional=[{'if': {'row_index': 'odd'},
+                                'backgroundColor': 'rgb(242, 242, 242)'}]
+                        )
+                    ],
                     id='forecast-wx',
                     className='forecast-wx'
                 ),
@@ -146,38 +222,163 @@ app.layout = html.Div(
                     interval=24*36e5, #update daily, 1 day in ms
                     n_intervals=0
                 ),
-                # The store is the component that holds the updated data
-                dcc.Store(id='uw-data', data=[], storage_type='session'),
-                dcc.Store(id='forecast-data', data=[], storage_type='session'),
+                # Fast start, checks back for data until the scheduler has
+                # loaded every source
+                dcc.Interval(
+                    id='startup-interval',
+                    interval=2e3,
+                    disabled=not UW_FAST_START
+                ),
+                # Live mode polling, off unless UW_LIVE_INTERVAL is set
+                dcc.Interval(
+                    id='live-interval',
+                    interval=max(UW_LIVE_INTERVAL, 1)*1e3,
+                    disabled=not UW_LIVE_INTERVAL
+                ),
+                # The store holds the version of the shared UW data
+                dcc.Store(id='uw-data', data=None, storage_type='session'),
+                # The station and data version the weather panels show
+                dcc.Store(id='wx-version'),
+                # The chart series the browser holds and the range it last
+                # asked the server for
+                dcc.Store(id='chart-data'),
+                dcc.Store(id='chart-range'),
+                # End of the chart data and how far live mode has extended it
+                dcc.Store(id='chart-end'),
+                dcc.Store(id='live-cursor'),
             ]
         )
+# Background ingestion, refreshes every source ahead of demand so callbacks
+# only read snapshots. Intervals are in seconds.
+UW_REFRESH_INTERVAL = 300
+CURRENT_WX_INTERVAL = OPENWEATHER_TTL
+FORECAST_WX_INTERVAL = 1800
+# Shared by the server processes of a multi-worker deployment, see wsgi.py
+UW_SCHEDULER_DIR = os.environ.get('UW_SCHEDULER_DIR')
+SCHEDULER = Scheduler(shared_dir=UW_SCHEDULER_DIR)
+SCHEDULER.add('rooftop', lambda: UW_FRAME_CACHE.refresh(force=True),
+    UW_REFRESH_INTERVAL)
+# Every station is refreshed in one batch per source, current weather with
+# group queries, keeping the last good data of stations that failed
+def refresh_current_wx():
+    current = dict(SCHEDULER.latest('current-wx') or {})
+    current.update(load_current(OPENWEATHER_CLIENT, STATIONS.values(), fresh=True))
+    return current
+
+# Every fetched forecast for the rooftop's city is kept for verification
+FORECAST_ARCHIVE = ForecastArchive()
+
+def refresh_forecast_wx():
+    forecasts = dict(SCHEDULER.latest('forecast-wx') or {})
+    fresh = load_forecasts(OPENWEATHER_CLIENT, STATIONS.values(), fresh=True,
+        current=SCHEDULER.latest('current-wx'))
+    if DEFAULT_STATION.name in fresh:
+        FORECAST_ARCHIVE.append(fresh[DEFAULT_STATION.name], units='imperial')
+    forecasts.update(fresh)
+    return forecasts
+
+SCHEDULER.add('current-wx', refresh_current_wx, CURRENT_WX_INTERVAL)
+SCHEDULER.add('forecast-wx', refresh_forecast_wx, FORECAST_WX_INTERVAL)
+if UW_LIVE_INTERVAL:
+    # the snapshot is the day so far, so every process can extend its charts
+    def poll_live():
+        LIVE_FEED.poll()
+        return LIVE_FEED.since(pd.Timestamp.min)
+    SCHEDULER.add('live', poll_live, UW_LIVE_INTERVAL, backoff=UW_LIVE_INTERVAL)
+
 # Fetch and update the current weather from the Openweather API
 @app.callback(
     [
         Output('current-weather', 'children'),
-        Output('forecast-wx', 'children'),
-        Output('forecast-data', 'data')
+        Output('forecast-title', 'children'),
+        Output('forecast-table', 'data'),
+        Output('wx-version', 'data')
     ],
     [
         Input('interval-component', 'n_intervals'),
-        Input('refresh-data', 'n_clicks')
-    ]
+        Input('refresh-data', 'n_clicks'),
+        Input('startup-interval', 'n_intervals'),
+        Input('station-filter', 'value')
+    ],
+    State('wx-version', 'data')
 )
-def update_wx(num, n_clicks):
-    # Make the API call and load the data
-    api_key = get_api_key()
-    # Build the URL
-    current_wx_URL = (
-            f"{BASE_WEATHER_API_URL}?q=Seattle"
-            f"&units=Imperial&appid={api_key}"
-        )
-    current_data = get_weather_data(current_wx_URL)
+@timed('update_wx')
+def update_wx(num, n_clicks, n_startup, station_name, shown):
+    # Use the station's snapshots kept fresh by the background scheduler.
+    # Before they exist make the API calls through the shared client, repeated
+    # refreshes within Openweather's update interval are served from its cache.
+    # Current and forecast data are fetched together once the coordinates are known
+    station = STATIONS.get(station_name, DEFAULT_STATION)
+    # The snapshots' update times version the panels, each is read together
+    # with its data so a version always names the data it was rendered from
+    current, current_updated = SCHEDULER.snapshot('current-wx')
+    fcast, fcast_updated = SCHEDULER.snapshot('forecast-wx')
+    version = [station.name, current_updated, fcast_updated]
+    if None not in version and version == shown:
+        # the page already shows this data
+        raise PreventUpdate
+    current_data = (current or {}).get(station.name)
+    fcast_data = (fcast or {}).get(station.name)
+    if current_data is None or fcast_data is None:
+        if UW_FAST_START:
+            # don't hold up the page, the startup interval checks back
+            loading = [html.H3(f"{station.name} Current Weather",
+                className='current-wx-title'), html.P("Loading...")]
+            return loading, '', [], None
+        current_data, fcast_data = OPENWEATHER_CLIENT.current_and_forecast(station.query,
+            units='imperial')
+        return make_wx_panels(station.name, current_data, fcast_data) + (None,)
+    # one rendering per station and data version, every session shares it
+    return WX_PANELS.get(tuple(version), make_wx_panels, station.name, current_data,
+        fcast_data) + (version,)
+
+class RenderCache:
+    ''' Renderings shared by every session, keyed by the version of the data
+    they were made from, least recently used dropped first. Unlike lru_cache
+    the data is passed in rather than read again inside, so a rendering is
+    always of the data its key names.
+    '''
+    def __init__(self, size=32):
+        self.size = size
+        self._renders = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, render, *args):
+        ''' Returns the rendering for key, calling render(*args) on a miss. '''
+        with self._lock:
+            value = self._renders.get(key)
+            if value is not None:
+                self._renders.move_to_end(key)
+                return value
+        value = render(*args)
+        with self._lock:
+            self._renders[key] = value
+            while len(self._renders) > self.size:
+                self._renders.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._renders.clear()
+
+# Weather panels by (station, current updated, forecast updated), and daily
+# summary figures by (rollups version, metric)
+WX_PANELS = RenderCache()
+ANALYTICS_FIGURES = RenderCache()
+
+def to_json_ready(value):
+    # Dash's encoder walks component trees in Python on every response, plain
+    # lists and dicts go straight through the C encoder
+    from plotly.io.json import to_json_plotly
+    return json.loads(to_json_plotly(value))
+
+def make_wx_panels(station_name, current_data, fcast_data):
+    # The current weather panel, the forecast table's title and its rows,
+    # already in the form they are sent in
     data = get_current_wx(current_data)
-    # Get the forecast data
-    fcast_data = get_forecast_data(current_data, imperial=True)
     forecast_wx = get_forecast_dataframe(fcast_data)
     # Make the layout to serve
-    current_wx_layout =  [html.H3("Seattle Current Weather", className='current-wx-title'),
+    current_wx_layout =  [html.H3(f"{station_name} Current Weather", className='current-wx-title'),
         html.Div(
             [
                 dbc.Row(
@@ -224,20 +425,17 @@ def update_wx(num, n_clicks):
         )
 
         ]
-# Build the forecast table layout
-    fcast_layout = [
-        html.H3("Seattle 5-Day Forecast (3 Hourly)", className='current-wx-title'),
-        dbc.Table.from_dataframe(forecast_wx,
-            striped=True, bordered=True,
-            hover=True)
-        ]
-    return current_wx_layout, fcast_layout, forecast_wx.to_dict('records')
+    # The forecast table's rows
+    records = forecast_wx.assign(
+        Date=forecast_wx['Date'].dt.strftime('%m/%d/%Y %H:%M')).to_dict('records')
+    return (to_json_ready(current_wx_layout),
+        f"{station_name} 5-Day Forecast (3 Hourly)", to_json_ready(records))
 # # Make and serve the forecast plots
 # @app.callback(
 #     Output('forecast-plots', 'children'),
 #     [
 #         Input('forecast-plots', 'active_tab'),
-#         Input('forecast-data', 'data')
+#         Input('forecast-table', 'data')
 #     ]
 # )
 # def update_forecast_plots(active_tab, data):
@@ -309,12 +507,35 @@ def update_wx(num, n_clicks):
     Output('uw-data', 'data'),
     [
         Input('interval-component', 'n_intervals'),
-        Input('refresh-data', 'n_clicks')
-    ]
+        Input('refresh-data', 'n_clicks'),
+        Input('startup-interval', 'n_intervals')
+    ],
+    State('uw-data', 'data')
+)
+@timed('update_uw_data')
+def update_uw_data(num, n_clicks, n_startup, current):
+    # The frame stays in the shared server-side cache, the browser only gets
+    # its version so the charts update when it changes. With the background
+    # scheduler running the cache is already kept fresh
+    if UW_FAST_START:
+        # whatever is there, the snapshot from the last run or the scheduler's
+        # data, without waiting on a load
+        version = UW_FRAME_CACHE.peek()
+        if version is None or version == current:
+            raise PreventUpdate
+        return version
+    if SCHEDULER.running:
+        return UW_FRAME_CACHE.latest()
+    # without it, reload in the background and show the last good data meanwhile
+    return UW_FRAME_CACHE.revalidate()
+# Stop checking back once the scheduler has loaded every source
+@app.callback(
+    Output('startup-interval', 'disabled'),
+    Input('startup-interval', 'n_intervals')
 )
-def update_uw_data(num, n_clicks):
-    data = load_uw_data()
-    return data.to_dict('records')
+@timed('end_startup')
+def end_startup(num):
+    return all(SCHEDULER.latest(name) is not None for name in SCHEDULER.jobs)
 # Update the datepicker range when data updates
 @app.callback(
     [
@@ -328,86 +549,231 @@ def update_uw_data(num, n_clicks):
         Input('refresh-data', 'n_clicks')
     ]
 )
+@timed('update_date_range')
 def update_date_range(num, n_clicks):
-    THEN = datetime.now() - timedelta(weeks=1)
-    NOW = datetime.now() + timedelta(hours=7)
-    return THEN, NOW, THEN, NOW
+    # The same UTC days update_charts loads by default, so the picker and the
+    # chart data agree on where the range ends
+    dates = get_uw_dates()
+    THEN = dates[0].date()
+    NOW = dates[-1].date()
+    # In long-history mode any day in the store can be picked
+    FIRST = UW_HISTORY.first_time() if UW_HISTORY is not None else None
+    return FIRST or THEN, NOW, THEN, NOW
 
-@app.callback(
+# Browsing dates inside the data the browser already holds is done
+# clientside (assets/charts.js), the server is only asked for a new range
+# when the selection goes past it
+app.clientside_callback(
+    ClientsideFunction(namespace='uw', function_name='request_range'),
+    Output('chart-range', 'data'),
+    [
+        Input("date-range", "start_date"),
+        Input("date-range", "end_date"),
+    ],
+    State('chart-data', 'data')
+)
+app.clientside_callback(
+    ClientsideFunction(namespace='uw', function_name='render_chart'),
     Output("parameter-chart", "figure"),
     [
-        Input('uw-data', 'data'),
-        Input("parameter-filter", "value"),
+        Input('chart-data', 'data'),
         Input("date-range", "start_date"),
         Input("date-range", "end_date"),
     ],
+    State("parameter-chart", "figure")
 )
-def update_charts(data, parameter, start_date, end_date):
-    # Get the right data
-    # Load the data from the memory store
-    data = pd.DataFrame(data)
-    # Convert dates back to datetimes
-    data['Date'] = pd.to_datetime(data['Date'])
-    start_date = pd.to_datetime(start_date)
-    end_date = pd.to_datetime(end_date)
+
+@app.callback(
+    [
+        Output('chart-data', 'data'),
+        Output('chart-end', 'data')
+    ],
+    [
+        Input('uw-data', 'data'),
+        Input("parameter-filter", "value"),
+        Input('chart-range', 'data'),
+    ],
+)
+@timed('update_charts')
+def update_charts(version, parameter, chart_range):
+    # in fast start the chart waits for the first frame instead of loading it
+    if UW_FAST_START and version is None:
+        raise PreventUpdate
+    # Get the right data, the requested range or by default the recent days
+    if chart_range:
+        start_date, end_date = chart_range
+    else:
+        dates = get_uw_dates()
+        start_date, end_date = dates[0], dates[-1]
+    start_date = pd.to_datetime(start_date).normalize()
+    end_date = pd.to_datetime(end_date).normalize()
+    # Read the shared rollups, the Store only holds their version. Pick the
+    # resolution from the selected span so long ranges send fewer points
+    resolution = pick_resolution(start_date, end_date)
+    data = get_uw_range(start_date, end_date, resolution)
+    days = data.index.normalize()
     mask = (
-        (data.Date >= start_date)
-        & (data.Date <= end_date)
+        (days >= start_date)
+        & (days <= end_date)
     )
     filtered_data = data.loc[mask, :]
+    # Thin long raw series before plotting, keeping the peaks
+    filtered_data = downsample(filtered_data, parameter)
+    # Where live updates pick up and at which resolution, only when the
+    # chart reaches today
+    chart_end = None
+    if len(filtered_data) and end_date >= pd.Timestamp(datetime.utcnow()).normalize():
+        chart_end = [filtered_data.index[-1].isoformat(), resolution]
 
-    if parameter == 'Wind Direction':
-        parameter_chart_figure = px.scatter(filtered_data,
-            x='Time',
-            y=f'{parameter}',
-            labels={
-                f"{parameter}" : f"{parameter} ({UNITS_DICT[parameter]})",
-                'Time': 'Time (UTC)'
-            },
-            title = f'{parameter}'
-            )
-        parameter_chart_figure.update_layout(
-            title_font_size=28,
-            title_x = 0.5,
-            hovermode= 'x unified'
-        )
-        parameter_chart_figure.update_traces(marker_color='#7e0ead')
+    return {
+        'figure': make_parameter_figure(filtered_data, parameter),
+        'start': start_date.strftime('%Y-%m-%d'),
+        'end': end_date.strftime('%Y-%m-%d')
+    }, chart_end
 
-    elif parameter == 'Radiation':
-        parameter_chart_figure = px.area(filtered_data,
-            x='Time',
-            y=f'{parameter}',
-            labels={
-                f"{parameter}" : f"{parameter} ({UNITS_DICT[parameter]})",
-                'Time': 'Time (UTC)'
-            },
-            title = f'{parameter}'
-             )
-        parameter_chart_figure.update_layout(
-            title_font_size=28,
-            title_x = 0.5,
-            hovermode= 'x unified'
-        )
-        parameter_chart_figure.update_traces(line_color='#7e0ead')
+# Daily summary chart, from the analytics shipped with the shared rollups
+@app.callback(
+    Output('analytics-chart', 'figure'),
+    [
+        Input('uw-data', 'data'),
+        Input('analytics-metric', 'value')
+    ]
+)
+@timed('update_analytics')
+def update_analytics(version, metric):
+    if UW_FAST_START and version is None:
+        raise PreventUpdate
+    # the frame and its version from one read, the figure is keyed on the
+    # version of the data it is drawn from
+    frame, version = UW_FRAME_CACHE.snapshot()
+    return ANALYTICS_FIGURES.get((version, metric), make_analytics_figure,
+        frame['analytics'], metric)
+
+def make_analytics_figure(summary, metric):
+    x = np.datetime_as_string(summary.index.values, unit='D').tolist()
+    values = lambda col: np.round(summary[col].values.astype(np.float64), 2).tolist()
+    label = f"{metric} ({DAILY_UNITS[metric]})"
+    traces = [{'type': 'bar' if metric == 'Rain' else 'scatter', 'mode': 'markers',
+        'name': 'Daily', 'x': x, 'y': values(metric),
+        'marker': {'color': CHART_COLOR, 'opacity': 0.4}}]
+    for window in ROLLING_WINDOWS:
+        traces.append({'type': 'scatter', 'mode': 'lines', 'x': x,
+            'name': f"{window}-day {'total' if metric == 'Rain' else 'mean'}",
+            'y': values(f'{metric} {window}d')})
+    traces.append({'type': 'scatter', 'mode': 'lines', 'name': 'Day of year baseline',
+        'x': x, 'y': values(f'{metric} Baseline'), 'line': {'dash': 'dash', 'color': 'gray'}})
+    latest = ''
+    if len(summary):
+        anomaly = summary[f'{metric} Anomaly'].iloc[-1]
+        if not np.isnan(anomaly):
+            latest = f" ({x[-1]}: {anomaly:+.1f} from baseline)"
+    return {'data': traces, 'layout': {
+        'title': {'text': f'Daily {metric}{latest}', 'x': 0.5, 'font': {'size': 24}},
+        'xaxis': {'title': {'text': 'Day (UTC)'}},
+        'yaxis': {'title': {'text': label}},
+        'hovermode': 'x unified',
+        'margin': {'t': 60},
+        'uirevision': metric
+    }}
+
+# Live mode, append new rooftop obs to the end of the chart instead of
+# redrawing it
+@app.callback(
+    [
+        Output("parameter-chart", "extendData"),
+        Output('live-cursor', 'data')
+    ],
+    Input('live-interval', 'n_intervals'),
+    [
+        State("parameter-filter", "value"),
+        State('chart-end', 'data'),
+        State('live-cursor', 'data')
+    ]
+)
+@timed('extend_chart')
+def extend_chart(num, parameter, chart_end, cursor):
+    if chart_end is None:
+        raise PreventUpdate
+    # start again from the end of the chart data whenever it is reloaded
+    end, resolution = chart_end
+    base = [end, resolution, parameter]
+    last = pd.Timestamp(cursor['last'] if cursor and cursor['base'] == base else end)
+    today = SCHEDULER.latest('live')
+    if today is None:
+        raise PreventUpdate
+    rule, step = {name: (rule, step) for name, rule, step in ROLLUPS}[resolution]
+    if rule is None:
+        new = prepare_obs(today[today['Time'] > last])
+    else:
+        # the chart points are buckets labelled by their left edge, roll the
+        # live obs up the same way starting after the last bucket drawn, and
+        # only send buckets that are complete
+        step = pd.Timedelta(seconds=step)
+        obs = prepare_obs(today[today['Time'] >= last + step])
+        if not len(obs):
+            raise PreventUpdate
+        new = rollup(obs, rule)
+        new = new[new.index + step <= obs.index[-1]]
+    if not len(new):
+        raise PreventUpdate
+    x = np.datetime_as_string(new.index.values, unit='s').tolist()
+    update = {'x': [x], 'y': [np.round(new[parameter].values.astype(np.float64), 3).tolist()]}
+    return [update, [0]], {'base': base, 'last': x[-1]}
+
+# Chart styling, and the series length from which WebGL traces are used
+CHART_COLOR = '#7e0ead'
+SCATTERGL_POINTS = 1000
 
+@lru_cache(maxsize=None)
+def get_figure_template(parameter):
+    # Build the layout and trace style for a parameter once, every callback
+    # after that only fills in the x/y arrays. plotly.graph_objects is only
+    # imported here, in fast start off the startup path
+    import plotly.graph_objects as go
+    label = f"{parameter} ({UNITS_DICT[parameter]})"
+    if parameter == 'Wind Direction':
+        trace = go.Scatter(mode='markers', marker_color=CHART_COLOR)
+    elif parameter == 'Radiation':
+        trace = go.Scatter(mode='lines', fill='tozeroy', line_color=CHART_COLOR)
     else:
-        parameter_chart_figure = px.line(filtered_data,
-            x='Time',
-            y=f'{parameter}',
-            labels={
-                f"{parameter}" : f"{parameter} ({UNITS_DICT[parameter]})",
-                'Time': 'Time (UTC)'
-            },
-            title = f'{parameter}'
-             )
-        parameter_chart_figure.update_layout(
-            title_font_size=28,
-            title_x = 0.5,
-            hovermode= 'x unified'
-        )
-        parameter_chart_figure.update_traces(line_color='#7e0ead')
+        trace = go.Scatter(mode='lines', line_color=CHART_COLOR)
+    trace.update(hovertemplate=f"Time (UTC)=%{{x}}<br>{label}=%{{y}}<extra></extra>")
+    figure = go.Figure(data=[trace])
+    figure.update_layout(
+        title_text=f'{parameter}',
+        title_font_size=28,
+        title_x = 0.5,
+        hovermode= 'x unified',
+        xaxis_title='Time (UTC)',
+        yaxis_title=label,
+        margin_t=60,
+        # keep the user's zoom when only the data changes
+        uirevision=parameter
+    )
+    return figure.to_plotly_json()
+
+def make_parameter_figure(filtered_data, parameter):
+    # Fill a copy of the cached template with the data, long series go to
+    # WebGL so the browser draws them faster
+    template = get_figure_template(parameter)
+    trace = dict(template['data'][0],
+        # ISO strings up front are much cheaper to encode than a DatetimeIndex
+        x=np.datetime_as_string(filtered_data.index.values, unit='s'),
+        # float32 values would print with spurious digits, the obs have
+        # at most two decimals anyway
+        y=np.round(filtered_data[parameter].values.astype(np.float64), 3).tolist())
+    if len(filtered_data) >= SCATTERGL_POINTS:
+        trace['type'] = 'scattergl'
+    return {'data': [trace], 'layout': template['layout']}
 
-    return parameter_chart_figure
+def warm_figure_templates():
+    # plotly builds its validators on first use, do it before the first chart
+    for parameter in UNITS_DICT:
+        get_figure_template(parameter)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    SCHEDULER.start()
+    if UW_FAST_START:
+        threading.Thread(target=warm_figure_templates, daemon=True).start()
     app.run_server(debug=True)
@@ -0,0 +1,79 @@
+// Clientside callbacks for the parameter chart, see app.py
+
+// Points of the current figure past the end of the held series, for the
+// same parameter (uirevision is the parameter name)
+function live_tail(figure, current) {
+    if (!current || !current.data || !current.data.length || !current.layout
+            || current.layout.uirevision !== figure.layout.uirevision) {
+        return null;
+    }
+    var held = figure.data[0].x;
+    var last = held.length ? held[held.length - 1] : '';
+    var x = [], y = [];
+    for (var i = 0; i < current.data[0].x.length; i++) {
+        if (current.data[0].x[i] > last) {
+            x.push(current.data[0].x[i]);
+            y.push(current.data[0].y[i]);
+        }
+    }
+    return x.length ? {x: x, y: y} : null;
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    uw: {
+        // Ask the server for a new range only when the selected dates go past
+        // the series the browser already holds
+        request_range: function(start_date, end_date, chart_data) {
+            var no_update = window.dash_clientside.no_update;
+            // the first series comes from the server without being asked
+            if (!start_date || !end_date || !chart_data) {
+                return no_update;
+            }
+            var start = start_date.slice(0, 10);
+            var end = end_date.slice(0, 10);
+            if (chart_data.start <= start && end <= chart_data.end) {
+                return no_update;
+            }
+            return [start, end];
+        },
+        // Cut the held series down to the selected dates, times are ISO
+        // strings so they compare in order as plain strings. Points live mode
+        // appended to the current figure after the held series are kept.
+        render_chart: function(chart_data, start_date, end_date, current) {
+            if (!chart_data) {
+                return window.dash_clientside.no_update;
+            }
+            var figure = chart_data.figure;
+            var tail = live_tail(figure, current);
+            if (tail) {
+                figure = Object.assign({}, figure, {
+                    data: [Object.assign({}, figure.data[0], {
+                        x: figure.data[0].x.concat(tail.x),
+                        y: figure.data[0].y.concat(tail.y)
+                    })].concat(figure.data.slice(1))
+                });
+            }
+            if (!start_date || !end_date) {
+                return figure;
+            }
+            var start = start_date.slice(0, 10);
+            var end = new Date(Date.parse(end_date.slice(0, 10)) + 864e5)
+                .toISOString().slice(0, 10);
+            var data = figure.data.map(function(trace) {
+                var x = [], y = [];
+                for (var i = 0; i < trace.x.length; i++) {
+                    if (trace.x[i] >= start && trace.x[i] < end) {
+                        x.push(trace.x[i]);
+                        y.push(trace.y[i]);
+                    }
+                }
+                return Object.assign({}, trace, {x: x, y: y});
+            });
+            // a new selection resets any zoom on the time axis
+            var layout = Object.assign({}, figure.layout, {
+                xaxis: Object.assign({}, figure.layout.xaxis, {uirevision: start + end})
+            });
+            return {data: data, layout: layout};
+        }
+    }
+});
@@ -0,0 +1,1217 @@
+''' Benchmarks for the UW ATG rooftop dashboard.
+
+Everything runs against local stand-ins for the upstream services, so no
+network access or API key is needed.
+
+Usage:
+    python benchmark.py fetch [--days 9] [--latency 0.5] [--max-workers 8]
+    python benchmark.py cache [--latency 0.5]
+    python benchmark.py parse [--days 90]
+    python benchmark.py figure [--sizes 10000 100000 1000000] [--method minmax]
+    python benchmark.py openweather [--viewers 50] [--latency 0.3]
+    python benchmark.py panel [--latency 0.3]
+    python benchmark.py forecast [--sizes 40 4000 400000] [--cities 10]
+    python benchmark.py stations [--counts 1 10 50] [--latency 0.3]
+    python benchmark.py startup [--latency 0.5]
+    python benchmark.py serve [--workers 1 2 4] [--duration 10] [--concurrency 16]
+    python benchmark.py wx [--repeat 200]
+    python benchmark.py analytics [--years 1 5 10] [--interval 60]
+    python benchmark.py verify [--days 30 90]
+    python benchmark.py export [--days 30 90 365] [--formats csv parquet arrow]
+    python benchmark.py outage [--mode hang] [--duration 10] [--threads 8]
+    python benchmark.py memory [--days 7 365]
+    python benchmark.py suite [--days 1 30 365 3650] [--json results.json] [--no-memory]
+
+The suite times every stage of the pipeline on synthetic data and reports
+throughput, peak memory and payload bytes, with --json writing them out for
+comparing commits.
+
+'''
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib import parse
+
+import numpy as np
+import pandas as pd
+
+from downsample import CHART_POINTS, downsample
+from openweather import OpenWeatherClient
+from uw_cache import SharedFrameCache, UWDayCache, UW_DTYPES
+from upstream import http_get
+from uw_wx import (get_forecast_dataframe, get_uw_data, get_uw_dates, get_uw_frame,
+    parse_uw_day, parse_uw_page)
+
+def make_uw_page(date, interval=60, seed=None):
+    ''' Makes a synthetic uw.cgi day page in the same text format as the
+    ATG rooftop station.
+
+    Variables:
+        date = the day of the page
+        interval = seconds between observations
+        seed = random seed, default is derived from the date
+
+    Returns:
+        page = bytes of the page
+
+    '''
+    rng = random.Random(date.toordinal() if seed is None else seed)
+    lines = [
+        '<HTML><BODY><PRE>',
+        'UW ATG Rooftop Weather Station  {}'.format(date.strftime('%Y/%m/%d')),
+        '  Time     RH  Temp  Dir  Speed  Gust  Rain   Rad    Pres',
+        '           %   F     deg  knot   knot  in.    W/m2   hPa',
+        '--------------------------------------------------------',
+    ]
+    temp = rng.randint(35, 60)
+    pressure = rng.uniform(1000, 1030)
+    rain = 0.0
+    for second in range(0, 86400, interval):
+        temp = min(max(temp + rng.choice([-1, 0, 0, 1]), 20), 95)
+        speed = rng.randint(0, 15)
+        pressure += rng.uniform(-0.05, 0.05)
+        if rng.random() < 0.02:
+            rain += 0.01
+        lines.append('{:02d}:{:02d}:{:02d} {:3d} {:4d} {:4d} {:4d} {:4d} {:6.2f} {:6.1f} {:7.1f}'.format(
+            second // 3600, second // 60 % 60, second % 60,
+            rng.randint(30, 100), temp, rng.randint(0, 359), speed,
+            speed + rng.randint(0, 10), rain, max(0.0, rng.gauss(200, 150)),
+            pressure))
+    lines.append('</PRE></BODY></HTML>')
+    return ('\n'.join(lines) + '\n').encode()
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients hanging up mid-response are expected, e.g. the app
+        # bench_startup runs exits without waiting on its requests
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+# Seconds a stand-in in 'hang' mode holds a request before dropping it
+HANG_SECONDS = 60
+
+def _outage(handler, server):
+    ''' Plays an upstream outage when server.outage is set: 'hang' accepts
+    the request and never answers, '5xx' answers 503. Returns True if the
+    request was handled.
+    '''
+    if server.outage == 'hang':
+        time.sleep(HANG_SECONDS)
+        handler.close_connection = True
+        return True
+    if server.outage == '5xx':
+        handler.send_response(503)
+        handler.send_header('Content-Length', '0')
+        handler.end_headers()
+        return True
+    return False
+
+def serve_uw_pages(latency=None, interval=60):
+    ''' Starts a local HTTP stand-in for uw.cgi that serves synthetic day pages.
+
+    Variables:
+        latency = dict of YYYYMMDD -> seconds of delay injected before
+            responding, missing days respond immediately
+        interval = seconds between observations in the served pages
+
+    Returns:
+        server = the running server, call shutdown() when done, see _outage
+            for server.outage
+        url_str = base URL to pass to get_uw_data
+
+    '''
+    latency = latency or {}
+    pages = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if _outage(self, server):
+                return
+            day = self.path.split('?')[-1]
+            time.sleep(latency.get(day, 0))
+            if day not in pages:
+                pages[day] = make_uw_page(datetime.strptime(day, '%Y%m%d'), interval)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(pages[day])))
+            self.end_headers()
+            self.wfile.write(pages[day])
+
+        def log_message(self, *args):
+            pass
+
+    server = _ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.outage = None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url_str = 'http://127.0.0.1:{}/cgi-bin/uw.cgi?'.format(server.server_address[1])
+    return server, url_str
+
+def make_current_payload(city='Seattle', lat=47.6062, lon=-122.3321, dt=None, seed=0):
+    ''' Makes a synthetic Openweather current weather response. '''
+    rng = random.Random(seed)
+    dt = int(time.time()) if dt is None else dt
+    return {
+        'coord': {'lon': lon, 'lat': lat},
+        'weather': [{'id': 500, 'main': 'Rain', 'description': 'light rain', 'icon': '10d'}],
+        'main': {'temp': rng.uniform(35, 80), 'pressure': rng.randint(990, 1030),
+            'humidity': rng.randint(30, 100)},
+        'wind': {'speed': rng.uniform(0, 20), 'deg': rng.randint(0, 359)},
+        'clouds': {'all': rng.randint(0, 100)},
+        'dt': dt,
+        'sys': {'sunrise': dt - 6 * 3600, 'sunset': dt + 6 * 3600},
+        'name': city,
+        'cod': 200
+    }
+
+def make_forecast_payload(n=40, lat=47.6062, lon=-122.3321, start=None, seed=0):
+    ''' Makes a synthetic Openweather 3 hourly forecast response with n steps. '''
+    rng = random.Random(seed)
+    start = int(time.time()) // 10800 * 10800 if start is None else start
+    steps = []
+    for i in range(n):
+        dt = start + i * 10800
+        temp = rng.uniform(35, 80)
+        steps.append({
+            'dt': dt,
+            'main': {'temp': temp, 'temp_min': temp - 2, 'temp_max': temp + 2,
+                'pressure': rng.randint(990, 1030), 'humidity': rng.randint(30, 100)},
+            'weather': [{'id': 500, 'main': 'Rain', 'description': 'light rain'}],
+            'clouds': {'all': rng.randint(0, 100)},
+            'wind': {'speed': rng.uniform(0, 20), 'deg': rng.randint(0, 359),
+                'gust': rng.uniform(0, 30)},
+            'pop': round(rng.random(), 2),
+            'dt_txt': datetime.utcfromtimestamp(dt).strftime('%Y-%m-%d %H:%M:%S')
+        })
+    return {'cod': '200', 'cnt': n, 'list': steps,
+        'city': {'name': 'Seattle', 'coord': {'lat': lat, 'lon': lon}}}
+
+def serve_openweather(latency=0.0, forecast_steps=40):
+    ''' Starts a local HTTP stand-in for the Openweather weather, group and
+    forecast endpoints.
+
+    Variables:
+        latency = seconds of delay injected before every response
+        forecast_steps = number of steps in forecast responses
+
+    Returns:
+        server = the running server, server.hits counts requests per endpoint,
+            see _outage for server.outage
+        base_url = base URL to pass to OpenWeatherClient
+
+    '''
+    current = json.dumps(make_current_payload()).encode()
+    forecast = json.dumps(make_forecast_payload(forecast_steps)).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            endpoint = self.path.split('?')[0].rsplit('/', 1)[-1]
+            with lock:
+                server.hits[endpoint] = server.hits.get(endpoint, 0) + 1
+            if _outage(self, server):
+                return
+            time.sleep(latency)
+            body = {'weather': current, 'forecast': forecast}.get(endpoint)
+            if endpoint == 'group':
+                ids = parse.parse_qs(parse.urlsplit(self.path).query)['id'][0].split(',')
+                body = json.dumps({'cnt': len(ids), 'list': [dict(make_current_payload(),
+                    id=int(city_id)) for city_id in ids]}).encode()
+            self.send_response(200 if body else 404)
+            body = body or b'{}'
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    lock = threading.Lock()
+    server = _ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.hits = {}
+    server.outage = None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = 'http://127.0.0.1:{}/data/2.5'.format(server.server_address[1])
+    return server, base_url
+
+def bench_fetch(days=9, latency=0.5, max_workers=8):
+    ''' Times get_uw_data sequentially and concurrently against a stub that
+    delays each day by a random amount up to `latency` seconds.
+
+    Concurrent wall-clock time should track the slowest day, sequential time
+    the sum of all days.
+    '''
+    dates = pd.date_range(end=datetime.now(), periods=days)
+    rng = random.Random(0)
+    delays = {d: rng.uniform(latency / 4, latency) for d in dates.strftime('%Y%m%d')}
+    server, url_str = serve_uw_pages(delays)
+    try:
+        results = {}
+        for workers in (1, max_workers):
+            tic = time.perf_counter()
+            records = list(get_uw_data(dates, url_str=url_str, max_workers=workers))
+            results[workers] = time.perf_counter() - tic
+            times = [r['Time'] for r in records]
+            assert times == sorted(times), 'records out of time order'
+    finally:
+        server.shutdown()
+    print('days={} records={}'.format(days, len(records)))
+    print('sum of delays  {:.3f}s'.format(sum(delays.values())))
+    print('max delay      {:.3f}s'.format(max(delays.values())))
+    print('sequential     {:.3f}s'.format(results[1]))
+    print('concurrent({}) {:.3f}s'.format(max_workers, results[max_workers]))
+
+def bench_cache(latency=0.5):
+    ''' Times a cold load of the past week against a warm one served from the
+    on-disk day cache, where only the unfinished days are fetched.
+    '''
+    dates = get_uw_dates()
+    server, url_str = serve_uw_pages({d: latency for d in dates.strftime('%Y%m%d')})
+    fetched = []
+    def fetch(days):
+        fetched.append(len(days))
+        return get_uw_frame(days, url_str=url_str)
+    cache = UWDayCache(tempfile.mkdtemp())
+    try:
+        for label in ('cold', 'warm'):
+            tic = time.perf_counter()
+            df = cache.load(dates, fetch)
+            print('{} load  {:.3f}s  days fetched={} rows={}'.format(
+                label, time.perf_counter() - tic, fetched[-1], len(df)))
+    finally:
+        server.shutdown()
+        cache.invalidate()
+
+def bench_parse(days=90):
+    ''' Times the per-record generator parser against the bulk parser on a
+    synthetic corpus of `days` uw.cgi pages, building the same dataframe.
+    '''
+    dates = pd.date_range(end=datetime.now(), periods=days)
+    pages = [make_uw_page(date).splitlines() for date in dates]
+    nbytes = sum(len(line) + 1 for page in pages for line in page)
+
+    tic = time.perf_counter()
+    records = pd.DataFrame([r for date, page in zip(dates, pages)
+        for r in parse_uw_day(page, date)])
+    generator = time.perf_counter() - tic
+
+    tic = time.perf_counter()
+    bulk = pd.concat([parse_uw_page(page, date) for date, page in zip(dates, pages)],
+        ignore_index=True)
+    vectorized = time.perf_counter() - tic
+
+    # the bulk parser goes straight to the narrow dtypes
+    assert records.astype(UW_DTYPES).equals(bulk), 'bulk parser disagrees with parse_uw_day'
+    print('days={} rows={} MB={:.1f}'.format(days, len(bulk), nbytes / 2**20))
+    print('generator  {:.3f}s  {:,.0f} rows/s'.format(generator, len(bulk) / generator))
+    print('bulk       {:.3f}s  {:,.0f} rows/s'.format(vectorized, len(bulk) / vectorized))
+    print('speedup    {:.1f}x'.format(generator / vectorized))
+
+def _legacy_forecast_dataframe(forecast_wx):
+    # get_forecast_dataframe before the single-pass decoder, one pass over the
+    # list per field and the dates formatted as strings
+    dts = pd.to_datetime([date['dt_txt'] for date in forecast_wx['list']])
+    dts = dts.strftime('%m/%d/%Y %H:%M')
+    temperature = np.round([date['main']['temp'] for date in forecast_wx['list']])
+    temp_min = [date['main']['temp_min'] for date in forecast_wx['list']]
+    temp_max = [date['main']['temp_max'] for date in forecast_wx['list']]
+    pressure = [date['main']['pressure'] for date in forecast_wx['list']]
+    humidity = [date['main']['humidity'] for date in forecast_wx['list']]
+    weather = [date['weather'][0]['main'] for date in forecast_wx['list']]
+    weather_description = [date['weather'][0]['description'] for date in forecast_wx['list']]
+    clouds = [date['clouds']['all'] for date in forecast_wx['list']]
+    wind_speed = np.round([date['wind']['speed'] for date in forecast_wx['list']])
+    wind_direction = [date['wind']['deg'] for date in forecast_wx['list']]
+    wind_gust = np.round([date['wind']['gust'] for date in forecast_wx['list']])
+    pop = [date['pop'] for date in forecast_wx['list']]
+    return pd.DataFrame({'Date': dts, 'Temperature': temperature, 'Pressure': pressure,
+        'Relative Humidity': humidity, 'Weather Description': weather_description,
+        'Wind Speed': wind_speed, 'Wind Direction': wind_direction, 'Pop': pop})
+
+def bench_forecast(sizes=(40, 4000, 400000), cities=10, repeat=5):
+    ''' Times the old per-field forecast decoding against get_forecast_dataframe
+    on synthetic forecasts of each size, and a batch of `cities` forecasts.
+    '''
+    def best(func):
+        times = []
+        for _ in range(repeat):
+            tic = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - tic)
+        return min(times)
+
+    for n in sizes:
+        payload = make_forecast_payload(n)
+        old = _legacy_forecast_dataframe(payload)
+        new = get_forecast_dataframe(payload)
+        assert (old['Date'] == new['Date'].dt.strftime('%m/%d/%Y %H:%M')).all()
+        assert old.drop(columns='Date').equals(new.drop(columns='Date'))
+        legacy = best(lambda: _legacy_forecast_dataframe(payload))
+        decoder = best(lambda: get_forecast_dataframe(payload))
+        print('steps={:<8} legacy {:.4f}s  decoder {:.4f}s  speedup {:.1f}x'.format(
+            n, legacy, decoder, legacy / decoder))
+
+    batch = [make_forecast_payload(40, seed=i) for i in range(cities)]
+    for i, payload in enumerate(batch):
+        payload['city']['name'] = 'City {}'.format(i)
+    legacy = best(lambda: [_legacy_forecast_dataframe(payload) for payload in batch])
+    decoder = best(lambda: get_forecast_dataframe(batch))
+    print('cities={:<7} legacy {:.4f}s  decoder {:.4f}s  speedup {:.1f}x'.format(
+        cities, legacy, decoder, legacy / decoder))
+
+def make_series(n, parameter='Gust', seed=0):
+    ''' Makes a synthetic one-minute rooftop series of n points with a few
+    isolated spikes, indexed by Time like the rollups.
+    '''
+    rng = np.random.RandomState(seed)
+    time = pd.date_range(end=datetime.now().replace(second=0, microsecond=0),
+        periods=n, freq='1min')
+    values = np.clip(rng.normal(10, 3, n), 0, None)
+    values[rng.randint(0, n, 10)] += 40
+    return pd.DataFrame({parameter: values.astype(np.float32)},
+        index=pd.Index(time, name='Time'))
+
+def _px_figure(data, parameter):
+    # the plotly.express path update_charts used before the cached templates
+    import plotly.express as px
+    figure = px.line(data, x=data.index, y=parameter, title=parameter)
+    figure.update_layout(title_font_size=28, title_x=0.5, hovermode='x unified')
+    figure.update_traces(line_color='#7e0ead')
+    return figure
+
+def bench_figure(sizes=(10000, 100000, 1000000), method='minmax', parameter='Gust'):
+    ''' Compares building the parameter chart from the raw series and from
+    the downsampled one: callback time (downsample + figure + JSON) and the
+    size of the figure JSON sent to the browser. The px rows are the old
+    plotly.express figure path on the downsampled series.
+    '''
+    from plotly.utils import PlotlyJSONEncoder
+    from app import make_parameter_figure
+    print('{:>9} {:>6} {:>9} {:>12} {:>6}'.format('points', 'mode', 'seconds', 'json bytes', 'peak'))
+    for n in sizes:
+        df = make_series(n, parameter)
+        for mode in ('raw', 'px', method):
+            tic = time.perf_counter()
+            data = df if mode == 'raw' else downsample(df, parameter, CHART_POINTS, method)
+            build = _px_figure if mode == 'px' else make_parameter_figure
+            # serialize the way Dash does for the callback response
+            payload = json.dumps(build(data, parameter), cls=PlotlyJSONEncoder)
+            seconds = time.perf_counter() - tic
+            kept_peak = data[parameter].max() == df[parameter].max()
+            print('{:>9} {:>6} {:>9.3f} {:>12,} {:>6}'.format(n, mode, seconds,
+                len(payload), 'kept' if kept_peak else 'lost'))
+
+def bench_openweather(viewers=50, latency=0.3):
+    ''' Simulates `viewers` sessions hitting Refresh at once. Plain GETs,
+    the path before the shared client, send one request per viewer, the
+    client sends one request in total and answers the rest from the
+    in-flight request.
+    '''
+    server, base_url = serve_openweather(latency)
+    url = base_url + '/weather?q=Seattle&units=imperial&appid=x'
+    client = OpenWeatherClient('x', base_url=base_url)
+    try:
+        for label, call in (('direct', lambda: http_get(url, 5, 10)),
+                ('client', lambda: client.current('Seattle'))):
+            server.hits.clear()
+            threads = [threading.Thread(target=call) for _ in range(viewers)]
+            tic = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            print('{:8} viewers={} upstream requests={} {:.3f}s'.format(label,
+                viewers, server.hits.get('weather', 0), time.perf_counter() - tic))
+    finally:
+        server.shutdown()
+
+def bench_panel(latency=0.3, repeat=3):
+    ''' Times fetching the Current Weather panel data, current conditions
+    then the forecast one after another against both at once with cached
+    coordinates. The response cache is off so every call hits the stub.
+    '''
+    server, base_url = serve_openweather(latency)
+    client = OpenWeatherClient('x', base_url=base_url, ttl=0)
+    def sequential():
+        current = client.current('Seattle')
+        return current, client.forecast(current['coord']['lat'], current['coord']['lon'])
+    try:
+        client.coordinates('Seattle')
+        for label, call in (('sequential', sequential),
+                ('concurrent', lambda: client.current_and_forecast('Seattle'))):
+            tic = time.perf_counter()
+            for _ in range(repeat):
+                call()
+            print('{:10} {:.3f}s per panel (stub latency {}s)'.format(label,
+                (time.perf_counter() - tic) / repeat, latency))
+    finally:
+        server.shutdown()
+
+def bench_stations(counts=(1, 10, 50), latency=0.3, rate_limit=None):
+    ''' Times refreshing current weather and forecasts for many stations,
+    one station after another against the batched loaders (group queries and
+    concurrent forecasts). The response cache is off so every call hits the
+    stub.
+    '''
+    from stations import Station, load_current, load_forecasts
+    server, base_url = serve_openweather(latency)
+    client = OpenWeatherClient('x', base_url=base_url, ttl=0, rate_limit=rate_limit)
+    def sequential(stations):
+        for station in stations:
+            current = client.current(station.query)
+            client.forecast(current['coord']['lat'], current['coord']['lon'])
+    def batched(stations):
+        load_forecasts(client, stations, current=load_current(client, stations))
+    try:
+        for n in counts:
+            stations = [Station('City {}'.format(i), city_id=1000 + i, lat=40 + i / 100,
+                lon=-120.0) for i in range(n)]
+            for label, call in (('sequential', sequential), ('batched', batched)):
+                server.hits.clear()
+                tic = time.perf_counter()
+                call(stations)
+                print('stations={:<4} {:10} {:.3f}s  requests={}'.format(n, label,
+                    time.perf_counter() - tic, sum(server.hits.values())))
+    finally:
+        server.shutdown()
+
+# Inputs of the dashboard's callbacks as the page has them on first render
+CALLBACK_VALUES = {'station-filter': 'Seattle', 'parameter-filter': 'Temperature',
+    'interval-component': 0, 'refresh-data': 0}
+
+def callback_request(dash_app, key, values):
+    ''' The JSON body the browser posts to /_dash-update-component for the
+    callback with output `key`, component values by id in values.
+    '''
+    callback = dash_app.callback_map[key]
+    spec = lambda d: dict(d, value=values.get(d['id']))
+    output = callback['output']
+    if isinstance(output, list):
+        outputs = [{'id': o.component_id, 'property': o.component_property} for o in output]
+    else:
+        outputs = {'id': output.component_id, 'property': output.component_property}
+    return {'output': key, 'outputs': outputs, 'inputs': [spec(d) for d in callback['inputs']],
+        'state': [spec(d) for d in callback['state']], 'changedPropIds': []}
+
+# Output key of the weather panels callback
+WX_OUTPUTS = ('..current-weather.children...forecast-title.children'
+    '...forecast-table.data...wx-version.data..')
+
+# Run in a fresh interpreter by bench_startup, prints the timings as JSON
+STARTUP_SCRIPT = r'''
+import json, os, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+app.SCHEDULER.start()
+if app.UW_FAST_START:
+    import threading
+    threading.Thread(target=app.warm_figure_templates, daemon=True).start()
+from benchmark import CALLBACK_VALUES, WX_OUTPUTS, callback_request
+client = app.app.server.test_client()
+
+def post(key, **extra):
+    response = client.post('/_dash-update-component',
+        json=callback_request(app.app, key, dict(CALLBACK_VALUES, **extra)))
+    return response.get_json() if response.status_code == 200 else None
+
+client.get('/')
+first_byte = time.perf_counter() - start
+panel = post(WX_OUTPUTS)
+post('..date-range.min_date_allowed...date-range.max_date_allowed'
+    '...date-range.start_date...date-range.end_date..')
+version = post('uw-data.data')
+chart = post('..chart-data.data...chart-end.data..',
+    **{'uw-data': version and version['response']['uw-data']['data']})
+first_render = time.perf_counter() - start
+# then poll like the startup interval until the chart has data
+while chart is None:
+    time.sleep(0.05)
+    version = post('uw-data.data')
+    if version is not None:
+        chart = post('..chart-data.data...chart-end.data..',
+            **{'uw-data': version['response']['uw-data']['data']})
+data_ready = time.perf_counter() - start
+print(json.dumps({'import_s': imported, 'first_byte_s': first_byte,
+    'first_render_s': first_render, 'data_ready_s': data_ready}))
+sys.stdout.flush()
+# don't wait on scheduler jobs still running
+os._exit(0)
+'''
+
+def bench_startup(latency=0.5):
+    ''' Starts the dashboard in a fresh interpreter against the local
+    uw.cgi and Openweather stand-ins and reports the import time, the time to
+    the first byte of the page, to the first render (the page and the
+    callbacks it fires on load) and until the chart has data. Runs with fast
+    start off and on, each with a cold and then a warm cache dir.
+    '''
+    import os
+    dates = get_uw_dates()
+    uw_server, url_str = serve_uw_pages({d.strftime('%Y%m%d'): latency for d in dates})
+    ow_server, base_url = serve_openweather(latency)
+    root = os.path.dirname(os.path.abspath(__file__))
+    print('{:>14} {:>9} {:>11} {:>13} {:>11}'.format('mode', 'import', 'first byte',
+        'first render', 'data ready'))
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, 'secrets.ini'), 'w') as f:
+                f.write('[openweather]\napi_key=x\n')
+            for fast in ('0', '1'):
+                cache_dir = os.path.join(tmp, 'cache' + fast)
+                for run in ('cold', 'warm'):
+                    env = dict(os.environ, UW_FAST_START=fast, UW_CACHE_DIR=cache_dir,
+                        UW_DATA_URL=url_str, OPENWEATHER_API_URL=base_url,
+                        PYTHONPATH=root)
+                    out = subprocess.check_output([sys.executable, '-c', STARTUP_SCRIPT],
+                        cwd=tmp, env=env)
+                    r = json.loads(out.decode().strip().splitlines()[-1])
+                    print('{:>14} {import_s:>8.2f}s {first_byte_s:>10.2f}s '
+                        '{first_render_s:>12.2f}s {data_ready_s:>10.2f}s'.format(
+                        ('fast ' if fast == '1' else 'default ') + run, **r))
+    finally:
+        uw_server.shutdown()
+        ow_server.shutdown()
+
+# Run in a fresh interpreter by bench_wx, prints the timings as JSON
+WX_SCRIPT = r'''
+import json, os, sys, time
+import app
+from benchmark import (CALLBACK_VALUES, WX_OUTPUTS, _legacy_wx_panels, callback_request)
+from plotly.io.json import to_json_plotly
+app.SCHEDULER.start()
+while app.SCHEDULER.latest('current-wx') is None or app.SCHEDULER.latest('forecast-wx') is None:
+    time.sleep(0.05)
+client = app.app.server.test_client()
+repeat = int(sys.argv[1])
+
+def post(**extra):
+    response = client.post('/_dash-update-component',
+        json=callback_request(app.app, WX_OUTPUTS, dict(CALLBACK_VALUES, **extra)))
+    return response
+
+def timed(call):
+    tic = time.perf_counter()
+    for _ in range(repeat):
+        result = call()
+    return (time.perf_counter() - tic) / repeat, result
+
+current = app.SCHEDULER.latest('current-wx')['Seattle']
+forecast = app.SCHEDULER.latest('forecast-wx')['Seattle']
+results = {}
+seconds, body = timed(lambda: to_json_plotly(_legacy_wx_panels('Seattle', current, forecast)))
+results['legacy'] = (seconds, len(body))
+seconds, response = timed(lambda: (app.WX_PANELS.clear(), post())[1])
+results['render'] = (seconds, len(response.data))
+version = response.get_json()['response']['wx-version']['data']
+seconds, response = timed(post)
+results['cached'] = (seconds, len(response.data))
+seconds, response = timed(lambda: post(**{'wx-version': version}))
+results['unchanged'] = (seconds, len(response.data))
+print(json.dumps(results))
+sys.stdout.flush()
+os._exit(0)
+'''
+
+def _legacy_wx_panels(station_name, current_data, fcast_data):
+    # the weather panels as update_wx built them before they were cached:
+    # a component per table cell and a second copy of the rows for a Store
+    import dash_bootstrap_components as dbc
+    from dash import html
+    from uw_wx import get_current_wx
+    data = get_current_wx(current_data)
+    forecast_wx = get_forecast_dataframe(fcast_data)
+    rows = lambda names, values: html.Div([dbc.Row([dbc.Col(n) for n in names]),
+        dbc.Row([dbc.Col(v) for v in values])])
+    current = [html.H3(f"{station_name} Current Weather"),
+        rows(['Date/Time', 'Sunrise/Sunset', 'Weather'], [f"{data['date']}|{data['time']}",
+            f"{data['Sunrise']}/{data['Sunset']}", f"{data['wx']}"]),
+        html.Br(),
+        rows(['Temperature', 'Pressure', 'Wind Speed/Direction', 'Relative Humidity'],
+            [f"{data['temperature']}", f"{data['pressure']} hPa",
+            f"{data['wind speed']} mph/{data['wind dir']}", f"{data['humidity']}%"])]
+    forecast = [html.H3(f"{station_name} 5-Day Forecast (3 Hourly)"),
+        dbc.Table.from_dataframe(forecast_wx.assign(
+            Date=forecast_wx['Date'].dt.strftime('%m/%d/%Y %H:%M')),
+            striped=True, bordered=True, hover=True)]
+    return current, forecast, forecast_wx.to_dict('records')
+
+def bench_wx(repeat=200):
+    ''' Times the weather panels callback in a fresh dashboard against the
+    Openweather stand-in: building the panels the old way, a render for new
+    data, a cached render for another session and a tick with unchanged
+    data, with the bytes each puts on the wire.
+    '''
+    import os
+    uw_server, url_str = serve_uw_pages({d.strftime('%Y%m%d'): 0 for d in get_uw_dates()})
+    ow_server, base_url = serve_openweather(0)
+    root = os.path.dirname(os.path.abspath(__file__))
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, 'secrets.ini'), 'w') as f:
+                f.write('[openweather]\napi_key=x\n')
+            env = dict(os.environ, UW_CACHE_DIR=os.path.join(tmp, 'cache'),
+                UW_DATA_URL=url_str, OPENWEATHER_API_URL=base_url, PYTHONPATH=root)
+            out = subprocess.check_output([sys.executable, '-c', WX_SCRIPT, str(repeat)],
+                cwd=tmp, env=env)
+    finally:
+        uw_server.shutdown()
+        ow_server.shutdown()
+    results = json.loads(out.decode().strip().splitlines()[-1])
+    print('{:>10} {:>10} {:>8}'.format('', 'per call', 'bytes'))
+    for label, (seconds, size) in results.items():
+        print('{:>10} {:>8.2f}ms {:>8,}'.format(label, seconds * 1e3, size))
+
+def _worker_pss(master):
+    # proportional set size of a gunicorn master's workers in bytes, shared
+    # pages count once across them, None off Linux
+    try:
+        with open('/proc/{0}/task/{0}/children'.format(master)) as f:
+            pids = f.read().split()
+        total = 0
+        for pid in pids:
+            with open('/proc/{}/smaps_rollup'.format(pid)) as f:
+                total += sum(int(line.split()[1]) * 1024 for line in f
+                    if line.startswith('Pss:'))
+        return total
+    except OSError:
+        return None
+
+def bench_serve(workers=(1, 2, 4), duration=10, concurrency=16, latency=0.2):
+    ''' Load test of wsgi.py under gunicorn against the local uw.cgi and
+    Openweather stand-ins. For each worker count, `concurrency` clients post
+    the chart callback (rotating the parameter) for `duration` seconds, and
+    requests per second, latency and the workers' memory are reported.
+    '''
+    import http.client
+    import os
+    import signal
+    import socket
+    from app import app as dash_app
+    from app import UNITS_DICT
+    dates = get_uw_dates()
+    uw_server, url_str = serve_uw_pages({d.strftime('%Y%m%d'): latency for d in dates})
+    ow_server, base_url = serve_openweather(latency)
+    root = os.path.dirname(os.path.abspath(__file__))
+    chart = '..chart-data.data...chart-end.data..'
+    print('{:>7} {:>8} {:>8} {:>8} {:>11}'.format('workers', 'req/s', 'p50 ms',
+        'p95 ms', 'PSS MB'))
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, 'secrets.ini'), 'w') as f:
+                f.write('[openweather]\napi_key=x\n')
+            for n in workers:
+                with socket.socket() as sock:
+                    sock.bind(('127.0.0.1', 0))
+                    port = sock.getsockname()[1]
+                env = dict(os.environ, UW_CACHE_DIR=os.path.join(tmp, 'cache{}'.format(n)),
+                    UW_DATA_URL=url_str, OPENWEATHER_API_URL=base_url)
+                server = subprocess.Popen([sys.executable, '-m', 'gunicorn',
+                    '--workers', str(n), '--bind', '127.0.0.1:{}'.format(port),
+                    '--pythonpath', root, '--log-level', 'warning', 'wsgi:server'],
+                    cwd=tmp, env=env)
+
+                def post(conn, key, values):
+                    body = json.dumps(callback_request(dash_app, key, values))
+                    conn.request('POST', '/_dash-update-component', body,
+                        {'Content-Type': 'application/json'})
+                    response = conn.getresponse()
+                    return response.status, response.read()
+
+                try:
+                    # wait for the leader's first rooftop frame
+                    version = None
+                    deadline = time.monotonic() + 60
+                    while version is None and time.monotonic() < deadline:
+                        try:
+                            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+                            status, body = post(conn, 'uw-data.data', CALLBACK_VALUES)
+                            if status == 200:
+                                version = json.loads(body)['response']['uw-data']['data']
+                        except (OSError, http.client.HTTPException):
+                            pass
+                        time.sleep(0.2)
+                    if version is None:
+                        raise RuntimeError('gunicorn with {} workers never served data'.format(n))
+
+                    latencies = []
+                    stop = time.monotonic() + duration
+                    def client():
+                        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                        parameters = list(UNITS_DICT)
+                        done = []
+                        while time.monotonic() < stop:
+                            values = dict(CALLBACK_VALUES, **{'uw-data': version,
+                                'parameter-filter': parameters[len(done) % len(parameters)]})
+                            tic = time.perf_counter()
+                            try:
+                                status, _ = post(conn, chart, values)
+                            except (OSError, http.client.HTTPException):
+                                conn.close()
+                                continue
+                            if status == 200:
+                                done.append(time.perf_counter() - tic)
+                        latencies.extend(done)
+                    threads = [threading.Thread(target=client)
+                        for i in range(concurrency)]
+                    for t in threads:
+                        t.start()
+                    for t in threads:
+                        t.join()
+                    pss = _worker_pss(server.pid)
+                    latencies = np.array(latencies) * 1e3
+                    print('{:>7} {:>8.1f} {:>8.1f} {:>8.1f} {:>11}'.format(n,
+                        len(latencies) / duration, np.percentile(latencies, 50),
+                        np.percentile(latencies, 95),
+                        '-' if pss is None else '{:.1f}'.format(pss / 2**20)))
+                finally:
+                    server.send_signal(signal.SIGTERM)
+                    server.wait()
+    finally:
+        uw_server.shutdown()
+        ow_server.shutdown()
+
+def make_obs(days, interval=60, seed=0):
+    ''' Makes `days` of synthetic raw rooftop obs ending yesterday directly as
+    a dataframe, with a seasonal and daily cycle, for inputs too large to go
+    through uw.cgi pages.
+    '''
+    rng = np.random.RandomState(seed)
+    end = pd.Timestamp(datetime.utcnow()).normalize()
+    time = pd.date_range(end=end - pd.Timedelta(seconds=interval),
+        periods=days * 86400 // interval, freq='{}s'.format(interval))
+    n = len(time)
+    doy = time.dayofyear.values
+    hour = time.hour.values + time.minute.values / 60
+    daily = np.sin(2 * np.pi * (hour - 9) / 24)
+    temp = 52 - 12 * np.cos(2 * np.pi * (doy - 15) / 365) + 8 * daily + rng.normal(0, 2, n)
+    rain = np.where(rng.rand(n) < 0.01, 0.01, 0)
+    return pd.DataFrame({
+        'Time': time.values,
+        'Relative Humidity': np.clip(70 - 15 * daily + rng.normal(0, 5, n), 0, 100),
+        'Temperature': np.round(temp),
+        'Wind Direction': rng.randint(0, 360, n),
+        'Wind Speed': np.abs(rng.normal(6, 3, n)).round(),
+        'Gust': np.abs(rng.normal(10, 4, n)).round(),
+        'Rain': rain,
+        'Radiation': np.clip(800 * daily, 0, None),
+        'Pressure': 1015 + rng.normal(0, 5, n)
+    }).astype(UW_DTYPES)
+
+def bench_analytics(years=(1, 5, 10), interval=60):
+    ''' Times the daily analytics on multi-year synthetic obs: building the
+    summary from scratch against updating it with one more week, the way
+    every refresh does.
+    '''
+    from analytics import DailyAnalytics
+    print('{:>5} {:>11} {:>9} {:>13} {:>13}'.format('years', 'rows', 'days', 'full build',
+        'weekly update'))
+    for n in years:
+        obs = make_obs(n * 365, interval)
+        week = obs['Time'] >= obs['Time'].iloc[-1] - pd.Timedelta(days=7)
+        engine = DailyAnalytics()
+        tic = time.perf_counter()
+        summary = engine.update(obs[~week])
+        full = time.perf_counter() - tic
+        tic = time.perf_counter()
+        summary = engine.update(obs[week])
+        update = time.perf_counter() - tic
+        print('{:>5} {:>11,} {:>9,} {:>12.3f}s {:>12.4f}s'.format(n, len(obs), len(summary),
+            full, update))
+
+def bench_verify(days=(30, 90), issues_per_day=48):
+    ''' Times archiving and verifying months of synthetic forecasts, fetched
+    `issues_per_day` times a day, against synthetic rooftop obs. The as-of
+    join is compared with matching each step by scanning the obs, timed on
+    a sample and scaled up.
+    '''
+    from rollups import compute_rollups
+    from verification import ForecastArchive, verify
+    print('{:>5} {:>9} {:>9} {:>9} {:>9} {:>12}'.format('days', 'steps', 'append',
+        'query', 'verify', 'nested loop'))
+    for n in days:
+        obs = compute_rollups(make_obs(n + 5, interval=300))['10min']
+        start = obs.index[0]
+        step = 86400 // issues_per_day
+        with tempfile.TemporaryDirectory() as tmp:
+            archive = ForecastArchive(tmp)
+            payloads = []
+            for i in range(n * issues_per_day):
+                issued = start + pd.Timedelta(seconds=i * step)
+                payloads.append((issued, make_forecast_payload(40,
+                    start=int(issued.timestamp()) // 10800 * 10800 + 10800, seed=i)))
+            tic = time.perf_counter()
+            for issued, payload in payloads:
+                archive.append(payload, issued=issued)
+            append = time.perf_counter() - tic
+            tic = time.perf_counter()
+            forecasts = archive.query(start, obs.index[-1])
+            query = time.perf_counter() - tic
+            tic = time.perf_counter()
+            verify(forecasts, obs)
+            joined = time.perf_counter() - tic
+
+            sample = forecasts.iloc[:500]
+            times = obs.index.values
+            tic = time.perf_counter()
+            for valid in sample['Valid'].values:
+                # nearest observation by looking at every one of them
+                best = None
+                for j, t in enumerate(times):
+                    if best is None or abs(t - valid) < abs(times[best] - valid):
+                        best = j
+            nested = (time.perf_counter() - tic) * len(forecasts) / len(sample)
+            print('{:>5} {:>9,} {:>8.2f}s {:>8.3f}s {:>8.3f}s {:>11.0f}s'.format(n,
+                len(forecasts), append, query, joined, nested))
+
+def bench_export(days=(30, 90, 365), formats=('csv', 'parquet', 'arrow')):
+    ''' Streams growing ranges of raw rooftop obs out of /export, from a
+    synthetic history store plus a week of shared rollups, and reports the
+    peak memory while the response is read next to building the whole range
+    as one dataframe first. The streamed peak should stay flat as the range
+    grows.
+    '''
+    from flask import Flask
+    from export import add_export_endpoint
+    from history import HistoryStore
+    from rollups import compute_rollups
+    print('{:>5} {:>8} {:>9} {:>12} {:>11} {:>14}'.format('days', 'format', 'time',
+        'bytes', 'peak', 'materialized'))
+    obs = make_obs(max(days) + 7)
+    recent_start = obs['Time'].iloc[-1].normalize() - pd.Timedelta(days=6)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(tmp)
+        store.append(obs[obs['Time'] < recent_start])
+        frames = SharedFrameCache(lambda: compute_rollups(obs[obs['Time'] >= recent_start]))
+        server = Flask(__name__)
+        add_export_endpoint(server, history=store, frames=frames)
+        client = server.test_client()
+        frames.get()
+        end = obs['Time'].iloc[-1].normalize()
+        for n in days:
+            start = end - pd.Timedelta(days=n - 1)
+            url = '/export?start={:%Y-%m-%d}&end={:%Y-%m-%d}'.format(start, end)
+            materialized = _measure(lambda: store.query_rollup(start, recent_start,
+                'raw').to_csv())[2]
+            for fmt in formats:
+                def stream():
+                    response = client.get(url + '&format=' + fmt, buffered=False)
+                    size = sum(len(chunk) for chunk in response.response)
+                    response.close()
+                    return size
+                size, seconds, peak = _measure(stream)
+                print('{:>5} {:>8} {:>8.2f}s {:>12,} {:>9.1f}MB {:>12.1f}MB'.format(n, fmt,
+                    seconds, size, peak / 2**20, materialized / 2**20))
+
+def _hammer(call, duration, threads, pause=0.001):
+    # calls from several threads for duration seconds, each pausing between
+    # calls like requests coming in rather than spinning on one CPU, returns
+    # the latency of every call and the number that raised
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    def worker():
+        while time.monotonic() < deadline:
+            tic = time.perf_counter()
+            try:
+                call()
+            except Exception:
+                with lock:
+                    errors[0] += 1
+            with lock:
+                latencies.append(time.perf_counter() - tic)
+            time.sleep(pause)
+    pool = [threading.Thread(target=worker, daemon=True) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return np.array(latencies), errors[0]
+
+def bench_outage(mode='hang', duration=10, threads=8, timeout=1.0):
+    ''' Plays an upstream outage on the uw.cgi and Openweather stand-ins,
+    'hang' or '5xx', and reports the latency callers see while it lasts: a
+    plain request with a timeout, the same through the retry and circuit
+    breaker policy, and the stale-while-revalidate paths the callbacks use
+    (the Openweather client and the shared rooftop frame), each warmed up
+    while the sources were healthy. Timeouts are cut to `timeout` seconds
+    so the outage plays out quickly. The old urlopen without a timeout is
+    tried once for comparison.
+    '''
+    from urllib import request
+    from rollups import compute_rollups
+    from upstream import CircuitBreaker, Upstream
+    dates = get_uw_dates()
+    uw_server, url_str = serve_uw_pages()
+    ow_server, base_url = serve_openweather()
+    url = url_str + dates[-1].strftime('%Y%m%d')
+    # a ttl this short makes every call revalidate
+    client = OpenWeatherClient('x', base_url=base_url, ttl=1e-3, timeout=timeout,
+        connect_timeout=timeout, rate_limit=None)
+    frames = SharedFrameCache(lambda: compute_rollups(get_uw_frame(dates, url_str,
+        timeout=timeout)), max_age=0)
+    upstream = Upstream('uw.cgi', breaker=CircuitBreaker('uw.cgi', reset=duration))
+    try:
+        client.current('Seattle')
+        frames.refresh()
+        uw_server.outage = ow_server.outage = mode
+        print('outage={} duration={}s threads={} timeouts={}s'.format(mode, duration,
+            threads, timeout))
+        print('{:>22} {:>7} {:>7} {:>9} {:>9} {:>9}'.format('', 'calls', 'errors',
+            'p50', 'p99', 'max'))
+        for label, call in (
+                ('uw.cgi timeout only', lambda: http_get(url, timeout, timeout)),
+                ('uw.cgi retry+breaker', lambda: upstream.call(http_get, url, timeout,
+                    timeout)),
+                ('openweather client', lambda: client.current('Seattle')),
+                ('rooftop frame', frames.revalidate)):
+            latencies, errors = _hammer(call, duration, threads)
+            print('{:>22} {:>7,} {:>7,} {:>8.3f}s {:>8.3f}s {:>8.3f}s'.format(label,
+                len(latencies), errors, np.percentile(latencies, 50),
+                np.percentile(latencies, 99), latencies.max()))
+        legacy = threading.Thread(target=lambda: request.urlopen(url), daemon=True)
+        tic = time.perf_counter()
+        legacy.start()
+        legacy.join(duration)
+        print('{:>22} {}'.format('urlopen, no timeout', 'still waiting after {}s'.format(
+            duration) if legacy.is_alive() else 'returned in {:.3f}s'.format(
+            time.perf_counter() - tic)))
+    finally:
+        uw_server.shutdown()
+        ow_server.shutdown()
+
+def bench_memory(days=(7, 365)):
+    ''' Memory of the rooftop data in the old representation (int64/float64
+    columns, a Time column next to the index and datetime.date objects) and
+    in the compact one (narrow dtypes, Time index only, integer Day key), for
+    the 30-min frame and the raw one-minute obs.
+    '''
+    from rollups import compute_rollups
+    print('{:>5} {:>6} {:>12} {:>12} {:>6}'.format('days', 'frame', 'old bytes', 'new bytes', 'ratio'))
+    for n in days:
+        dates = pd.date_range(end=datetime.now(), periods=n)
+        raw = pd.concat([parse_uw_page(make_uw_page(date).splitlines(), date)
+            for date in dates], ignore_index=True)
+        old_raw = raw.astype({col: (np.int64 if np.dtype(dtype).kind == 'i' else np.float64)
+            for col, dtype in UW_DTYPES.items() if col != 'Time'})
+        old = old_raw.resample(rule='30Min', on='Time').mean()
+        old['Time'] = old.index
+        old['Date'] = pd.to_datetime(old['Time']).dt.date
+        new = raw.resample(rule='30Min', on='Time').mean().astype(np.float32)
+        new['Day'] = new.index.values.astype('datetime64[D]').astype(np.int32)
+        for label, before, after in (('raw', old_raw, raw), ('30min', old, new)):
+            before = before.memory_usage(deep=True).sum()
+            after = after.memory_usage(deep=True).sum()
+            print('{:>5} {:>6} {:>12,} {:>12,} {:>5.1f}x'.format(n, label, before,
+                after, before / after))
+        rollups = compute_rollups(raw)
+        print('{:>5} {:>6} {:>12} {:>12,}'.format(n, 'all', '', sum(
+            df.memory_usage(deep=True).sum() for df in rollups.values())))
+
+def _measure(func, memory=True):
+    ''' Runs func once for time and, with memory on, again under tracemalloc
+    for the peak of Python and numpy allocations.
+    '''
+    tic = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - tic
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, seconds, peak
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_suite(days=(1, 30, 365), memory=True, json_path=None):
+    ''' Times each stage of the dashboard pipeline on `days` of synthetic
+    one-minute rooftop obs and a forecast of the same length: uw.cgi parsing
+    (old generator and bulk), 30-min resampling, rollups, forecast decoding,
+    chart figure building and the uw-data Store payload (the old records JSON
+    against the version token).
+
+    Returns:
+        results = list of dictionaries, one per stage and size
+
+    '''
+    from plotly.utils import PlotlyJSONEncoder
+    from app import make_parameter_figure
+    from rollups import compute_rollups, pick_resolution
+
+    results = []
+    for n in days:
+        dates = pd.date_range(end=datetime.now(), periods=n)
+        pages = [make_uw_page(date).splitlines() for date in dates]
+        page_bytes = sum(len(line) + 1 for page in pages for line in page)
+        raw = pd.concat([parse_uw_page(page, date) for date, page in zip(dates, pages)],
+            ignore_index=True)
+        rollups = compute_rollups(raw)
+        chart = downsample(rollups[pick_resolution(dates[0], dates[-1])], 'Temperature')
+        forecast = make_forecast_payload(n * 8)
+
+        def store_records():
+            old = raw.resample(rule='30Min', on='Time').mean()
+            old['Time'] = old.index
+            old['Date'] = pd.to_datetime(old['Time']).dt.date
+            return json.dumps(old.to_dict('records'), cls=PlotlyJSONEncoder)
+
+        stages = [
+            ('parse_generator', len(raw), page_bytes, lambda: pd.DataFrame([r
+                for date, page in zip(dates, pages) for r in parse_uw_day(page, date)])),
+            ('parse_bulk', len(raw), page_bytes, lambda: [parse_uw_page(page, date)
+                for date, page in zip(dates, pages)]),
+            ('resample_30min', len(raw), None,
+                lambda: raw.resample(rule='30Min', on='Time').mean()),
+            ('rollups', len(raw), None, lambda: compute_rollups(raw)),
+            ('forecast_dataframe', n * 8, len(json.dumps(forecast)),
+                lambda: get_forecast_dataframe(forecast)),
+            ('figure', len(chart), None, lambda: json.dumps(
+                make_parameter_figure(chart, 'Temperature'), cls=PlotlyJSONEncoder)),
+            ('store_records', len(raw), None, store_records),
+            ('store_version', 1, None, lambda: json.dumps(SharedFrameCache._new_version())),
+        ]
+        for stage, rows, input_bytes, func in stages:
+            result, seconds, peak = _measure(func, memory)
+            results.append({
+                'stage': stage,
+                'days': n,
+                'rows': rows,
+                'seconds': seconds,
+                'rows_per_s': rows / seconds if seconds else None,
+                'input_bytes': input_bytes,
+                'payload_bytes': len(result) if isinstance(result, str) else None,
+                'peak_bytes': peak,
+            })
+
+    print('{:>18} {:>5} {:>9} {:>9} {:>13} {:>12} {:>12}'.format('stage', 'days',
+        'rows', 'seconds', 'rows/s', 'peak bytes', 'payload'))
+    for r in results:
+        print('{stage:>18} {days:>5} {rows:>9,} {seconds:>9.4f} {:>13,.0f} {:>12} {:>12}'.format(
+            r['rows_per_s'] or 0, '{:,}'.format(r['peak_bytes']) if r['peak_bytes'] else '-',
+            '{:,}'.format(r['payload_bytes']) if r['payload_bytes'] else '-', **r))
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump({
+                'commit': _git_commit(),
+                'python': platform.python_version(),
+                'pandas': pd.__version__,
+                'numpy': np.__version__,
+                'timestamp': datetime.utcnow().isoformat(),
+                'results': results
+            }, f, indent=2)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='bench')
+    fetch = sub.add_parser('fetch', help='sequential vs concurrent uw.cgi fetching')
+    fetch.add_argument('--days', type=int, default=9)
+    fetch.add_argument('--latency', type=float, default=0.5)
+    fetch.add_argument('--max-workers', type=int, default=8)
+    cache = sub.add_parser('cache', help='cold vs warm load through the day cache')
+    cache.add_argument('--latency', type=float, default=0.5)
+    parse = sub.add_parser('parse', help='generator vs bulk uw.cgi parser')
+    parse.add_argument('--days', type=int, default=90)
+    figure = sub.add_parser('figure', help='raw vs downsampled chart figures')
+    figure.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    figure.add_argument('--method', choices=['minmax', 'lttb'], default='minmax')
+    openweather = sub.add_parser('openweather', help='urlopen vs shared Openweather client')
+    openweather.add_argument('--viewers', type=int, default=50)
+    openweather.add_argument('--latency', type=float, default=0.3)
+    panel = sub.add_parser('panel', help='sequential vs concurrent current+forecast fetch')
+    panel.add_argument('--latency', type=float, default=0.3)
+    forecast = sub.add_parser('forecast', help='per-field vs single-pass forecast decoding')
+    forecast.add_argument('--sizes', type=int, nargs='+', default=[40, 4000, 400000])
+    forecast.add_argument('--cities', type=int, default=10)
+    stations = sub.add_parser('stations', help='per-station vs batched multi-station refresh')
+    stations.add_argument('--counts', type=int, nargs='+', default=[1, 10, 50])
+    stations.add_argument('--latency', type=float, default=0.3)
+    startup = sub.add_parser('startup', help='cold start with fast start off and on')
+    startup.add_argument('--latency', type=float, default=0.5)
+    serve = sub.add_parser('serve', help='gunicorn load test by worker count')
+    serve.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    serve.add_argument('--duration', type=float, default=10)
+    serve.add_argument('--concurrency', type=int, default=16)
+    wx = sub.add_parser('wx', help='cached weather panels')
+    wx.add_argument('--repeat', type=int, default=200)
+    analytics = sub.add_parser('analytics', help='daily analytics full build vs weekly update')
+    analytics.add_argument('--years', type=int, nargs='+', default=[1, 5, 10])
+    analytics.add_argument('--interval', type=int, default=60)
+    verify = sub.add_parser('verify', help='forecast archive and verification')
+    verify.add_argument('--days', type=int, nargs='+', default=[30, 90])
+    export = sub.add_parser('export', help='streamed bulk export memory')
+    export.add_argument('--days', type=int, nargs='+', default=[30, 90, 365])
+    export.add_argument('--formats', nargs='+', default=['csv', 'parquet', 'arrow'])
+    outage = sub.add_parser('outage', help='latency during an upstream outage')
+    outage.add_argument('--mode', choices=['hang', '5xx'], default='hang')
+    outage.add_argument('--duration', type=float, default=10)
+    outage.add_argument('--threads', type=int, default=8)
+    memory = sub.add_parser('memory', help='old vs compact in-memory representation')
+    memory.add_argument('--days', type=int, nargs='+', default=[7, 365])
+    suite = sub.add_parser('suite', help='time every pipeline stage, machine-readable')
+    suite.add_argument('--days', type=int, nargs='+', default=[1, 30, 365])
+    suite.add_argument('--json', dest='json_path', help='write the results to this file')
+    suite.add_argument('--no-memory', dest='memory', action='store_false',
+        help='skip the tracemalloc run of each stage')
+    args = parser.parse_args()
+
+    if args.bench == 'fetch':
+        bench_fetch(args.days, args.latency, args.max_workers)
+    elif args.bench == 'cache':
+        bench_cache(args.latency)
+    elif args.bench == 'parse':
+        bench_parse(args.days)
+    elif args.bench == 'figure':
+        bench_figure(args.sizes, args.method)
+    elif args.bench == 'openweather':
+        bench_openweather(args.viewers, args.latency)
+    elif args.bench == 'panel':
+        bench_panel(args.latency)
+    elif args.bench == 'forecast':
+        bench_forecast(args.sizes, args.cities)
+    elif args.bench == 'stations':
+        bench_stations(args.counts, args.latency)
+    elif args.bench == 'startup':
+        bench_startup(args.latency)
+    elif args.bench == 'serve':
+        bench_serve(args.workers, args.duration, args.concurrency)
+    elif args.bench == 'wx':
+        bench_wx(args.repeat)
+    elif args.bench == 'analytics':
+        bench_analytics(args.years, args.interval)
+    elif args.bench == 'verify':
+        bench_verify(args.days)
+    elif args.bench == 'export':
+        bench_export(args.days, args.formats)
+    elif args.bench == 'outage':
+        bench_outage(args.mode, args.duration, args.threads)
+    elif args.bench == 'memory':
+        bench_memory(args.days)
+    elif args.bench == 'suite':
+        bench_suite(args.days, args.memory, args.json_path)
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import numpy as np
+# Most points sent to the browser per chart, and the default method
+CHART_POINTS = 2000
+DOWNSAMPLE_METHOD = 'minmax'
+
+def minmax(y, n_out):
+    ''' Min/max per bucket downsampling. Splits the series into n_out/2
+    equal buckets and keeps the lowest and highest point of each, so spikes
+    like Gust peaks and Rain bursts always survive.
+
+    Variables:
+        y = values to downsample
+        n_out = target number of points
+
+    Returns:
+        idx = sorted indices of the points to keep
+
+    '''
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    buckets = max(1, n_out // 2)
+    size = -(-n // buckets)
+    pad = buckets * size - n
+    y = np.asarray(y, dtype=np.float64)
+    # missing values never win a bucket
+    low = np.concatenate([np.where(np.isnan(y), np.inf, y), np.full(pad, np.inf)])
+    high = np.concatenate([np.where(np.isnan(y), -np.inf, y), np.full(pad, -np.inf)])
+    offsets = np.arange(buckets) * size
+    idx = np.concatenate([[0, n - 1],
+        offsets + low.reshape(buckets, size).argmin(axis=1),
+        offsets + high.reshape(buckets, size).argmax(axis=1)])
+    idx = np.unique(idx)
+    return idx[idx < n]
+
+def lttb(x, y, n_out):
+    ''' Largest-Triangle-Three-Buckets downsampling. Keeps the first and last
+    point and, from each bucket in between, the point making the largest
+    triangle with the previously kept point and the average of the next
+    bucket. Missing values are skipped.
+
+    Variables:
+        x = x values as numbers, e.g. datetime64 viewed as int64
+        y = values to downsample
+        n_out = target number of points
+
+    Returns:
+        idx = sorted indices of the points to keep
+
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(y))
+    n = len(valid)
+    if n <= n_out or n_out < 3:
+        return valid
+    x, y = x[valid], y[valid]
+    edges = np.append(np.linspace(1, n - 1, n_out - 1).astype(np.int64), n)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        x_next = x[hi:edges[i + 2]].mean()
+        y_next = y[hi:edges[i + 2]].mean()
+        area = np.abs((x[a] - x_next) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (y_next - y[a]))
+        a = lo + area.argmax()
+        idx[i + 1] = a
+    return valid[idx]
+
+def downsample(df, column, n_out=CHART_POINTS, method=DOWNSAMPLE_METHOD):
+    ''' Thins a time-indexed dataframe to about n_out rows before it is
+    plotted, choosing the rows from the plotted column.
+
+    Variables:
+        df = dataframe indexed by Time
+        column = the column that will be plotted
+        n_out = target number of points
+        method = 'minmax' or 'lttb'
+
+    Returns:
+        df = dataframe with at most about n_out rows
+
+    '''
+    if len(df) <= n_out:
+        return df
+    if method == 'lttb':
+        idx = lttb(df.index.values.view(np.int64), df[column].values, n_out)
+    elif method == 'minmax':
+        idx = minmax(df[column].values, n_out)
+    else:
+        raise ValueError("Unknown downsampling method: {}".format(method))
+    return df.iloc[idx]
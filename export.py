@@ -0,0 +1,294 @@
+''' Bulk export of the rooftop and forecast data.
+
+GET /export streams a time range of one data source as CSV, Parquet or Arrow
+IPC (stream format). The range is read and written a few days at a time,
+from memory-mapped slices of the history store and the shared rollups, so
+exporting years takes about as much memory as exporting a week and no lock
+is held while the response is sent.
+
+Query parameters:
+    source = 'uw' for the rooftop (default) or 'forecast' for the archived
+        Openweather forecasts
+    start, end = first and last day of the range, end inclusive, default is
+        everything there is
+    params = comma separated columns, default is all of them
+    resolution = rooftop resolution from rollups.ROLLUPS, default 'raw'
+    format = 'csv' (default), 'parquet' or 'arrow'
+
+CSV and Arrow are compressed with brotli or gzip when the client accepts
+them, Parquet is already compressed column by column.
+'''
+import zlib
+from datetime import datetime, timedelta
+
+import brotli
+import numpy as np
+import pandas as pd
+
+from rollups import ROLLUPS
+from uw_wx import UW_FRAME_CACHE, UW_HISTORY
+from verification import FORECAST_DTYPE, ForecastArchive
+# Constants
+# Days of data read and written at a time
+EXPORT_CHUNK_DAYS = 7
+EXPORT_MIMETYPES = {'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream'}
+# float32 values carry digits the sensors never measured, CSV keeps six
+EXPORT_FLOAT_FORMAT = '%.6g'
+# Rollup columns that are only copies of Temperature in raw observations
+EXPORT_ROLLUP_ONLY = ['Temperature Min', 'Temperature Max']
+EXPORT_BR_LEVEL = 4
+EXPORT_GZIP_LEVEL = 6
+
+class ExportError(ValueError):
+    ''' A bad export request, the message goes back to the client. '''
+
+def iter_uw_chunks(start, end, columns=None, resolution='raw', history=UW_HISTORY,
+    frames=UW_FRAME_CACHE, chunk_days=EXPORT_CHUNK_DAYS):
+    ''' Reads the rooftop data between start and end a chunk of days at a
+    time, older days from the history store and the past week from the
+    shared rollups, like uw_wx.get_uw_range.
+
+    Variables:
+        start, end = range to read, end exclusive, None for all of it
+        columns = columns to keep, default is all of them
+        resolution = key into rollups.ROLLUPS
+        history = history.HistoryStore or None
+        frames = uw_cache.SharedFrameCache of the rollups
+        chunk_days = days per chunk
+
+    Returns:
+        generator of dataframes with a Time column first, at least one
+
+    '''
+    if resolution not in [name for name, _, _ in ROLLUPS]:
+        raise ExportError('unknown resolution {!r}'.format(resolution))
+    recent = frames.get()[resolution]
+    available = [col for col in recent.columns
+        if resolution != 'raw' or col not in EXPORT_ROLLUP_ONLY]
+    columns = _check_columns(columns, available)
+    recent_start = recent.index[0].normalize() if len(recent) else None
+    first = history.first_time() if history is not None else None
+    if first is None:
+        first = recent_start
+    end = pd.Timestamp(datetime.utcnow() + timedelta(days=1)).normalize() if end is None else end
+    yielded = False
+    if first is not None:
+        chunk = timedelta(days=chunk_days)
+        day = max(first.normalize() if start is None else start, first.normalize())
+        if history is None:
+            day = max(day, recent_start)
+        while day < end:
+            next_day = min(day + chunk, end)
+            parts = []
+            if history is not None and (recent_start is None or day < recent_start):
+                older_end = next_day if recent_start is None else min(next_day, recent_start)
+                parts.append(history.query_rollup(day, older_end, resolution)[columns])
+            if recent_start is not None and next_day > recent_start:
+                lo, hi = recent.index.searchsorted([max(day, recent_start), next_day])
+                parts.append(recent.iloc[lo:hi][columns])
+            df = pd.concat(parts) if len(parts) > 1 else parts[0]
+            if len(df):
+                yield _time_first(df.astype(np.float32))
+                yielded = True
+            day = next_day
+    if not yielded:
+        yield _time_first(recent.iloc[:0][columns])
+
+def iter_forecast_chunks(start, end, columns=None, archive=None,
+    chunk_days=EXPORT_CHUNK_DAYS):
+    ''' Reads the archived forecasts issued between start and end a chunk of
+    days at a time.
+
+    Variables:
+        start, end = range of issue times, end exclusive, None for all of it
+        columns = variables to keep next to Issued and Valid, default is all
+        archive = verification.ForecastArchive, default is the app's
+        chunk_days = days per chunk
+
+    Returns:
+        generator of dataframes in issue order, at least one
+
+    '''
+    archive = ForecastArchive() if archive is None else archive
+    columns = ['Issued', 'Valid'] + [col for col in _check_columns(columns,
+        list(FORECAST_DTYPE.names[2:])) if col not in ('Issued', 'Valid')]
+    months = archive.partitions()
+    yielded = False
+    if months:
+        day = months[0] if start is None else max(start, months[0])
+        if end is None:
+            end = months[-1] + pd.DateOffset(months=1)
+        while day < end:
+            next_day = min(day + timedelta(days=chunk_days), end)
+            df = archive.query(day, next_day, by='Issued')
+            if len(df):
+                yield df[columns]
+                yielded = True
+            day = next_day
+    if not yielded:
+        yield pd.DataFrame(np.empty(0, dtype=FORECAST_DTYPE))[columns]
+
+def _check_columns(columns, available):
+    if not columns:
+        return available
+    unknown = [col for col in columns if col not in available]
+    if unknown:
+        raise ExportError('unknown params {}, available: {}'.format(', '.join(unknown),
+            ', '.join(available)))
+    return list(columns)
+
+def _time_first(df):
+    df = df.reset_index()
+    return df.rename(columns={df.columns[0]: 'Time'})
+
+class _StreamSink:
+    ''' Write-only file that hands back what was written since the last drain,
+    while tell keeps counting from the start as the Parquet writer expects.
+    '''
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def _csv_bytes(chunks):
+    header = True
+    for df in chunks:
+        yield df.to_csv(index=False, header=header,
+            float_format=EXPORT_FLOAT_FORMAT).encode('utf-8')
+        header = False
+
+def _pyarrow():
+    ''' Imports pyarrow on the first Parquet or Arrow export, returns None
+    without it and only CSV can be exported then.
+    '''
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pa
+
+def _arrow_bytes(chunks, fmt):
+    pa = _pyarrow()
+    sink = _StreamSink()
+    writer = None
+    for df in chunks:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if writer is None:
+            writer = (pa.parquet.ParquetWriter(sink, table.schema) if fmt == 'parquet'
+                else pa.ipc.new_stream(sink, table.schema))
+        writer.write_table(table)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def _compressed(data, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=EXPORT_BR_LEVEL)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31)
+        compress, finish = compressor.compress, compressor.flush
+    for chunk in data:
+        chunk = compress(chunk)
+        if chunk:
+            yield chunk
+    yield finish()
+
+def export_bytes(chunks, fmt='csv', encoding=None):
+    ''' Serializes dataframe chunks one at a time.
+
+    Variables:
+        chunks = iterable of dataframes with the same columns, at least one
+        fmt = key into EXPORT_MIMETYPES
+        encoding = None, 'br' or 'gzip'
+
+    Returns:
+        generator of bytes
+
+    '''
+    if fmt not in EXPORT_MIMETYPES:
+        raise ExportError('unknown format {!r}, use one of {}'.format(fmt,
+            ', '.join(EXPORT_MIMETYPES)))
+    if fmt != 'csv' and _pyarrow() is None:
+        raise ExportError('{} export needs pyarrow'.format(fmt))
+    data = _csv_bytes(chunks) if fmt == 'csv' else _arrow_bytes(chunks, fmt)
+    return data if encoding is None else _compressed(data, encoding)
+
+def _parse_day(value):
+    if not value:
+        return None
+    try:
+        return pd.Timestamp(value).normalize()
+    except ValueError:
+        raise ExportError('bad date {!r}'.format(value))
+
+def add_export_endpoint(server, path='/export', history=UW_HISTORY, frames=UW_FRAME_CACHE,
+    archive=None):
+    ''' Serves bulk exports on the Flask server behind the Dash app, see the
+    module docstring for the parameters.
+    '''
+    from flask import Response, request
+
+    def export():
+        args = request.args
+        fmt = args.get('format', 'csv')
+        source = args.get('source', 'uw')
+        params = [col.strip() for col in args.get('params', '').split(',') if col.strip()]
+        try:
+            start, end = _parse_day(args.get('start')), _parse_day(args.get('end'))
+            if end is not None:
+                end += timedelta(days=1)
+            if source == 'uw':
+                chunks = iter_uw_chunks(start, end, params, args.get('resolution', 'raw'),
+                    history, frames)
+            elif source == 'forecast':
+                chunks = iter_forecast_chunks(start, end, params, archive)
+            else:
+                raise ExportError('unknown source {!r}, use uw or forecast'.format(source))
+            # read the first chunk now so bad params are a 400, not a broken stream
+            first = next(chunks)
+            encoding = None
+            if fmt != 'parquet':
+                encoding = request.accept_encodings.best_match(['br', 'gzip'])
+            data = export_bytes(_prepend(first, chunks), fmt, encoding)
+        except ExportError as exc:
+            return Response(str(exc) + '\n', status=400, mimetype='text/plain')
+
+        response = Response(data, mimetype=EXPORT_MIMETYPES[fmt])
+        response.headers['Content-Disposition'] = 'attachment; filename={}.{}'.format(
+            source, fmt)
+        response.headers['Vary'] = 'Accept-Encoding'
+        # compressed here chunk by chunk, so Flask-Compress leaves it alone
+        # instead of buffering the whole stream to compress it
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        return response
+    server.add_url_rule(path, 'export', export)
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
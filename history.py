@@ -0,0 +1,269 @@
+''' Long-history store for the ATG rooftop observations.
+
+Observations are kept in monthly partitions with one memory-mapped .npy file
+per variable, so a range query only opens the months it overlaps and only
+copies the rows inside the range. Every resolution in rollups.ROLLUPS is
+computed when a month is written and kept next to the raw files, so a chart
+of years reads a few hundred precomputed rows instead of resampling millions.
+
+Usage:
+    python history.py backfill START END [--dir DIR]
+    python history.py rollup [--dir DIR]
+
+'''
+import argparse
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from rollups import ROLLUPS, prepare_obs, rollup
+from uw_cache import UWDayCache, UW_DTYPES
+
+class HistoryStore:
+    ''' Columnar store of raw rooftop observations partitioned by month.
+
+    Partitions are append-only: new rows are written to the variable files
+    first and the Time file last, so a reader that opened the old Time file
+    still finds the same rows at the same positions. The rollups of a month
+    are rewritten after its raw files.
+
+    Variables:
+        root = directory holding one sub-directory per month (YYYY-MM)
+
+    '''
+    def __init__(self, root):
+        self.root = root
+
+    def partitions(self):
+        ''' Returns the months in the store, oldest first. '''
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return []
+        months = []
+        for name in names:
+            try:
+                months.append(pd.Timestamp(datetime.strptime(name, '%Y-%m')))
+            except ValueError:
+                continue
+        return sorted(months)
+
+    def _path(self, month, col):
+        return os.path.join(self.root, month.strftime('%Y-%m'), col + '.npy')
+
+    def _months(self, start, end):
+        ''' The months overlapping start <= Time < end, with their bounds. '''
+        for month in self.partitions():
+            month_end = month + pd.DateOffset(months=1)
+            if month_end > start and month < end:
+                yield month, month_end
+
+    def _load(self, month, col):
+        try:
+            return np.load(self._path(month, col), mmap_mode='r')
+        except IOError:
+            return None
+
+    def first_time(self):
+        ''' Time of the oldest observation in the store, None if empty. '''
+        for month in self.partitions():
+            time = self._load(month, 'Time')
+            if time is not None and len(time):
+                return pd.Timestamp(time[0])
+        return None
+
+    def last_time(self):
+        ''' Time of the newest observation in the store, None if empty. '''
+        for month in reversed(self.partitions()):
+            time = self._load(month, 'Time')
+            if time is not None and len(time):
+                return pd.Timestamp(time[-1])
+        return None
+
+    def append(self, df):
+        ''' Adds observations to the store. Rows newer than a partition's last
+        observation are appended, anything older is merged in by rewriting
+        that month.
+
+        Variables:
+            df = dataframe of raw observations with a Time column
+
+        '''
+        if not len(df):
+            return
+        df = df.sort_values('Time', kind='mergesort')
+        months = df['Time'].values.astype('datetime64[M]')
+        for month in np.unique(months):
+            part = df[months == month]
+            month = pd.Timestamp(month)
+            time = self._load(month, 'Time')
+            if time is not None and len(time):
+                older = (part['Time'].values <= time[-1]).any()
+                part = pd.concat([self._read_month(month), part], ignore_index=True)
+                if older:
+                    part = part.drop_duplicates('Time', keep='last')
+                    part = part.sort_values('Time', kind='mergesort')
+            self._write(month, part)
+
+    def _read_month(self, month):
+        return pd.DataFrame({col: self._load(month, col).astype(dtype)
+            for col, dtype in UW_DTYPES.items()}, columns=list(UW_DTYPES))
+
+    def _write(self, month, df):
+        os.makedirs(os.path.dirname(self._path(month, 'Time')), exist_ok=True)
+        # Time goes last, see the class docstring
+        for col in list(UW_DTYPES)[1:] + ['Time']:
+            self._save(self._path(month, col), df[col].values.astype(UW_DTYPES[col]))
+        self._write_rollups(month, df)
+
+    def _write_rollups(self, month, df):
+        # months start at midnight, so no bucket spans two partitions
+        obs = prepare_obs(df)
+        for name, rule, _ in ROLLUPS:
+            if rule is not None:
+                self._save(self._path(month, 'rollup.' + name),
+                    _to_records(rollup(obs, rule)))
+
+    def _save(self, path, values):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, values)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def write_rollups(self):
+        ''' Computes the rollups of every month, for stores written before
+        they were kept.
+        '''
+        for month in self.partitions():
+            if self._load(month, 'Time') is not None:
+                self._write_rollups(month, self._read_month(month))
+
+    def query(self, start, end, columns=None):
+        ''' Reads the raw observations with start <= Time < end.
+
+        Variables:
+            start = start of the range
+            end = end of the range, exclusive
+            columns = variables to read, default is all of them
+
+        Returns:
+            df = dataframe of observations with a Time column
+
+        '''
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        columns = [col for col in (columns or UW_DTYPES) if col != 'Time']
+        frames = []
+        for month, _ in self._months(start, end):
+            time = self._load(month, 'Time')
+            if time is None:
+                continue
+            lo, hi = np.searchsorted(time, [start.to_datetime64(), end.to_datetime64()])
+            if lo == hi:
+                continue
+            data = {'Time': np.array(time[lo:hi])}
+            for col in columns:
+                data[col] = self._load(month, col)[lo:hi].astype(UW_DTYPES[col])
+            frames.append(pd.DataFrame(data, columns=['Time'] + columns))
+        if not frames:
+            return pd.DataFrame({col: pd.Series(dtype=UW_DTYPES[col])
+                for col in ['Time'] + columns}, columns=['Time'] + columns)
+        return pd.concat(frames, ignore_index=True)
+
+    def query_rollup(self, start, end, resolution):
+        ''' Reads a range at one of the rollups.ROLLUPS resolutions. Rollups
+        are read from the precomputed files, only the buckets inside the
+        range are copied. Months without them, written before they were
+        kept, are aggregated from the raw observations.
+
+        Returns:
+            df = float32 dataframe indexed by Time, like rollups.rollup
+
+        '''
+        rule = dict((name, rule) for name, rule, _ in ROLLUPS)[resolution]
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        parts = []
+        if rule is not None:
+            for month, month_end in self._months(start, end):
+                records = self._load(month, 'rollup.' + resolution)
+                if records is None:
+                    parts.append(_to_records(rollup(prepare_obs(self.query(max(start, month),
+                        min(end, month_end))), rule)))
+                    continue
+                lo, hi = np.searchsorted(records['Time'],
+                    [start.to_datetime64(), end.to_datetime64()])
+                if lo < hi:
+                    parts.append(records[lo:hi])
+        if not parts:
+            return rollup(prepare_obs(self.query(start, end)), rule)
+        # one dataframe built at the end, it costs more than the rows
+        return _from_records(np.concatenate(parts))
+
+def _to_records(df):
+    # one structured array per rollup, memory-mapped and sliced by Time
+    records = np.empty(len(df), dtype=[('Time', 'M8[ns]')]
+        + [(col, np.float32) for col in df.columns])
+    records['Time'] = df.index.values
+    for col in df.columns:
+        records[col] = df[col].values
+    return records
+
+def _from_records(records):
+    names = records.dtype.names
+    index = pd.DatetimeIndex(np.array(records['Time']), name='Time')
+    return pd.DataFrame({col: records[col] for col in names[1:]}, index=index,
+        columns=list(names[1:]))
+
+def backfill(store, start, end, fetch=None, chunk_days=31):
+    ''' Fills the store with every finalized day from start to end, skipping
+    days the store already has.
+
+    Variables:
+        store = HistoryStore to fill
+        start = first day to backfill
+        end = last day to backfill, capped at the last finalized day
+        fetch = callable taking a list of days and returning a dataframe,
+            default is uw_wx.get_uw_frame
+        chunk_days = days fetched and written at a time
+
+    '''
+    if fetch is None:
+        from uw_wx import get_uw_frame as fetch
+    first, last = store.first_time(), store.last_time()
+    dates = [date for date in pd.date_range(start, end, freq='D')
+        if UWDayCache.is_final(date)
+        and not (first is not None and first.normalize() <= date <= last.normalize())]
+    for i in range(0, len(dates), chunk_days):
+        chunk = dates[i:i + chunk_days]
+        store.append(fetch(chunk))
+        print('backfilled {} to {}'.format(chunk[0].date(), chunk[-1].date()))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command')
+    fill = sub.add_parser('backfill', help='download past days into the store')
+    fill.add_argument('start', help='first day, YYYY-MM-DD')
+    fill.add_argument('end', nargs='?', default=None,
+        help='last day, YYYY-MM-DD, default is yesterday')
+    fill.add_argument('--dir', default=os.environ.get('UW_HISTORY_DIR', 'uw_history'))
+    rollups = sub.add_parser('rollup', help='precompute the rollups of every month')
+    rollups.add_argument('--dir', default=os.environ.get('UW_HISTORY_DIR', 'uw_history'))
+    args = parser.parse_args()
+
+    if args.command == 'backfill':
+        end = args.end or (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%d')
+        backfill(HistoryStore(args.dir), args.start, end)
+    elif args.command == 'rollup':
+        HistoryStore(args.dir).write_rollups()
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import os
+import threading
+from array import array
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from uw_cache import UW_DTYPES
+from uw_wx import UW_DATA_URL, UW_TIMEOUT, fetch_uw_page, parse_uw_rows
+# Seconds between polls of today's uw.cgi page, 0 turns live mode off
+UW_LIVE_INTERVAL = int(os.environ.get('UW_LIVE_INTERVAL', 0))
+
+class ObservationBuffer:
+    ''' Append-only observation series backed by one typed array.array per
+    column. Appending never copies the rows already held, and a row costs
+    34 bytes instead of a dataframe row of Python-sized columns.
+    '''
+    __slots__ = ('_columns',)
+    # Time is kept as int64 nanoseconds
+    TYPECODES = {col: 'q' if col == 'Time' else np.dtype(dtype).char
+        for col, dtype in UW_DTYPES.items()}
+
+    def __init__(self):
+        self._columns = {col: array(code) for col, code in self.TYPECODES.items()}
+
+    def __len__(self):
+        return len(self._columns['Time'])
+
+    def extend(self, df):
+        ''' Appends the rows of a dataframe of observations. '''
+        for col, values in self._columns.items():
+            column = df[col].values
+            column = column.view(np.int64) if col == 'Time' else column.astype(UW_DTYPES[col])
+            values.frombytes(np.ascontiguousarray(column).tobytes())
+
+    def since(self, last_time):
+        ''' Copies the observations newer than last_time into a dataframe. '''
+        times = np.frombuffer(self._columns['Time'], dtype=np.int64)
+        start = np.searchsorted(times, pd.Timestamp(last_time).value, side='right')
+        data = {col: np.frombuffer(values, dtype=UW_DTYPES[col] if col != 'Time'
+            else np.int64)[start:].copy() for col, values in self._columns.items()}
+        data['Time'] = data['Time'].view('datetime64[ns]')
+        return pd.DataFrame(data, columns=list(UW_DTYPES))
+
+class LiveFeed:
+    ''' Tails today's uw.cgi page. Each poll downloads the page but only
+    parses the lines past the byte offset where the previous poll stopped,
+    and the new observations are appended to an in-memory ObservationBuffer
+    for the day.
+
+    Variables:
+        url_str = base uw.cgi URL
+        timeout = per-request timeout in seconds
+
+    '''
+    def __init__(self, url_str=UW_DATA_URL, timeout=UW_TIMEOUT):
+        self.url_str = url_str
+        self.timeout = timeout
+        self.day = None
+        self.offset = 0
+        self.buffer = ObservationBuffer()
+        self._lock = threading.Lock()
+
+    def poll(self, now=None):
+        ''' Fetches today's page and appends the observations that are new
+        since the last poll.
+
+        Returns:
+            df = dataframe with only the new observations
+
+        '''
+        day = pd.Timestamp(datetime.utcnow() if now is None else now).normalize()
+        page = fetch_uw_page(day, self.url_str, self.timeout)
+        with self._lock:
+            # start over on a new day, or if the page got shorter
+            if day != self.day or len(page) < self.offset:
+                offset = self._body_offset(page)
+                if offset is None:
+                    return parse_uw_rows([], None)
+                self.day = day
+                self.offset = offset
+                self.buffer = ObservationBuffer()
+            body = page[self.offset:]
+            # stop after the last complete observation, so a half written line
+            # or the page footer is looked at again next time
+            end = pos = 0
+            for line in body.split(b'\n')[:-1]:
+                pos += len(line) + 1
+                if len(line.split()) == 9:
+                    end = pos
+            new = parse_uw_rows(body[:end].splitlines(), day)
+            self.offset += end
+            self.buffer.extend(new)
+        return new
+
+    def since(self, last_time):
+        ''' Observations of the day newer than last_time. '''
+        with self._lock:
+            return self.buffer.since(last_time)
+
+    @staticmethod
+    def _body_offset(page):
+        # the data starts two lines after the one with the units ('knot'),
+        # None while the page has no complete header yet
+        start = page.find(b'knot')
+        if start < 0:
+            return None
+        for _ in range(2):
+            start = page.find(b'\n', start) + 1
+            if start == 0:
+                return None
+        return start
+
+# Shared feed for the dashboard, polled by app.py's scheduler when
+# UW_LIVE_INTERVAL is set
+LIVE_FEED = LiveFeed()
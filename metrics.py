@@ -0,0 +1,170 @@
+import cProfile
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+try:
+    from dash.exceptions import PreventUpdate
+except ImportError:
+    # without dash nothing raises it
+    PreventUpdate = ()
+# Constants
+# UW_METRICS=0 turns the counters off, instrumented functions are then left
+# unwrapped
+UW_METRICS = os.environ.get('UW_METRICS', '1') != '0'
+# Comma separated names of instrumented functions or callbacks to profile, or
+# "all", with cProfile stats dumped to UW_PROFILE_DIR
+UW_PROFILE = {name for name in os.environ.get('UW_PROFILE', '').split(',') if name}
+UW_PROFILE_DIR = os.environ.get('UW_PROFILE_DIR', 'profiles')
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_lock = threading.Lock()
+# name -> [bucket counts..., +Inf count], sum of seconds
+_latency = {}
+_latency_sum = {}
+_errors = {}
+_bytes = {}
+# (cache, 'hit' or 'miss') -> count
+_cache = {}
+# only one cProfile profiler can run at a time
+_profile_lock = threading.Lock()
+
+def observe(name, seconds):
+    ''' Records one call of name taking seconds. '''
+    i = bisect_left(LATENCY_BUCKETS, seconds)
+    with _lock:
+        counts = _latency.get(name)
+        if counts is None:
+            counts = _latency[name] = [0] * (len(LATENCY_BUCKETS) + 1)
+            _latency_sum[name] = 0.0
+        counts[i] += 1
+        _latency_sum[name] += seconds
+
+def count_error(name):
+    with _lock:
+        _errors[name] = _errors.get(name, 0) + 1
+
+def count_bytes(source, n):
+    ''' Adds n bytes received from an upstream source, e.g. "uw.cgi". '''
+    if UW_METRICS:
+        with _lock:
+            _bytes[source] = _bytes.get(source, 0) + n
+
+def count_cache(cache, hit, n=1):
+    ''' Counts n hits (or misses) of a cache. '''
+    if UW_METRICS:
+        key = (cache, 'hit' if hit else 'miss')
+        with _lock:
+            _cache[key] = _cache.get(key, 0) + n
+
+def _profiled(name):
+    return 'all' in UW_PROFILE or name in UW_PROFILE
+
+def _profile(name, func, args, kwargs):
+    ''' Runs func under cProfile and dumps the stats, or just runs it if
+    another call is being profiled right now.
+    '''
+    if not _profile_lock.acquire(blocking=False):
+        return func(*args, **kwargs)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        _profile_lock.release()
+        os.makedirs(UW_PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(UW_PROFILE_DIR,
+            '{}-{}.prof'.format(name, time.strftime('%Y%m%dT%H%M%S'))))
+
+def timed(name):
+    ''' Decorator recording the latency and errors of every call of the
+    function under name, and profiling it when name is in UW_PROFILE. A
+    callback skipping its update with PreventUpdate is not an error. A
+    generator function is timed until it is exhausted or closed but never
+    profiled, the profiler would also count the time spent between yields in
+    the caller. With metrics off and no profiling the function is returned
+    as is.
+    '''
+    def decorator(func):
+        profiled = _profiled(name)
+        generator = inspect.isgeneratorfunction(func)
+        if not UW_METRICS and (generator or not profiled):
+            return func
+
+        if generator:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                tic = time.perf_counter()
+                try:
+                    yield from func(*args, **kwargs)
+                except PreventUpdate:
+                    raise
+                except Exception:
+                    count_error(name)
+                    raise
+                finally:
+                    observe(name, time.perf_counter() - tic)
+            return wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            tic = time.perf_counter()
+            try:
+                if profiled:
+                    return _profile(name, func, args, kwargs)
+                return func(*args, **kwargs)
+            except PreventUpdate:
+                raise
+            except Exception:
+                count_error(name)
+                raise
+            finally:
+                observe(name, time.perf_counter() - tic)
+        return wrapper
+    return decorator
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render():
+    ''' The metrics in the Prometheus text exposition format. '''
+    with _lock:
+        latency = {name: list(counts) for name, counts in _latency.items()}
+        latency_sum = dict(_latency_sum)
+        errors, received, cache = dict(_errors), dict(_bytes), dict(_cache)
+
+    lines = ['# HELP uw_wx_call_seconds Latency of instrumented calls and callbacks.',
+        '# TYPE uw_wx_call_seconds histogram']
+    for name, counts in sorted(latency.items()):
+        total = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), counts):
+            total += count
+            lines.append('uw_wx_call_seconds_bucket{{name="{}",le="{}"}} {}'.format(
+                _label(name), bound, total))
+        lines.append('uw_wx_call_seconds_sum{{name="{}"}} {}'.format(
+            _label(name), latency_sum[name]))
+        lines.append('uw_wx_call_seconds_count{{name="{}"}} {}'.format(_label(name), total))
+
+    lines += ['# HELP uw_wx_errors_total Instrumented calls that raised.',
+        '# TYPE uw_wx_errors_total counter']
+    lines += ['uw_wx_errors_total{{name="{}"}} {}'.format(_label(name), n)
+        for name, n in sorted(errors.items())]
+    lines += ['# HELP uw_wx_received_bytes_total Bytes received from upstream sources.',
+        '# TYPE uw_wx_received_bytes_total counter']
+    lines += ['uw_wx_received_bytes_total{{source="{}"}} {}'.format(_label(source), n)
+        for source, n in sorted(received.items())]
+    lines += ['# HELP uw_wx_cache_requests_total Cache lookups by result.',
+        '# TYPE uw_wx_cache_requests_total counter']
+    lines += ['uw_wx_cache_requests_total{{cache="{}",result="{}"}} {}'.format(
+        _label(name), result, n) for (name, result), n in sorted(cache.items())]
+    return '\n'.join(lines) + '\n'
+
+def add_metrics_endpoint(server, path='/metrics'):
+    ''' Serves render() on the Flask server behind the Dash app. '''
+    from flask import Response
+
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
+    server.add_url_rule(path, 'metrics', metrics)
@@ -0,0 +1,270 @@
+import http.client
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib import parse
+
+from metrics import count_bytes, count_cache, timed
+from upstream import Upstream, UpstreamError
+# Constants
+OPENWEATHER_API_URL = os.environ.get('OPENWEATHER_API_URL',
+    "http://api.openweathermap.org/data/2.5")
+# Openweather updates its data about every 10 minutes, no point asking sooner
+OPENWEATHER_TTL = 600
+# Calls per minute allowed on the free plan, and the most city ids per group query
+OPENWEATHER_RATE_LIMIT = 60
+OPENWEATHER_GROUP_SIZE = 20
+# Seconds to connect and to wait on each read
+OPENWEATHER_CONNECT_TIMEOUT = 5
+OPENWEATHER_TIMEOUT = 10
+
+class OpenWeatherError(UpstreamError):
+    ''' Raised when Openweather answers with an error or unreadable data. '''
+
+class RateLimiter:
+    ''' Token bucket allowing `rate` calls per `per` seconds, with bursts of
+    up to `rate` calls. Shared by every thread of a client.
+    '''
+    def __init__(self, rate, per=60.0):
+        self.rate = rate
+        self.per = per
+        self._tokens = float(rate)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        ''' Blocks until a call is allowed. '''
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.rate,
+                    self._tokens + (now - self._stamp) * self.rate / self.per)
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) * self.per / self.rate
+            time.sleep(wait)
+
+class OpenWeatherClient:
+    ''' Shared Openweather client. Keeps a small pool of keep-alive
+    connections, caches responses for `ttl` seconds keyed by endpoint and
+    query, and makes concurrent callers asking for the same thing wait on a
+    single request instead of each sending their own. City coordinates are
+    remembered so current conditions and the forecast can be fetched at the
+    same time.
+
+    An expired response is still returned straight away while a background
+    request revalidates it (stale-while-revalidate), so callers only wait on
+    Openweather the first time they ask for something. Requests are retried
+    and go through a circuit breaker, see upstream.Upstream.
+
+    Variables:
+        api_key = API key, or a callable returning it so it is only read when
+            the first request is made
+        base_url = Openweather API base URL
+        ttl = seconds a response is fresh, 0 turns the cache off
+        timeout = read timeout in seconds
+        pool_size = max idle connections kept open
+        rate_limit = max requests per minute across all threads, None for no
+            limit
+        connect_timeout = connect timeout in seconds
+        upstream = upstream.Upstream retry and breaker policy, default is a
+            new one
+
+    '''
+    def __init__(self, api_key, base_url=OPENWEATHER_API_URL, ttl=OPENWEATHER_TTL,
+        timeout=OPENWEATHER_TIMEOUT, pool_size=4, rate_limit=OPENWEATHER_RATE_LIMIT,
+        connect_timeout=OPENWEATHER_CONNECT_TIMEOUT, upstream=None):
+        self._api_key = api_key
+        url = parse.urlsplit(base_url)
+        self._connection_class = (http.client.HTTPSConnection if url.scheme == 'https'
+            else http.client.HTTPConnection)
+        self._host = url.netloc
+        self._path = url.path.rstrip('/')
+        self.ttl = ttl
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.upstream = Upstream('openweather') if upstream is None else upstream
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._cache = {}
+        self._inflight = {}
+        self._coords = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size)
+        # separate, so revalidations stuck on a hung upstream never hold up
+        # current_and_forecast
+        self._revalidator = ThreadPoolExecutor(max_workers=pool_size)
+        self._limiter = RateLimiter(rate_limit) if rate_limit else None
+
+    @property
+    def api_key(self):
+        if callable(self._api_key):
+            self._api_key = self._api_key()
+        return self._api_key
+
+    def current(self, q, units='imperial', fresh=False):
+        ''' Current weather for a city name query, e.g. "Seattle". '''
+        return self.get('weather', fresh=fresh, q=q, units=units)
+
+    def forecast(self, lat, lon, units='imperial', fresh=False):
+        ''' 5 day, 3 hourly forecast for a location. '''
+        return self.get('forecast', fresh=fresh, lat=lat, lon=lon, units=units)
+
+    def group(self, ids, units='imperial', fresh=False):
+        ''' Current weather for up to OPENWEATHER_GROUP_SIZE city ids in one
+        request.
+
+        Returns:
+            list: current weather responses in the order of ids
+
+        '''
+        ids = [str(city_id) for city_id in ids]
+        data = self.get('group', fresh=fresh, id=','.join(ids), units=units)
+        by_id = {str(current['id']): current for current in data['list']}
+        return [by_id.get(city_id) for city_id in ids]
+
+    def coordinates(self, q, units='imperial'):
+        ''' (lat, lon) of a city name query, looked up once per city from its
+        current weather.
+        '''
+        coords = self._coords.get(q)
+        if coords is None:
+            coords = self._remember(q, self.current(q, units))
+        return coords
+
+    def current_and_forecast(self, q, units='imperial'):
+        ''' Current weather and forecast for a city name query. Once the
+        city's coordinates are known both are requested concurrently, so this
+        costs one round-trip instead of two.
+
+        Returns:
+            (dict, dict): current weather and forecast responses
+
+        '''
+        coords = self._coords.get(q)
+        if coords is None:
+            current = self.current(q, units)
+            return current, self.forecast(*self._remember(q, current), units=units)
+        current = self._executor.submit(self.current, q, units)
+        forecast = self.forecast(*coords, units=units)
+        return current.result(), forecast
+
+    def _remember(self, q, current):
+        coords = (current['coord']['lat'], current['coord']['lon'])
+        self._coords[q] = coords
+        return coords
+
+    def get(self, endpoint, fresh=False, **params):
+        ''' Makes a cached, coalesced API request.
+
+        Variables:
+            endpoint = API endpoint, e.g. "weather" or "forecast"
+            fresh = skip the cache, e.g. for background refreshes
+            params = query parameters, without the API key
+
+        Returns:
+            dict: the decoded JSON response, shared between callers so it
+            must not be modified
+
+        '''
+        key = (endpoint, tuple(sorted(params.items())))
+        with self._lock:
+            hit = None if fresh or not self.ttl else self._cache.get(key)
+            if hit is not None and time.monotonic() - hit[0] < self.ttl:
+                count_cache('openweather', True)
+                return hit[1]
+            count_cache('openweather', hit is not None)
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if hit is not None:
+            # stale, hand out the last good response and revalidate it in the
+            # background, once however many callers ask meanwhile
+            if owner:
+                self._revalidator.submit(self._fetch, key, endpoint, params, future)
+            return hit[1]
+        if not owner:
+            return future.result()
+        return self._fetch(key, endpoint, params, future)
+
+    def _fetch(self, key, endpoint, params, future):
+        try:
+            data = self._request(endpoint, params)
+        except BaseException as exc:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(exc)
+            raise
+        with self._lock:
+            self._cache[key] = (time.monotonic(), data)
+            del self._inflight[key]
+        future.set_result(data)
+        return data
+
+    def clear(self):
+        ''' Forgets every cached response. '''
+        with self._lock:
+            self._cache.clear()
+
+    @timed('openweather_request')
+    def _request(self, endpoint, params):
+        query = parse.urlencode(dict(params, appid=self.api_key))
+        return self.upstream.call(self._send, f"{self._path}/{endpoint}?{query}")
+
+    def _send(self, path):
+        if self._limiter is not None:
+            self._limiter.acquire()
+        # a pooled connection may have been closed by the server, retry once
+        # on a fresh one
+        for attempt in range(2):
+            conn = self._get_connection(fresh=attempt > 0)
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                conn.close()
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                # e.g. a read timeout, the connection can't be reused
+                conn.close()
+                raise
+            break
+        self._put_connection(conn)
+        count_bytes('openweather', len(body))
+
+        if response.status == 401:
+            raise OpenWeatherError("Access denied. Check your API key.", 401)
+        elif response.status == 404:
+            raise OpenWeatherError("Can't find weather data for this city.", 404)
+        elif response.status != 200:
+            raise OpenWeatherError(f"Something went wrong... ({response.status})",
+                response.status)
+        try:
+            return json.loads(body)
+        except ValueError:
+            raise OpenWeatherError("Couldn't read the server response.")
+
+    def _get_connection(self, fresh=False):
+        if not fresh:
+            try:
+                return self._pool.get_nowait()
+            except queue.Empty:
+                pass
+        conn = self._connection_class(self._host, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.timeout)
+        return conn
+
+    def _put_connection(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
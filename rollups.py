@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+# Resolutions kept for the rooftop series, finest first, with the resample
+# rule and the spacing of the points in seconds. Raw obs come about once a minute.
+ROLLUPS = [
+    ('raw', None, 60),
+    ('10min', '10Min', 600),
+    ('30min', '30Min', 1800),
+    ('hourly', '1H', 3600),
+    ('daily', '1D', 86400)
+]
+# Most points the chart should get for the selected date span
+MAX_CHART_POINTS = 2000
+
+def rollup(obs, rule):
+    ''' Aggregates rooftop observations to one resolution. Rain is summed, Gust
+    is the max, Wind Direction is a circular mean, Temperature gets min/max
+    columns next to its mean and everything else is averaged.
+
+    Variables:
+        obs = observations with a DatetimeIndex, Temperature zeros already
+            replaced with NaN
+        rule = pandas resample rule, None keeps the raw observations
+
+    Returns:
+        df = float32 dataframe indexed by Time
+
+    '''
+    if rule is None:
+        df = obs.astype(np.float32)
+        df['Temperature Min'] = df['Temperature']
+        df['Temperature Max'] = df['Temperature']
+    else:
+        resampled = obs.resample(rule)
+        df = resampled.mean()
+        df['Rain'] = resampled['Rain'].sum(min_count=1)
+        df['Gust'] = resampled['Gust'].max()
+        df['Temperature Min'] = resampled['Temperature'].min()
+        df['Temperature Max'] = resampled['Temperature'].max()
+        # average the unit vectors so 350 and 10 degrees give 0, not 180
+        radians = np.deg2rad(obs['Wind Direction'])
+        sin = np.sin(radians).resample(rule).mean()
+        cos = np.cos(radians).resample(rule).mean()
+        df['Wind Direction'] = np.rad2deg(np.arctan2(sin, cos)) % 360
+    return df.astype(np.float32)
+
+def compute_rollups(raw):
+    ''' Computes every resolution in ROLLUPS once so chart callbacks only have
+    to pick one.
+
+    Variables:
+        raw = dataframe of raw observations with a Time column
+
+    Returns:
+        rollups = dictionary of resolution name -> dataframe
+
+    '''
+    obs = prepare_obs(raw)
+    return {name: rollup(obs, rule) for name, rule, _ in ROLLUPS}
+
+def prepare_obs(raw):
+    ''' Indexes raw observations by Time and cleans them up for rollup. '''
+    obs = raw.set_index('Time').sort_index()
+    # Temperature has weird zero values, drop them
+    obs['Temperature'] = obs['Temperature'].replace([0, 0.0], np.nan)
+    return obs
+
+def pick_resolution(start_date, end_date, max_points=MAX_CHART_POINTS):
+    ''' Picks the finest resolution that keeps the date span under max_points.
+
+    Variables:
+        start_date = start of the selected span
+        end_date = end of the selected span, inclusive of the whole day
+
+    Returns:
+        name = key into the dictionary from compute_rollups
+
+    '''
+    if start_date is None or end_date is None:
+        return '30min'
+    span = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).total_seconds() + 86400
+    for name, _, step in ROLLUPS:
+        if span / step <= max_points:
+            return name
+    return ROLLUPS[-1][0]
@@ -0,0 +1,198 @@
+import logging
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import fcntl
+except ImportError:
+    # no flock, e.g. on Windows, every process runs its own jobs
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+# Seconds between attempts of a follower to take over from the leader
+LEADER_RETRY = 5
+
+class Job:
+    ''' A source refreshed by the Scheduler, keeps the last good result.
+
+    Variables:
+        name = name of the job
+        func = callable doing the refresh, its return value is kept as the
+            job's snapshot
+        interval = seconds between successful runs
+        jitter = fraction of the delay randomly added or removed, so sources
+            on the same interval don't all fire at once
+        backoff = seconds before the first retry after a failure, doubling
+            with every failure after that
+        max_backoff = longest wait between retries, default is interval
+
+    '''
+    def __init__(self, name, func, interval, jitter=0.1, backoff=5, max_backoff=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.backoff = backoff
+        self.max_backoff = interval if max_backoff is None else max_backoff
+        # (value, updated) replaced as one, so readers never get a value
+        # with the update time of another
+        self.snapshot = (None, None)
+        self.failures = 0
+        self.next_run = 0
+        self.running = False
+        self.mtime = None
+
+    @property
+    def value(self):
+        return self.snapshot[0]
+
+    @property
+    def updated(self):
+        return self.snapshot[1]
+
+class Scheduler:
+    ''' In-process background scheduler. Runs every job on its own interval
+    on a small thread pool, so a slow source never holds up the others or
+    the callbacks reading their snapshots.
+
+    With a shared_dir several server processes share one set of jobs: the
+    process holding the lock file in it runs them and pickles every result
+    there, the others only read those snapshots and take over if the leader
+    goes away.
+
+    Variables:
+        max_workers = max number of jobs running at once
+        shared_dir = optional directory shared between processes
+
+    '''
+    def __init__(self, max_workers=4, shared_dir=None):
+        self.jobs = {}
+        self.shared_dir = shared_dir
+        self.leader = shared_dir is None or fcntl is None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+            thread_name_prefix='scheduler')
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock_file = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def add(self, name, func, interval, **kwargs):
+        ''' Adds a job, see Job for the arguments. It first runs as soon as
+        the scheduler is started.
+        '''
+        self.jobs[name] = Job(name, func, interval, **kwargs)
+        return self.jobs[name]
+
+    def latest(self, name):
+        ''' The last good result of a job, None if it hasn't succeeded yet. '''
+        job = self.jobs.get(name)
+        if job is None:
+            return None
+        if not self.leader:
+            self._read(job)
+        return job.value
+
+    def snapshot(self, name):
+        ''' The last good result of a job and when it was made, read together.
+        (None, None) if it hasn't succeeded yet.
+        '''
+        job = self.jobs.get(name)
+        if job is None:
+            return None, None
+        if not self.leader:
+            self._read(job)
+        return job.snapshot
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _elect(self):
+        ''' Tries to become the process running the jobs. '''
+        if self.leader:
+            return True
+        os.makedirs(self.shared_dir, exist_ok=True)
+        if self._lock_file is None:
+            self._lock_file = open(os.path.join(self.shared_dir, 'leader.lock'), 'a')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        # start from the snapshots the previous leader left
+        for job in self.jobs.values():
+            self._read(job)
+        self.leader = True
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if not self._elect():
+                self._stop.wait(LEADER_RETRY)
+                continue
+            now = time.monotonic()
+            for job in list(self.jobs.values()):
+                if not job.running and job.next_run <= now:
+                    job.running = True
+                    self._executor.submit(self._run, job)
+            waiting = [job.next_run for job in self.jobs.values() if not job.running]
+            self._stop.wait(min([1.0] + [max(0, t - now) for t in waiting]))
+
+    def _run(self, job):
+        delay = job.interval
+        try:
+            value = job.func()
+        except Exception:
+            job.failures += 1
+            delay = min(job.backoff * 2 ** (job.failures - 1), job.max_backoff)
+            logger.exception("Refreshing %s failed (%d in a row), retrying in %.0fs",
+                job.name, job.failures, delay)
+        else:
+            job.snapshot = (value, time.time())
+            job.failures = 0
+            try:
+                self._write(job)
+            except Exception:
+                logger.exception("Sharing %s with the other processes failed", job.name)
+        finally:
+            job.next_run = time.monotonic() + delay * (1 + random.uniform(-job.jitter, job.jitter))
+            job.running = False
+
+    def _path(self, job):
+        return os.path.join(self.shared_dir, job.name + '.pickle')
+
+    def _write(self, job):
+        if self.shared_dir is None:
+            return
+        os.makedirs(self.shared_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.shared_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(job.snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(job))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def _read(self, job):
+        ''' Picks up the leader's latest snapshot of a job. '''
+        try:
+            mtime = os.stat(self._path(job)).st_mtime
+            if mtime != job.mtime:
+                with open(self._path(job), 'rb') as f:
+                    job.snapshot = tuple(pickle.load(f))
+                job.mtime = mtime
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            pass
@@ -0,0 +1,159 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+
+from openweather import OPENWEATHER_GROUP_SIZE
+# Constants
+# Station registry, see load_stations for the format
+UW_STATIONS_FILE = os.environ.get('UW_STATIONS_FILE', 'stations.ini')
+# Max number of Openweather requests in flight during a batched refresh, the
+# client's rate limit applies on top
+STATION_MAX_WORKERS = 8
+
+logger = logging.getLogger(__name__)
+
+class Station:
+    ''' A location monitored by the dashboard.
+
+    Variables:
+        name = name shown in the station selector
+        query = Openweather city name query, default is name
+        city_id = Openweather city id, lets current weather be fetched for
+            many stations at once with group queries
+        lat, lon = coordinates for the forecast, looked up from the current
+            weather when not given
+
+    '''
+    def __init__(self, name, query=None, city_id=None, lat=None, lon=None):
+        self.name = name
+        self.query = query or name
+        self.city_id = city_id
+        self.lat = lat
+        self.lon = lon
+
+    @property
+    def coords(self):
+        return None if self.lat is None or self.lon is None else (self.lat, self.lon)
+
+# The ATG rooftop's city, used when there is no registry file
+DEFAULT_STATION = Station('Seattle', city_id=5809844, lat=47.6062, lon=-122.3321)
+
+def load_stations(path=UW_STATIONS_FILE):
+    ''' Reads the station registry, an ini file with one section per station:
+
+        [Seattle]
+        query = Seattle,US
+        id = 5809844
+        lat = 47.6062
+        lon = -122.3321
+
+    Every key is optional. Sections are kept in file order.
+
+    Returns:
+        stations = dictionary of name -> Station, just DEFAULT_STATION when
+        the file doesn't exist
+
+    '''
+    config = ConfigParser()
+    if not config.read(path):
+        return {DEFAULT_STATION.name: DEFAULT_STATION}
+    stations = {}
+    for name in config.sections():
+        section = config[name]
+        stations[name] = Station(name, query=section.get('query'),
+            city_id=section.getint('id'), lat=section.getfloat('lat'),
+            lon=section.getfloat('lon'))
+    return stations
+
+STATIONS = load_stations()
+
+def _run_batch(tasks):
+    ''' Runs (key, callable) tasks concurrently. Returns the results by key
+    and the errors, failed tasks are left out of the results.
+    '''
+    results, errors = {}, []
+    if not tasks:
+        return results, errors
+    with ThreadPoolExecutor(max_workers=min(STATION_MAX_WORKERS, len(tasks))) as executor:
+        futures = [(key, executor.submit(task)) for key, task in tasks]
+        for key, future in futures:
+            try:
+                results[key] = future.result()
+            except Exception as exc:
+                errors.append(exc)
+                logger.exception("Loading %s failed", key)
+    return results, errors
+
+def _raise_if_all_failed(results, errors):
+    if errors and not results:
+        raise errors[0]
+
+def load_current(client, stations, units='imperial', fresh=False):
+    ''' Current weather for many stations. Stations with a city id are
+    fetched OPENWEATHER_GROUP_SIZE at a time with group queries, so 50
+    stations cost 3 requests, and the rest one request each. All requests run
+    concurrently under the client's rate limit.
+
+    Variables:
+        client = openweather.OpenWeatherClient
+        stations = iterable of Station
+        units = Openweather units
+        fresh = skip the client's cache, e.g. for background refreshes
+
+    Returns:
+        current = dictionary of station name -> current weather response,
+        stations that failed are left out
+
+    '''
+    stations = list(stations)
+    grouped = [s for s in stations if s.city_id is not None]
+    tasks = [(('group', i), lambda chunk=grouped[i:i + OPENWEATHER_GROUP_SIZE]:
+        client.group([s.city_id for s in chunk], units, fresh))
+        for i in range(0, len(grouped), OPENWEATHER_GROUP_SIZE)]
+    tasks += [(s.name, lambda s=s: client.current(s.query, units, fresh))
+        for s in stations if s.city_id is None]
+    results, errors = _run_batch(tasks)
+
+    current = {}
+    for key, data in results.items():
+        if isinstance(key, tuple):
+            chunk = grouped[key[1]:key[1] + OPENWEATHER_GROUP_SIZE]
+            current.update((s.name, wx) for s, wx in zip(chunk, data) if wx is not None)
+        else:
+            current[key] = data
+    _raise_if_all_failed(current, errors)
+    return current
+
+def load_forecasts(client, stations, units='imperial', fresh=False, current=None):
+    ''' Forecasts for many stations, fetched concurrently under the client's
+    rate limit. Openweather has no batch forecast query, so this is one
+    request per station.
+
+    Variables:
+        client = openweather.OpenWeatherClient
+        stations = iterable of Station
+        units = Openweather units
+        fresh = skip the client's cache
+        current = optional result of load_current, used for the coordinates
+            of stations that don't have them
+
+    Returns:
+        forecasts = dictionary of station name -> forecast response, stations
+        that failed are left out
+
+    '''
+    current = current or {}
+
+    def fetch(station):
+        coords = station.coords
+        if coords is None and station.name in current:
+            coords = (current[station.name]['coord']['lat'],
+                current[station.name]['coord']['lon'])
+        if coords is None:
+            coords = client.coordinates(station.query, units)
+        return client.forecast(*coords, units=units, fresh=fresh)
+
+    results, errors = _run_batch([(s.name, lambda s=s: fetch(s)) for s in stations])
+    _raise_if_all_failed(results, errors)
+    return results
@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# uw_wx and friends read these at import, keep the tests off the real cache
+# and the real upstreams
+os.environ.setdefault('UW_CACHE_DIR', tempfile.mkdtemp(prefix='uw_wx_tests'))
+os.environ.setdefault('UW_DATA_URL', 'http://127.0.0.1:9/cgi-bin/uw.cgi?')
+os.environ.setdefault('UW_METRICS', '0')
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients giving up on a hanging request are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+@pytest.fixture
+def stub_server():
+    ''' Starts local HTTP stand-ins. Call it with a function taking the path
+    and returning (status, body bytes), it may sleep to play latency. Returns
+    the base URL, server.hits counts the requests.
+    '''
+    servers = []
+
+    def start(respond, keep_alive=False):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' if keep_alive else 'HTTP/1.0'
+
+            def do_GET(self):
+                with lock:
+                    server.hits.append(self.path)
+                    server.connections.add(self.client_address)
+                status, body = respond(self.path)
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        lock = threading.Lock()
+        server = _Server(('127.0.0.1', 0), Handler)
+        server.hits = []
+        server.connections = set()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,74 @@
+import tracemalloc
+
+import pandas as pd
+import pytest
+from flask import Flask
+
+import export
+from benchmark import make_obs
+from export import add_export_endpoint
+from history import HistoryStore
+from rollups import compute_rollups
+from uw_cache import SharedFrameCache
+
+# Days in the stub history at five minute obs, and the shorter export the
+# long one is compared to
+HISTORY_DAYS = 120
+SHORT_DAYS = 30
+# Most memory an export may take, whatever the range
+PEAK_BYTES = 8 * 2**20
+
+@pytest.fixture(scope='module')
+def exporter(tmp_path_factory):
+    obs = make_obs(HISTORY_DAYS + 7, interval=300)
+    recent_start = obs['Time'].iloc[-1].normalize() - pd.Timedelta(days=6)
+    store = HistoryStore(str(tmp_path_factory.mktemp('history')))
+    store.append(obs[obs['Time'] < recent_start])
+    frames = SharedFrameCache(lambda: compute_rollups(obs[obs['Time'] >= recent_start]))
+    frames.get()
+    server = Flask(__name__)
+    add_export_endpoint(server, history=store, frames=frames)
+    return server.test_client(), obs['Time'].iloc[-1].normalize()
+
+def stream(client, end, days, fmt):
+    ''' Reads an export of the last `days` days under tracemalloc, returns
+    its size in bytes and the peak memory.
+    '''
+    start = end - pd.Timedelta(days=days - 1)
+    url = '/export?start={:%Y-%m-%d}&end={:%Y-%m-%d}&format={}'.format(start, end, fmt)
+    tracemalloc.start()
+    try:
+        response = client.get(url, buffered=False)
+        assert response.status_code == 200
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return size, peak
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet', 'arrow'])
+def test_export_memory_does_not_grow_with_the_range(exporter, fmt):
+    if fmt != 'csv' and export._pyarrow() is None:
+        pytest.skip('needs pyarrow')
+    client, end = exporter
+    short_size, short_peak = stream(client, end, SHORT_DAYS, fmt)
+    size, peak = stream(client, end, HISTORY_DAYS, fmt)
+    assert size > 3 * short_size
+    # a chunk is held at a time, never the whole range
+    assert peak < 1.5 * short_peak
+    assert peak < PEAK_BYTES
+
+def test_csv_columns_and_precision(exporter):
+    client, end = exporter
+    url = '/export?start={:%Y-%m-%d}&end={:%Y-%m-%d}&resolution={}'
+    raw = client.get(url.format(end, end, 'raw')).get_data(as_text=True).splitlines()
+    hourly = client.get(url.format(end, end, 'hourly')).get_data(as_text=True).splitlines()
+    # min and max only mean something once aggregated
+    assert 'Temperature Min' not in raw[0]
+    assert 'Temperature Min' in hourly[0]
+    assert client.get(url.format(end, end, 'raw') + '&params=Temperature Max').status_code == 400
+    # no float32 noise like 52.099998
+    for line in raw[1:] + hourly[1:]:
+        for value in line.split(',')[1:]:
+            assert len(value.lstrip('-').replace('.', '').split('e')[0]) <= 6
@@ -0,0 +1,62 @@
+import gc
+import time
+
+import pandas as pd
+
+from benchmark import make_uw_page
+from uw_wx import get_uw_frame, parse_uw_day, parse_uw_page
+
+DAYS = 8
+SLOWEST = 0.6
+
+def test_concurrent_fetch_tracks_slowest_day(stub_server):
+    dates = pd.date_range('2023-05-01', periods=DAYS)
+    # the last day is the slowest, the rest add up to much more than it
+    delays = {d.strftime('%Y%m%d'): 0.3 for d in dates}
+    delays[dates[-1].strftime('%Y%m%d')] = SLOWEST
+    pages = {d.strftime('%Y%m%d'): make_uw_page(d, interval=600) for d in dates}
+
+    def respond(path):
+        day = path.split('?')[-1]
+        time.sleep(delays[day])
+        return 200, pages[day]
+    server, base = stub_server(respond)
+    url_str = base + '/cgi-bin/uw.cgi?'
+
+    # collect what earlier tests left behind, not while the fetch is timed
+    gc.collect()
+    tic = time.perf_counter()
+    df = get_uw_frame(dates, url_str, max_workers=DAYS)
+    elapsed = time.perf_counter() - tic
+
+    assert len(server.hits) == DAYS
+    assert df['Time'].is_monotonic_increasing
+    assert df['Time'].dt.normalize().nunique() == DAYS
+    # bounded by the slowest day, far below the sum of all of them
+    assert elapsed < SLOWEST + 0.5
+    assert elapsed < sum(delays.values()) / 2
+
+def test_sequential_fetch_adds_up(stub_server):
+    dates = pd.date_range('2023-05-01', periods=3)
+    page = make_uw_page(dates[0], interval=3600)
+
+    def respond(path):
+        time.sleep(0.2)
+        return 200, page
+    server, base = stub_server(respond)
+
+    tic = time.perf_counter()
+    get_uw_frame(dates, base + '/cgi-bin/uw.cgi?', max_workers=1)
+    assert time.perf_counter() - tic >= 0.6
+
+def test_parse_keeps_out_of_range_readings():
+    day = pd.Timestamp('2023-05-01')
+    lines = [b'  Time     RH  Temp  Dir  Speed  Gust  Rain   Rad    Pres',
+        b'           %   F     deg  knot   knot  in.    W/m2   hPa', b'-' * 56,
+        b'00:00:00  200   51  180    5    9   0.00    0.0  1012.3',
+        b'00:01:00  999   51  999  999    9   0.00    0.0  1012.3']
+    df = parse_uw_page(lines, day)
+    assert df['Relative Humidity'].tolist() == [200, 999]
+    assert df['Wind Direction'].tolist() == [180, 999]
+    assert df['Relative Humidity'].tolist() == [row['Relative Humidity']
+        for row in parse_uw_day(lines, day)]
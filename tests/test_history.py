@@ -0,0 +1,51 @@
+import os
+
+import pandas as pd
+import pytest
+
+from benchmark import make_obs
+from history import HistoryStore
+from rollups import ROLLUPS, prepare_obs, rollup
+
+@pytest.fixture
+def store(tmp_path):
+    # 70 days spans three monthly partitions
+    obs = make_obs(70, interval=300)
+    store = HistoryStore(str(tmp_path))
+    store.append(obs)
+    return store, obs['Time'].iloc[0].normalize(), obs['Time'].iloc[-1].normalize()
+
+def from_raw(store, start, end, resolution):
+    rule = dict((name, rule) for name, rule, _ in ROLLUPS)[resolution]
+    return rollup(prepare_obs(store.query(start, end)), rule)
+
+@pytest.mark.parametrize('resolution', [name for name, _, _ in ROLLUPS])
+def test_precomputed_rollups_match_the_raw_obs(store, resolution):
+    store, first, last = store
+    start, end = first + pd.Timedelta(days=3), last - pd.Timedelta(days=2)
+    pd.testing.assert_frame_equal(store.query_rollup(start, end, resolution),
+        from_raw(store, start, end, resolution), check_freq=False, rtol=1e-4)
+
+def test_rollups_are_read_without_the_raw_obs(store, monkeypatch):
+    store, first, last = store
+    monkeypatch.setattr(store, 'query', lambda *args: pytest.fail('read the raw obs'))
+    df = store.query_rollup(first, last, 'daily')
+    assert len(df) == (last - first).days
+
+def test_months_without_rollups_are_aggregated_from_raw(store):
+    store, first, last = store
+    want = store.query_rollup(first, last, 'hourly')
+    month = store.partitions()[1]
+    os.remove(store._path(month, 'rollup.hourly'))
+    pd.testing.assert_frame_equal(store.query_rollup(first, last, 'hourly'), want,
+        check_freq=False, rtol=1e-4)
+    store.write_rollups()
+    assert os.path.exists(store._path(month, 'rollup.hourly'))
+
+def test_appending_updates_the_rollups(store):
+    store, first, last = store
+    more = make_obs(1, interval=300)
+    more['Time'] += last + pd.Timedelta(days=1) - more['Time'].iloc[0].normalize()
+    store.append(more)
+    df = store.query_rollup(first, last + pd.Timedelta(days=2), 'daily')
+    assert df.index[-1] == last + pd.Timedelta(days=1)
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+import pytest
+from dash.exceptions import PreventUpdate
+
+from benchmark import make_obs, make_uw_page
+from live import LiveFeed
+
+DAY = pd.Timestamp('2023-05-01')
+
+def page_parts(day):
+    # header lines, observation lines and footer of a synthetic day page
+    lines = make_uw_page(day, interval=600).split(b'\n')[:-1]
+    return lines[:5], lines[5:-1], lines[-1]
+
+def join(*lines):
+    return b''.join(line + b'\n' for line in lines)
+
+@pytest.fixture
+def feed(stub_server):
+    pages = {}
+    server, base = stub_server(lambda path: (200, pages[path[-8:]]))
+    return LiveFeed(base + '/cgi-bin/uw.cgi?', timeout=5), pages
+
+def test_poll_tails_the_page(feed):
+    feed, pages = feed
+    header, rows, footer = page_parts(DAY)
+    key = DAY.strftime('%Y%m%d')
+
+    # not even a header yet
+    pages[key] = b'<HTML><BODY><PRE>\n'
+    assert not len(feed.poll(now=DAY))
+    # a header and no observations
+    pages[key] = join(*header)
+    assert not len(feed.poll(now=DAY))
+    # the last line is still being written
+    pages[key] = join(*header, *rows[:10]) + rows[10][:12]
+    new = feed.poll(now=DAY)
+    assert len(new) == 10
+    pages[key] = join(*header, *rows[:20], footer)
+    new = feed.poll(now=DAY)
+    assert len(new) == 10
+    assert new['Time'].iloc[0] == DAY + pd.Timedelta(minutes=100)
+    # nothing new, the footer isn't read as an observation
+    assert not len(feed.poll(now=DAY))
+    times = feed.since(pd.Timestamp.min)['Time']
+    assert len(times) == 20 and times.is_monotonic_increasing and times.is_unique
+
+def test_poll_starts_over_when_the_page_shrinks(feed):
+    feed, pages = feed
+    header, rows, footer = page_parts(DAY)
+    key = DAY.strftime('%Y%m%d')
+    pages[key] = join(*header, *rows[:20])
+    feed.poll(now=DAY)
+    pages[key] = join(*header, *rows[:5])
+    assert len(feed.poll(now=DAY)) == 5
+    assert len(feed.since(pd.Timestamp.min)) == 5
+
+def test_poll_starts_over_on_a_new_day(feed):
+    feed, pages = feed
+    next_day = DAY + pd.Timedelta(days=1)
+    for day in (DAY, next_day):
+        header, rows, footer = page_parts(day)
+        pages[day.strftime('%Y%m%d')] = join(*header, *rows[:30], footer)
+    feed.poll(now=DAY + pd.Timedelta(hours=23))
+    new = feed.poll(now=next_day + pd.Timedelta(minutes=5))
+    assert len(new) == 30
+    held = feed.since(pd.Timestamp.min)['Time']
+    assert len(held) == 30
+    assert (held.dt.normalize() == next_day).all()
+
+@pytest.fixture
+def extend(monkeypatch):
+    import app
+    today = {}
+    monkeypatch.setattr(app.SCHEDULER, 'latest', lambda name: today.get(name))
+    obs = make_obs(1)
+    first = obs['Time'].iloc[0]
+
+    def call(chart_end, cursor=None, until=None, parameter='Temperature'):
+        # the live snapshot is the day so far, up to until
+        today['live'] = obs if until is None else obs[obs['Time'] < first + until]
+        (update, _), cursor = app.extend_chart(1, parameter, chart_end, cursor)
+        return update['x'][0], update['y'][0], cursor
+    return call, first, obs
+
+def test_extend_without_a_chart_end_does_nothing(extend):
+    call, first, obs = extend
+    with pytest.raises(PreventUpdate):
+        call(None)
+
+def test_extend_raw_chart_appends_new_obs(extend):
+    call, first, obs = extend
+    end = [(first + pd.Timedelta(minutes=30)).isoformat(), 'raw']
+    x, y, cursor = call(end, until=pd.Timedelta(hours=1))
+    assert x[0] == '{:%Y-%m-%dT%H:%M:%S}'.format(first + pd.Timedelta(minutes=31))
+    assert len(x) == 29
+    x, y, cursor = call(end, cursor, until=pd.Timedelta(hours=2))
+    assert x[0] == '{:%Y-%m-%dT%H:%M:%S}'.format(first + pd.Timedelta(minutes=60))
+    with pytest.raises(PreventUpdate):
+        call(end, cursor, until=pd.Timedelta(hours=2))
+
+def test_extend_rolled_up_chart_appends_complete_buckets(extend):
+    call, first, obs = extend
+    # the chart's last 10 minute bucket starts at 00:30
+    end = [(first + pd.Timedelta(minutes=30)).isoformat(), '10min']
+    # obs up to 01:04, the 01:00 bucket is still filling
+    x, y, cursor = call(end, until=pd.Timedelta(minutes=65))
+    assert x == ['{:%Y-%m-%dT%H:%M:%S}'.format(first + pd.Timedelta(minutes=m))
+        for m in (40, 50)]
+    # the means of the buckets, not the raw obs
+    raw = obs.set_index('Time')['Temperature']
+    bucket = raw[first + pd.Timedelta(minutes=40):first + pd.Timedelta(minutes=49)]
+    assert y[0] == pytest.approx(bucket.replace(0, np.nan).mean(), abs=1e-3)
+    with pytest.raises(PreventUpdate):
+        call(end, cursor, until=pd.Timedelta(minutes=69))
+    # 01:10 arrives, the 01:00 bucket is complete and sent once
+    x, y, cursor = call(end, cursor, until=pd.Timedelta(minutes=71))
+    assert x == ['{:%Y-%m-%dT%H:%M:%S}'.format(first + pd.Timedelta(minutes=60))]
+    assert cursor['last'] == x[0]
@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from openweather import OpenWeatherClient, OpenWeatherError
+
+def weather_stub(stub_server, delay=0.0, keep_alive=True):
+    ''' Openweather stand-in answering every weather request with the number
+    of requests so far, 'Nowhere' with 404 and key 'bad' with 401.
+    '''
+    count = [0]
+    lock = threading.Lock()
+
+    def respond(path):
+        time.sleep(delay)
+        if 'appid=bad' in path:
+            return 401, b'{"cod": 401}'
+        if 'q=Nowhere' in path:
+            return 404, b'{"cod": "404"}'
+        with lock:
+            count[0] += 1
+            n = count[0]
+        return 200, json.dumps({'n': n, 'coord': {'lat': 47.6, 'lon': -122.3}}).encode()
+    server, base = stub_server(respond, keep_alive=keep_alive)
+    return server, base + '/data/2.5'
+
+def test_concurrent_callers_share_one_request(stub_server):
+    server, base = weather_stub(stub_server, delay=0.3)
+    client = OpenWeatherClient('x', base_url=base, rate_limit=None)
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        results = list(executor.map(lambda _: client.current('Seattle'), range(20)))
+    assert len(server.hits) == 1
+    assert all(result is results[0] for result in results)
+
+def test_responses_are_cached_for_the_ttl(stub_server):
+    server, base = weather_stub(stub_server)
+    client = OpenWeatherClient('x', base_url=base, ttl=0.3, rate_limit=None)
+    assert client.current('Seattle')['n'] == 1
+    assert client.current('Seattle')['n'] == 1
+    assert len(server.hits) == 1
+    time.sleep(0.4)
+    # expired, the stale response comes back while it is revalidated
+    assert client.current('Seattle')['n'] == 1
+    deadline = time.monotonic() + 5
+    while client.current('Seattle')['n'] == 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.current('Seattle')['n'] == 2
+    assert len(server.hits) == 2
+
+def test_fresh_skips_the_cache(stub_server):
+    server, base = weather_stub(stub_server)
+    client = OpenWeatherClient('x', base_url=base, rate_limit=None)
+    client.current('Seattle')
+    assert client.current('Seattle', fresh=True)['n'] == 2
+
+@pytest.mark.parametrize('api_key, query, code', [('bad', 'Seattle', 401),
+    ('x', 'Nowhere', 404)])
+def test_error_statuses_raise(stub_server, api_key, query, code):
+    server, base = weather_stub(stub_server)
+    client = OpenWeatherClient(api_key, base_url=base, rate_limit=None)
+    with pytest.raises(OpenWeatherError) as info:
+        client.current(query)
+    assert info.value.code == code
+    # not retried, asking again won't help
+    assert len(server.hits) == 1
+
+def test_connections_are_reused(stub_server):
+    server, base = weather_stub(stub_server)
+    client = OpenWeatherClient('x', base_url=base, ttl=0, rate_limit=None)
+    for _ in range(5):
+        client.current('Seattle')
+    assert len(server.hits) == 5
+    assert len(server.connections) == 1
+
+def test_coordinates_are_remembered(stub_server):
+    server, base = weather_stub(stub_server)
+    client = OpenWeatherClient('x', base_url=base, ttl=0, rate_limit=None)
+    assert client.coordinates('Seattle') == (47.6, -122.3)
+    client.coordinates('Seattle')
+    assert len(server.hits) == 1
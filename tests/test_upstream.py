@@ -0,0 +1,153 @@
+import json
+import socket
+import time
+
+import pytest
+
+from openweather import OpenWeatherClient
+from upstream import CircuitBreaker, CircuitOpenError, Upstream, UpstreamError, http_get
+from uw_cache import SharedFrameCache
+
+# Seconds a hanging stub holds a request, and the read timeout giving up on it
+HANG = 1.0
+TIMEOUT = 0.2
+
+def flaky_stub(stub_server, keep_alive=False):
+    ''' Stand-in answering 200 with a request count in its body, or playing
+    an outage while server.outage is '5xx' or 'hang'.
+    '''
+    def respond(path):
+        if server.outage == 'hang':
+            time.sleep(HANG)
+        if server.outage:
+            return 503, b'down'
+        return 200, json.dumps({'n': len(server.hits)}).encode()
+    server, base = stub_server(respond, keep_alive=keep_alive)
+    server.outage = None
+    return server, base
+
+def fast_upstream(**kwargs):
+    return Upstream('stub', max_wait=0.01, **kwargs)
+
+def get(upstream, base):
+    return upstream.call(http_get, base + '/', TIMEOUT, TIMEOUT)
+
+def test_transient_failures_are_retried(stub_server):
+    server, base = flaky_stub(stub_server)
+    server.outage = '5xx'
+    upstream = fast_upstream(attempts=3)
+    with pytest.raises(UpstreamError) as info:
+        get(upstream, base)
+    assert info.value.code == 503
+    assert len(server.hits) == 3
+    server.outage = None
+    assert json.loads(get(upstream, base)) == {'n': 4}
+
+def test_client_errors_are_not_retried(stub_server):
+    server, base = stub_server(lambda path: (404, b'nope'))
+    with pytest.raises(UpstreamError) as info:
+        get(fast_upstream(attempts=3), base)
+    assert info.value.code == 404
+    assert len(server.hits) == 1
+
+def test_hanging_source_times_out_and_stops_retrying(stub_server):
+    server, base = flaky_stub(stub_server)
+    server.outage = 'hang'
+    upstream = fast_upstream(attempts=5, max_delay=TIMEOUT * 2.5)
+    tic = time.monotonic()
+    with pytest.raises(socket.timeout):
+        get(upstream, base)
+    # the attempts stop once the max delay has passed, not after all five
+    assert len(server.hits) < 5
+    assert time.monotonic() - tic < 5 * TIMEOUT
+
+def test_breaker_opens_and_recovers(stub_server):
+    server, base = flaky_stub(stub_server)
+    breaker = CircuitBreaker('stub', threshold=2, reset=0.3)
+    upstream = fast_upstream(attempts=1, breaker=breaker)
+    server.outage = '5xx'
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            get(upstream, base)
+    assert breaker.state == 'open'
+    # failing fast, the source isn't asked
+    with pytest.raises(CircuitOpenError):
+        get(upstream, base)
+    assert len(server.hits) == 2
+
+    # half-open, a failed trial opens it again
+    time.sleep(0.35)
+    assert breaker.state == 'half-open'
+    with pytest.raises(UpstreamError):
+        get(upstream, base)
+    assert breaker.state == 'open'
+    assert len(server.hits) == 3
+
+    # a successful trial closes it
+    server.outage = None
+    time.sleep(0.35)
+    get(upstream, base)
+    assert breaker.state == 'closed'
+    get(upstream, base)
+    assert len(server.hits) == 5
+
+def test_open_circuit_is_not_retried(stub_server):
+    server, base = flaky_stub(stub_server)
+    breaker = CircuitBreaker('stub', threshold=1, reset=60)
+    upstream = fast_upstream(attempts=3, breaker=breaker)
+    server.outage = '5xx'
+    with pytest.raises(CircuitOpenError):
+        get(upstream, base)
+    assert len(server.hits) == 1
+
+@pytest.mark.parametrize('outage', ['5xx', 'hang'])
+def test_client_serves_stale_data_during_an_outage(stub_server, outage):
+    server, base = flaky_stub(stub_server, keep_alive=True)
+    client = OpenWeatherClient('x', base_url=base, ttl=0.05, timeout=TIMEOUT,
+        connect_timeout=TIMEOUT, rate_limit=None, upstream=fast_upstream(attempts=1))
+    stale = client.current('Seattle')
+    server.outage = outage
+    time.sleep(0.1)
+    for _ in range(20):
+        tic = time.monotonic()
+        assert client.current('Seattle') is stale
+        # answered from the cache, the revalidation runs in the background
+        assert time.monotonic() - tic < TIMEOUT
+        time.sleep(0.01)
+    assert len(server.hits) > 1
+
+def test_frame_cache_serves_stale_frame_while_loader_fails():
+    calls = []
+
+    def loader():
+        calls.append(time.monotonic())
+        if len(calls) > 1:
+            raise OSError('uw.cgi is down')
+        return {'raw': 'first'}
+    frames = SharedFrameCache(loader, max_age=0)
+    version = frames.revalidate()
+    assert frames.get() == {'raw': 'first'}
+    for _ in range(3):
+        time.sleep(0.05)
+        assert frames.revalidate() == version
+    assert frames.get() == {'raw': 'first'}
+    assert len(calls) > 1
+
+def test_url_helpers_go_through_the_shared_client(stub_server, monkeypatch):
+    import uw_wx
+    from openweather import OpenWeatherError
+    server, base = stub_server(lambda path: (404, b'{}') if 'Nowhere' in path
+        else (200, json.dumps({'coord': {'lat': 1.0, 'lon': 2.0}}).encode()))
+    client = OpenWeatherClient('x', base_url=base + '/data/2.5', rate_limit=None)
+    monkeypatch.setattr(uw_wx, 'OPENWEATHER_CLIENT', client)
+    url = 'http://api.openweathermap.org/data/2.5/weather?q=Seattle&units=imperial&appid=x'
+    weather = uw_wx.get_weather_data(url)
+    assert uw_wx.get_weather_data(url) is weather
+    uw_wx.get_forecast_data(weather, imperial=True)
+    # cached, and the client's key and base URL are used
+    assert server.hits == ['/data/2.5/weather?q=Seattle&units=imperial&appid=x',
+        '/data/2.5/forecast?lat=1.0&lon=2.0&units=imperial&appid=x']
+    with pytest.raises(OpenWeatherError) as info:
+        uw_wx.get_forecast_data({'coord': {'lat': 'Nowhere', 'lon': 0}})
+    assert info.value.code == 404
+    assert str(info.value).startswith('Forecast: ')
@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import pandas as pd
+
+from benchmark import make_uw_page
+from uw_cache import SharedFrameCache, UWDayCache
+from uw_wx import parse_uw_page
+
+def day_frame(date, interval=600):
+    return parse_uw_page(make_uw_page(date, interval).splitlines(), date)
+
+def test_truncated_final_day_is_not_cached(tmp_path):
+    cache = UWDayCache(str(tmp_path))
+    # recent enough not to be evicted, old enough to be final
+    full, cut, empty = pd.date_range(end=datetime.utcnow() - pd.Timedelta(days=5),
+        periods=3).normalize()
+    frames = {full: day_frame(full), cut: day_frame(cut).iloc[:50],
+        empty: day_frame(empty).iloc[:0]}
+    fetched = []
+
+    def fetch(dates):
+        fetched.append(list(dates))
+        return pd.concat([frames[date] for date in dates], ignore_index=True)
+
+    cache.load([full, cut, empty], fetch)
+    assert cache.get(full) is not None
+    assert cache.get(cut) is None
+    assert cache.get(empty) is None
+    # the incomplete days are asked for again
+    cache.load([full, cut, empty], fetch)
+    assert fetched[-1] == [cut, empty]
+
+def test_is_final_uses_utc_days():
+    day = datetime(2023, 5, 1)
+    assert not UWDayCache.is_final(day, now=datetime(2023, 5, 2, 0, 30))
+    assert UWDayCache.is_final(day, now=datetime(2023, 5, 2, 1, 0))
+
+def test_snapshot_frame_matches_version(tmp_path):
+    loads = []
+
+    def loader():
+        loads.append(len(loads))
+        return {'analytics': pd.DataFrame({'Rain': [float(len(loads))]})}
+
+    path = str(tmp_path / 'frame.pkl')
+    writer, reader = SharedFrameCache(loader, path=path), SharedFrameCache(loader, path=path)
+    versions = {}
+    for _ in range(3):
+        version = writer.refresh(force=True)
+        versions[version] = float(len(loads))
+        # the reader picks up each frame written by the other process
+        frame, version = reader.snapshot()
+        assert frame['analytics']['Rain'][0] == versions[version]
+        assert version == writer.latest()
+    assert len(loads) == 3
@@ -0,0 +1,32 @@
+import pandas as pd
+
+import uw_wx
+from benchmark import make_obs
+from history import HistoryStore
+from rollups import compute_rollups
+
+class FrameStub:
+    def __init__(self, frame):
+        self.frame = frame
+
+    def get(self):
+        return self.frame
+
+def test_uw_range_reads_history_and_recent_week(tmp_path, monkeypatch):
+    obs = make_obs(20, interval=600)
+    recent_start = obs['Time'].iloc[-1].normalize() - pd.Timedelta(days=6)
+    store = HistoryStore(str(tmp_path))
+    store.append(obs[obs['Time'] < recent_start])
+    recent = compute_rollups(obs[obs['Time'] >= recent_start])
+    monkeypatch.setattr(uw_wx, 'UW_HISTORY', store)
+    monkeypatch.setattr(uw_wx, 'UW_FRAME_CACHE', FrameStub(recent))
+
+    first = obs['Time'].iloc[0].normalize()
+    old = uw_wx.get_uw_range(first, recent_start - pd.Timedelta(days=2), 'hourly')
+    # ends before the recent week, none of it is read
+    assert old.index[-1] < recent_start - pd.Timedelta(days=1)
+    assert len(old) == 24 * ((recent_start - first).days - 1)
+
+    both = uw_wx.get_uw_range(first, obs['Time'].iloc[-1], 'hourly')
+    assert both.index.is_monotonic_increasing and both.index.is_unique
+    assert both.index[-1] == recent['hourly'].index[-1]
@@ -0,0 +1,62 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import verification
+from benchmark import make_obs
+from rollups import compute_rollups
+from verification import VERIFY_VARIABLES, verify_archive
+
+class ArchiveStub:
+    def __init__(self, forecasts):
+        self.forecasts = forecasts
+
+    def query(self, start, end):
+        valid = self.forecasts['Valid']
+        return self.forecasts[(valid >= start) & (valid < end)]
+
+def ramp_rollups(days):
+    # Temperature climbs a degree a minute, so its error is the time offset
+    raw = make_obs(days)
+    raw['Temperature'] = np.arange(1, len(raw) + 1, dtype=np.float32)
+    return raw['Time'].iloc[0], compute_rollups(raw)
+
+def forecasts_at(valid, first):
+    valid = pd.DatetimeIndex(valid)
+    df = pd.DataFrame({'Issued': valid - pd.Timedelta(hours=3), 'Valid': valid})
+    for col in VERIFY_VARIABLES:
+        df[col] = np.float32(0)
+    df['Temperature'] = ((valid - first) / pd.Timedelta(minutes=1) + 1).astype(np.float32)
+    return df
+
+@pytest.fixture
+def rooftop(monkeypatch):
+    first, rollups = ramp_rollups(3)
+    monkeypatch.setattr(verification, 'get_uw_range',
+        lambda start, end, resolution: rollups[resolution])
+    return first
+
+@pytest.mark.parametrize('resolution, most', [('raw', 0.01), ('hourly', 11)])
+def test_rollups_are_matched_by_bucket_centers(rooftop, resolution, most):
+    # 12:40 is nearest the 13:00 label but inside the 12:00 bucket
+    valid = rooftop + pd.Timedelta(days=1, hours=12, minutes=40)
+    result = verify_archive(ArchiveStub(forecasts_at([valid], rooftop)), rooftop,
+        rooftop + pd.Timedelta(days=2), resolution)
+    assert result['Count'].sum() == 1
+    assert abs(result['Temperature Bias'].iloc[0]) < most
+
+def test_days_without_rooftop_data_are_left_out(rooftop, caplog):
+    valid = [rooftop - pd.Timedelta(days=3, hours=-12), rooftop + pd.Timedelta(hours=12)]
+    with caplog.at_level(logging.WARNING, logger='verification'):
+        result = verify_archive(ArchiveStub(forecasts_at(valid, rooftop)),
+            rooftop - pd.Timedelta(days=5), rooftop + pd.Timedelta(days=2))
+    assert result['Count'].sum() == 1
+    assert 'only goes back to' in caplog.text
+
+def test_no_rooftop_data_raises(rooftop):
+    start = rooftop - pd.Timedelta(days=30)
+    with pytest.raises(ValueError):
+        verify_archive(ArchiveStub(forecasts_at([start], rooftop)), start,
+            start + pd.Timedelta(days=5))
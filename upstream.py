@@ -0,0 +1,160 @@
+import http.client
+import threading
+import time
+from urllib import parse
+
+from metrics import count_error
+# Constants
+# Attempts per call and the most seconds waited between two of them, the
+# waits are random up to an exponentially growing bound
+UPSTREAM_ATTEMPTS = 3
+UPSTREAM_MAX_WAIT = 4
+# No new attempt is made once a call has taken this many seconds, so a
+# source timing out doesn't hold callers for attempts * timeout
+UPSTREAM_MAX_DELAY = 15
+# Consecutive failed attempts that open a source's circuit, and the seconds
+# it stays open before one trial call is let through
+BREAKER_THRESHOLD = 5
+BREAKER_RESET = 30
+# Redirects followed by http_get
+MAX_REDIRECTS = 3
+
+class UpstreamError(Exception):
+    ''' Raised when an upstream source answers with an error status. '''
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+class CircuitOpenError(UpstreamError):
+    ''' Raised without calling the source while its circuit is open. '''
+
+def is_transient(exc):
+    ''' True for failures worth retrying and counting against the source:
+    timeouts, connection errors, 5xx and 429. A 404 or a bad API key won't go
+    away by asking again.
+    '''
+    if isinstance(exc, CircuitOpenError):
+        return False
+    if isinstance(exc, UpstreamError):
+        return exc.code is not None and (exc.code >= 500 or exc.code == 429)
+    return isinstance(exc, (OSError, http.client.HTTPException))
+
+class CircuitBreaker:
+    ''' Fails fast while a source is down. After `threshold` transient
+    failures in a row the circuit opens and calls raise CircuitOpenError
+    straight away. Once `reset` seconds have passed one trial call goes
+    through, closing the circuit if it succeeds and opening it again if not.
+    '''
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, reset=BREAKER_RESET):
+        self.name = name
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        self.opened = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened >= self.reset else 'open'
+
+    def call(self, func, *args, **kwargs):
+        with self._lock:
+            if self.opened is not None:
+                if self._trial or time.monotonic() - self.opened < self.reset:
+                    count_error(self.name + '_circuit_open')
+                    raise CircuitOpenError(f"{self.name} is unavailable, not retrying "
+                        f"for {self.reset}s")
+                self._trial = True
+        try:
+            result = func(*args, **kwargs)
+        except Exception as exc:
+            with self._lock:
+                self._trial = False
+                if is_transient(exc):
+                    self.failures += 1
+                    if self.opened is not None or self.failures >= self.threshold:
+                        self.opened = time.monotonic()
+                else:
+                    self._close()
+            raise
+        with self._lock:
+            self._trial = False
+            self._close()
+        return result
+
+    def _close(self):
+        self.failures = 0
+        self.opened = None
+
+class Upstream:
+    ''' Retry and circuit breaker policy for one upstream source. Transient
+    failures are retried with jittered exponential backoff, every attempt
+    goes through the source's circuit breaker and an open circuit is never
+    retried.
+
+    Variables:
+        name = source name, e.g. "uw.cgi"
+        attempts = max attempts per call
+        max_wait = most seconds waited between attempts
+        max_delay = seconds into a call after which it isn't retried
+        breaker = CircuitBreaker, default is a new one
+
+    '''
+    def __init__(self, name, attempts=UPSTREAM_ATTEMPTS, max_wait=UPSTREAM_MAX_WAIT,
+        max_delay=UPSTREAM_MAX_DELAY, breaker=None):
+        self.name = name
+        self.attempts = attempts
+        self.max_wait = max_wait
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(name) if breaker is None else breaker
+        self._retrying = None
+
+    def call(self, func, *args, **kwargs):
+        ''' Calls func(*args, **kwargs) under the policy. '''
+        if self._retrying is None:
+            self._retrying = self._make_retrying()
+        return self._retrying(self.breaker.call, func, *args, **kwargs)
+
+    def _make_retrying(self):
+        # tenacity is imported on the first call, it isn't needed to start up
+        from tenacity import (Retrying, retry_if_exception, stop_after_attempt,
+            stop_after_delay, wait_random_exponential)
+        stop = stop_after_attempt(self.attempts) | stop_after_delay(self.max_delay)
+        return Retrying(stop=stop,
+            wait=wait_random_exponential(multiplier=0.5, max=self.max_wait),
+            retry=retry_if_exception(is_transient), reraise=True)
+
+def http_get(url, connect_timeout, read_timeout):
+    ''' GETs a URL with separate timeouts for connecting and for each read,
+    so a server that accepts the connection and then hangs is given up on.
+
+    Returns:
+        body = the response body as bytes
+
+    '''
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = parse.urlsplit(url)
+        connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+            else http.client.HTTPConnection)
+        conn = connection_class(parts.netloc, timeout=connect_timeout)
+        try:
+            conn.connect()
+            conn.sock.settimeout(read_timeout)
+            path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+            conn.request('GET', path)
+            response = conn.getresponse()
+            body = response.read()
+        finally:
+            conn.close()
+        location = response.getheader('Location')
+        if response.status in (301, 302, 303, 307, 308) and location:
+            url = parse.urljoin(url, location)
+            continue
+        if response.status != 200:
+            raise UpstreamError(f"{parts.netloc} answered {response.status}",
+                response.status)
+        return body
+    raise UpstreamError(f"Too many redirects from {url}")
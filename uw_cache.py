@@ -0,0 +1,372 @@
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from metrics import count_cache
+# Constants
+# Narrow dtypes keep a year of one-minute obs around 18 MB. Integer columns are
+# wide enough for sentinel values like 999, a narrower cast would wrap them
+UW_DTYPES = {
+    'Time': 'datetime64[ns]',
+    'Relative Humidity': np.int16,
+    'Temperature': np.float32,
+    'Wind Direction': np.int16,
+    'Wind Speed': np.int16,
+    'Gust': np.float32,
+    'Rain': np.float32,
+    'Radiation': np.float32,
+    'Pressure': np.float32
+}
+UW_COLUMNS = list(UW_DTYPES)
+# A uw.cgi day page stops changing once its UTC day is over, the grace period
+# covers late observations showing up around the rollover.
+FINAL_GRACE = timedelta(hours=1)
+# A final day is only cached if its last observation is at least this far
+# into the day, an empty or cut short page from an upstream hiccup would
+# otherwise be served for good
+FINAL_MIN_COVERAGE = timedelta(hours=23, minutes=30)
+
+logger = logging.getLogger(__name__)
+
+class UWDayCache:
+    ''' On-disk cache of parsed ATG rooftop observations, one columnar .npz
+    file per finalized UTC day.
+
+    Variables:
+        cache_dir = directory holding the day files
+        max_age = days older than this are evicted
+        max_bytes = total size of the cache before the oldest days are evicted
+
+    '''
+    def __init__(self, cache_dir, max_age=timedelta(days=30), max_bytes=50 * 2**20):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+
+    def path(self, date):
+        return os.path.join(self.cache_dir, date.strftime('%Y%m%d') + '.npz')
+
+    @staticmethod
+    def is_final(date, now=None):
+        ''' True once a day's uw.cgi page can no longer change. '''
+        now = datetime.utcnow() if now is None else now
+        day = datetime(date.year, date.month, date.day)
+        return day + timedelta(days=1) + FINAL_GRACE <= now
+
+    @staticmethod
+    def is_complete(date, df):
+        ''' True if a day's observations reach close to its end. '''
+        if not len(df):
+            return False
+        day = pd.Timestamp(date).normalize()
+        return df['Time'].iloc[-1] >= day + FINAL_MIN_COVERAGE
+
+    def get(self, date):
+        ''' Reads a cached day, returns None on a miss. '''
+        try:
+            with np.load(self.path(date), allow_pickle=False) as f:
+                return pd.DataFrame({col: f[col].astype(dtype, copy=False)
+                    for col, dtype in UW_DTYPES.items()}, columns=UW_COLUMNS)
+        except (IOError, KeyError, ValueError):
+            return None
+
+    def put(self, date, df):
+        ''' Writes a day to the cache, the file is swapped in atomically so
+        readers never see a partial day.
+        '''
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **{col: np.asarray(df[col].values) for col in UW_COLUMNS})
+            os.replace(tmp, self.path(date))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def invalidate(self, dates=None):
+        ''' Drops the given days from the cache, or every day if dates is None. '''
+        if dates is None:
+            dates = [day for day, _, _ in self._entries()]
+        for date in dates:
+            try:
+                os.remove(self.path(date))
+            except OSError:
+                pass
+
+    def evict(self, now=None):
+        ''' Removes days older than max_age, then the oldest days until the
+        cache fits in max_bytes.
+        '''
+        now = datetime.utcnow() if now is None else now
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for day, path, size in entries:
+            if day >= now - self.max_age and total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def load(self, dates, fetch, force_refresh=False):
+        ''' Loads the observations for dates, reading finalized days from disk
+        and fetching the rest.
+
+        Variables:
+            dates = days to load
+            fetch = callable taking a list of days and returning a dataframe
+                of their observations, e.g. uw_wx.get_uw_frame
+            force_refresh = refetch every day even if it is cached
+
+        Returns:
+            df = dataframe with the observations for dates in time order
+
+        '''
+        frames = {}
+        if not force_refresh:
+            for date in dates:
+                if self.is_final(date):
+                    frames[date] = self.get(date)
+        missing = [date for date in dates if frames.get(date) is None]
+        count_cache('uw_day', True, len(dates) - len(missing))
+        count_cache('uw_day', False, len(missing))
+        if missing:
+            fetched = fetch(missing)
+            days = fetched['Time'].dt.normalize()
+            for date in missing:
+                frames[date] = fetched[days == pd.Timestamp(date).normalize()]
+                if self.is_final(date) and self.is_complete(date, frames[date]):
+                    self.put(date, frames[date])
+            self.evict()
+        return pd.concat([frames[date] for date in dates], ignore_index=True)
+
+    def _entries(self):
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return []
+        entries = []
+        for name in names:
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                day = datetime.strptime(name[:-4], '%Y%m%d')
+            except ValueError:
+                continue
+            entries.append((day, path, os.path.getsize(path)))
+        return entries
+
+class SharedFrameCache:
+    ''' Process-wide cache of the latest rooftop data, a dataframe or a
+    dictionary of them. Callbacks share one copy of the frame and the browser
+    only holds its version token, and
+    concurrent refreshes wait on the one in flight instead of each loading
+    their own copy.
+
+    With a path the frame is also written to disk, so several server
+    processes can pick up a frame another one already loaded. Dataframes of
+    one numeric dtype (all the rollups) are saved as .npy files in a new
+    directory per version and memory-mapped by every process, so N workers
+    share one copy in the page cache. The small file at path points to the
+    current directory and is swapped in atomically.
+
+    Variables:
+        loader = callable returning fresh data, e.g. uw_wx.load_uw_rollups
+        max_age = seconds a loaded frame is reused before refresh reloads it
+        path = optional file shared between processes
+
+    '''
+    def __init__(self, loader, max_age=60, path=None):
+        self.loader = loader
+        self.max_age = max_age
+        self.path = path
+        # (frame, version) replaced as one, see snapshot
+        self._snapshot = (None, None)
+        self._stamp = 0
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._revalidating = threading.Event()
+
+    @property
+    def version(self):
+        return self._snapshot[1]
+
+    @property
+    def _frame(self):
+        return self._snapshot[0]
+
+    def refresh(self, force=False):
+        ''' Reloads the frame if it is older than max_age (or force is set)
+        and returns the current version token.
+        '''
+        with self._lock:
+            self._sync()
+            stale = force or self._frame is None or time.time() - self._stamp > self.max_age
+            count_cache('uw_frame', not stale)
+            if stale:
+                self._set(self.loader(), self._new_version())
+                self._write()
+            return self.version
+
+    def latest(self):
+        ''' Returns the current version token without reloading, unless
+        nothing has been loaded yet.
+        '''
+        version = self._current()[1]
+        return self.refresh() if version is None else version
+
+    def revalidate(self):
+        ''' Stale-while-revalidate: returns the current version token straight
+        away and, when the frame is older than max_age, reloads it on a
+        background thread. Only waits when nothing has been loaded yet.
+        '''
+        version = self._current()[1]
+        if version is None:
+            return self.refresh()
+        if time.time() - self._stamp > self.max_age and not self._revalidating.is_set():
+            self._revalidating.set()
+            threading.Thread(target=self._revalidate, daemon=True).start()
+        return version
+
+    def _revalidate(self):
+        try:
+            self.refresh()
+        except Exception:
+            # the last good frame stays, the next call tries again
+            logger.exception("Reloading the shared frame failed")
+        finally:
+            self._revalidating.clear()
+
+    def peek(self):
+        ''' Returns the current version token, None if nothing is loaded yet.
+        Never loads or waits on a load.
+        '''
+        return self._current()[1]
+
+    def snapshot(self):
+        ''' Returns the latest frame and its version token from one read, so
+        the frame is always the one the token names. Loads on first use.
+        '''
+        snapshot = self._current()
+        if snapshot[0] is None:
+            self.refresh()
+            snapshot = self._snapshot
+        return snapshot
+
+    def get(self):
+        ''' Returns the latest frame, loading it on first use. '''
+        return self.snapshot()[0]
+
+    def _current(self):
+        # a refresh holds the lock while it loads, readers meanwhile get the
+        # frame being replaced instead of waiting
+        if self._lock.acquire(blocking=False):
+            try:
+                self._sync()
+            finally:
+                self._lock.release()
+        return self._snapshot
+
+    def _set(self, frame, version, stamp=None):
+        self._snapshot = (frame, version)
+        self._stamp = time.time() if stamp is None else stamp
+
+    @staticmethod
+    def _new_version():
+        return datetime.utcnow().strftime('%Y%m%dT%H%M%S.%f')
+
+    def _sync(self):
+        ''' Picks up a frame written by another process. '''
+        if self.path is None:
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                shared = pickle.load(f)
+            if shared['version'] == self.version:
+                self._mtime = mtime
+                return
+            frame = shared['frame']
+            if shared.get('layout') is not None:
+                frame = _load_frames(shared['dir'], shared['layout'])
+        except (IOError, EOFError, ValueError, KeyError, pickle.UnpicklingError):
+            return
+        self._mtime = mtime
+        self._set(frame, shared['version'], mtime)
+
+    def _write(self):
+        if self.path is None:
+            return
+        cache_dir = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(cache_dir, exist_ok=True)
+        frame, version = self._snapshot
+        data_dir = '{}.{}'.format(os.path.abspath(self.path), version)
+        layout = _dump_frames(frame, data_dir)
+        shared = {'version': version, 'dir': data_dir, 'layout': layout,
+            'frame': frame if layout is None else None}
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(shared, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self._mtime = os.stat(self.path).st_mtime
+        if layout is not None:
+            # serve the mapped copy here too, the loaded one can go
+            self._snapshot = (_load_frames(data_dir, layout), version)
+        self._clean(data_dir)
+
+    def _clean(self, current):
+        # keep the previous version, another process may still be mapping it;
+        # files already mapped stay readable after they are deleted
+        prefix = os.path.basename(self.path) + '.'
+        cache_dir = os.path.dirname(current)
+        old = sorted(os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+            if name.startswith(prefix))
+        for data_dir in old[:-2]:
+            if data_dir != current:
+                shutil.rmtree(data_dir, ignore_errors=True)
+
+def _dump_frames(frame, data_dir):
+    ''' Saves a dataframe, or a dictionary of them, as a values and an index
+    .npy file per frame. Returns the layout _load_frames needs, or None if a
+    frame can't be saved this way (mixed or non-numeric dtypes).
+    '''
+    frames = frame if isinstance(frame, dict) else {None: frame}
+    for df in frames.values():
+        if (not isinstance(df, pd.DataFrame) or len(set(df.dtypes)) != 1
+                or df.dtypes.iloc[0].kind not in 'fiu'):
+            return None
+    os.makedirs(data_dir, exist_ok=True)
+    layout = {}
+    for i, (name, df) in enumerate(frames.items()):
+        np.save(os.path.join(data_dir, '{}.values.npy'.format(i)),
+            np.ascontiguousarray(df.values))
+        np.save(os.path.join(data_dir, '{}.index.npy'.format(i)), df.index.values)
+        layout[name] = (i, list(df.columns), df.index.name)
+    return layout
+
+def _load_frames(data_dir, layout):
+    ''' Memory-maps the frames saved by _dump_frames, read-only. '''
+    frames = {}
+    for name, (i, columns, index_name) in layout.items():
+        values = np.load(os.path.join(data_dir, '{}.values.npy'.format(i)), mmap_mode='r')
+        index = pd.Index(np.load(os.path.join(data_dir, '{}.index.npy'.format(i))),
+            name=index_name)
+        frames[name] = pd.DataFrame(values, index=index, columns=columns, copy=False)
+    return frames[None] if list(frames) == [None] else frames
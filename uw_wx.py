@@ -1,93 +1,332 @@
 import numpy as np
 import pandas as pd
 from datetime import datetime,timedelta
-from urllib import parse, request, error
 from configparser import ConfigParser
-import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import os
+from urllib import parse
+from analytics import DailyAnalytics
+from history import HistoryStore
+from metrics import count_bytes, timed
+from openweather import OpenWeatherClient, OpenWeatherError
+from rollups import compute_rollups
+from uw_cache import SharedFrameCache, UWDayCache, UW_DTYPES
+from upstream import Upstream, http_get
 # Constants
 BASE_WEATHER_API_URL = "http://api.openweathermap.org/data/2.5/weather"
 BASE_FORECAST_API_URL = "http://api.openweathermap.org/data/2.5/forecast"
+UW_DATA_URL = os.environ.get('UW_DATA_URL',
+    "https://a.atmos.washington.edu/cgi-bin/uw.cgi?")
+# Max number of uw.cgi day pages fetched at once, seconds to connect and to
+# wait on each read
+UW_MAX_WORKERS = 8
+UW_CONNECT_TIMEOUT = 5
+UW_TIMEOUT = 30
+# Retries and circuit breaker shared by every uw.cgi request
+UW_UPSTREAM = Upstream('uw.cgi')
+# Parsed finalized days are kept here between refreshes
+UW_CACHE_DIR = os.environ.get('UW_CACHE_DIR', '.uw_cache')
+UW_DAY_CACHE = UWDayCache(UW_CACHE_DIR)
+# Fast start mode, the dashboard is served straight away from the last
+# snapshot and callbacks never wait on upstream data
+UW_FAST_START = os.environ.get('UW_FAST_START', '0') != '0'
+# Seconds the loaded rooftop frame is shared before a refresh reloads it, and
+# an optional file to share it between server processes. Fast start keeps one
+# in the cache dir by default as the snapshot for the next start
+UW_FRAME_MAX_AGE = 60
+UW_SHARED_CACHE = os.environ.get('UW_SHARED_CACHE',
+    os.path.join(UW_CACHE_DIR, 'rollups.pickle') if UW_FAST_START else None)
+# Long-history mode, fill it with `python history.py backfill START`
+UW_HISTORY_DIR = os.environ.get('UW_HISTORY_DIR')
+UW_HISTORY = HistoryStore(UW_HISTORY_DIR) if UW_HISTORY_DIR else None
+# Daily summaries and anomalies, updated with every refresh
+UW_ANALYTICS = DailyAnalytics(os.path.join(UW_CACHE_DIR, 'analytics.npz'))
+
+def get_uw_dates():
+    ''' Makes the range of days covered by the dashboard, the past week up to
+    the current UTC day.
+
+    Returns:
+        dates = pandas DatetimeIndex with one entry per uw.cgi day page
+
+    '''
+    # the same clock as UWDayCache.is_final, uw.cgi pages are UTC days
+    end=datetime.utcnow()
+    start=end - timedelta(weeks=1)
+    return pd.date_range(start=start, end=end)
+
+def fetch_uw_day(date, url_str=UW_DATA_URL, timeout=UW_TIMEOUT):
+    ''' Downloads a single uw.cgi day page from the ATG rooftop station.
+
+    Variables:
+        date = the day to fetch
+        url_str = base uw.cgi URL, the date is appended as YYYYMMDD
+        timeout = read timeout in seconds
+
+    Returns:
+        lines = list of raw byte lines from the page
+
+    '''
+    return fetch_uw_page(date, url_str, timeout).splitlines()
+
+def fetch_uw_page(date, url_str=UW_DATA_URL, timeout=UW_TIMEOUT):
+    ''' Same as fetch_uw_day but returns the page as one bytes object. '''
+    url = url_str + date.strftime("%Y%m%d")
+    page = UW_UPSTREAM.call(http_get, url, UW_CONNECT_TIMEOUT, timeout)
+    count_bytes('uw.cgi', len(page))
+    return page
+
+def parse_uw_day(lines, data_date):
+    ''' Parses the raw lines of one uw.cgi day page into observation records.
 
-def get_uw_data():
-    ''' Uses request to get the past week of obs from the ATG Rooftop Wx station
     Variables:
-        start = start date, default is NOW constant
-        end = end date, default is THEN constant (1 week before now)
+        lines = iterable of raw byte lines from fetch_uw_day
+        data_date = the day the page belongs to
 
     Returns:
-        generator for loading the data into a dataframe.
+        generator of observation dictionaries
 
     '''
-    start=datetime.now() - timedelta(weeks=1)
-    end=datetime.now() + timedelta(hours=7)
-    # Change the date ranges in 'dates' for the ones you're interested in
-    dates = pd.date_range(start=start, end=end)
-    dates_str = dates.strftime("%Y%m%d")
-    url_str = "https://a.atmos.washington.edu/cgi-bin/uw.cgi?"
-
-    for i in range(len(dates)):
-        url = url_str + dates_str[i]
-        with request.urlopen(url) as f:
-            # lop off header
-            for header in f :
-                if 'knot' in str(header):
-                    break
-            f.readline()
-
-            data_date = dates[i]
-
-            for record in f:
-                fields = record.decode().strip().split()
-
-                if len(fields) != 9:
-                    continue
-
-                # parse time and convert to a datetime
-                t = datetime.strptime(fields[0], '%H:%M:%S')
-                delta = timedelta()
-
-                dt = data_date.replace(hour=t.hour, minute=t.minute, second=t.second, microsecond=0)
-                observation_time = dt - delta
-
-                data = {
-                    'Time': observation_time,
-                    'Relative Humidity': int(fields[1]),
-                    'Temperature': int(fields[2]),
-                    'Wind Direction': int(fields[3]),
-                    'Wind Speed': int(fields[4]),
-                    'Gust': int(fields[5]),
-                    'Rain': float(fields[6]),
-                    'Radiation': float(fields[7]),
-                    'Pressure': float(fields[8])
-                }
-                yield data
-
-def load_uw_data():
+    lines = iter(lines)
+    # lop off header
+    for header in lines:
+        if 'knot' in str(header):
+            break
+    next(lines, None)
+
+    for record in lines:
+        fields = record.decode().strip().split()
+
+        if len(fields) != 9:
+            continue
+
+        # parse time and convert to a datetime
+        t = datetime.strptime(fields[0], '%H:%M:%S')
+        delta = timedelta()
+
+        dt = data_date.replace(hour=t.hour, minute=t.minute, second=t.second, microsecond=0)
+        observation_time = dt - delta
+
+        data = {
+            'Time': observation_time,
+            'Relative Humidity': int(fields[1]),
+            'Temperature': int(fields[2]),
+            'Wind Direction': int(fields[3]),
+            'Wind Speed': int(fields[4]),
+            'Gust': int(fields[5]),
+            'Rain': float(fields[6]),
+            'Radiation': float(fields[7]),
+            'Pressure': float(fields[8])
+        }
+        yield data
+
+def parse_uw_page(lines, data_date):
+    ''' Bulk version of parse_uw_day. Finds the header once and parses the
+    whole body in one columnar pass with numpy instead of building a dict per
+    record. Rows without exactly 9 fields are skipped, same as parse_uw_day.
+
+    Variables:
+        lines = iterable of raw byte lines from fetch_uw_day
+        data_date = the day the page belongs to
+
+    Returns:
+        df = dataframe with typed observation columns
+
+    '''
+    lines = iter(lines)
+    # lop off header
+    for header in lines:
+        if b'knot' in header:
+            break
+    next(lines, None)
+    return parse_uw_rows(lines, data_date)
+
+def parse_uw_rows(lines, data_date):
+    ''' The columnar part of parse_uw_page, for lines that are already past
+    the header.
+
+    Variables:
+        lines = iterable of raw byte lines
+        data_date = the day the lines belong to
+
+    Returns:
+        df = dataframe with typed observation columns
+
+    '''
+    rows = [fields for fields in map(bytes.split, lines) if len(fields) == 9]
+    if not rows:
+        return pd.DataFrame({col: pd.Series(dtype=dtype)
+            for col, dtype in UW_DTYPES.items()}, columns=list(UW_DTYPES))
+    table = np.array(rows)
+
+    # HH:MM:SS -> seconds with integer arithmetic on the digits
+    clock = table[:, 0]
+    if ((np.char.str_len(clock) == 8).all()
+            and (np.char.count(clock, b':') == 2).all()):
+        digits = clock.astype('S8').view(np.uint8).reshape(-1, 8).astype(np.int64) - ord('0')
+        seconds = ((digits[:, 0] * 10 + digits[:, 1]) * 3600
+            + (digits[:, 3] * 10 + digits[:, 4]) * 60
+            + digits[:, 6] * 10 + digits[:, 7])
+        offsets = seconds.astype('timedelta64[s]')
+    else:
+        offsets = pd.to_timedelta(np.char.decode(clock)).values
+    day = np.datetime64(pd.Timestamp(data_date).normalize().to_datetime64(), 's')
+
+    data = {'Time': (day + offsets).astype('datetime64[ns]')}
+    for i, (col, dtype) in enumerate(list(UW_DTYPES.items())[1:], start=1):
+        data[col] = table[:, i].astype(dtype)
+    return pd.DataFrame(data, columns=list(UW_DTYPES))
+
+def _fetch_uw_pages(dates, url_str, max_workers, timeout):
+    ''' Yields (date, lines) for each uw.cgi day page in the order of dates,
+    downloading up to max_workers pages at once.
+    '''
+    if max_workers is None or max_workers <= 1:
+        for data_date in dates:
+            yield data_date, fetch_uw_day(data_date, url_str, timeout)
+        return
+
+    fetch = lambda data_date: fetch_uw_day(data_date, url_str, timeout)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(dates)))) as executor:
+        # map hands the pages back in the order of dates
+        yield from zip(dates, executor.map(fetch, dates))
+
+@timed('get_uw_data')
+def get_uw_data(dates=None, url_str=UW_DATA_URL, max_workers=UW_MAX_WORKERS,
+    timeout=UW_TIMEOUT):
+    ''' Uses request to get the past week of obs from the ATG Rooftop Wx station.
+    The day pages are downloaded in parallel on a bounded thread pool, so a
+    refresh costs about as much as the slowest day instead of the sum of all of
+    them.
+
+    Variables:
+        dates = days to fetch, default is the past week from get_uw_dates
+        url_str = base uw.cgi URL
+        max_workers = max number of concurrent requests, 1 fetches one day
+            after another
+        timeout = read timeout in seconds
+
+    Returns:
+        generator for loading the data into a dataframe, in time order.
+
+    '''
+    if dates is None:
+        dates = get_uw_dates()
+    for data_date, lines in _fetch_uw_pages(dates, url_str, max_workers, timeout):
+        yield from parse_uw_day(lines, data_date)
+
+@timed('get_uw_frame')
+def get_uw_frame(dates=None, url_str=UW_DATA_URL, max_workers=UW_MAX_WORKERS,
+    timeout=UW_TIMEOUT):
+    ''' Same as get_uw_data but parses each page with the bulk parser and
+    returns a dataframe directly.
+
+    Returns:
+        df = dataframe of observations in time order
+
+    '''
+    if dates is None:
+        dates = get_uw_dates()
+    frames = [parse_uw_page(lines, data_date)
+        for data_date, lines in _fetch_uw_pages(dates, url_str, max_workers, timeout)]
+    if not frames:
+        return parse_uw_page([], None)
+    return pd.concat(frames, ignore_index=True)
+
+@timed('load_uw_data')
+def load_uw_data(force_refresh=False):
     ''' Loads the data from the ATG rooftop by calling the get_uw_data function.
-    Also formats the dataframe
+    Finalized days come from the on-disk day cache, so usually only today (and
+    yesterday around the UTC rollover) is downloaded. Also formats the dataframe
+
+    Variables:
+        force_refresh = refetch every day instead of reading the cache
 
     Returns:
-        df = dataframe with UW ATG rooftop weather data for the past
-        week from the current time
+        df = float32 dataframe with UW ATG rooftop weather data for the past
+        week from the current time, indexed by Time, with an integer Day key
+        (days since 1970-01-01)
 
     '''
-    df = pd.DataFrame(get_uw_data())
+    df = UW_DAY_CACHE.load(get_uw_dates(), get_uw_frame, force_refresh=force_refresh)
     # Takes 10-min averages by resampling
 #     df.index = pd.to_datetime(df.Time)
 #     df = df.resample(rule = '10Min').mean()
-    # Modify the datetime objects and make a new column for dates.
-    df['Time'] = pd.to_datetime(df['Time'])
     # Resample for 30mins to smooth everything out.
-    df = df.resample(rule='30Min', on='Time').mean()
-    df['Time'] = df.index
-    df['Date'] = pd.to_datetime(df['Time']).dt.date
+    df = df.resample(rule='30Min', on='Time').mean().astype(np.float32)
+    df['Day'] = df.index.values.astype('datetime64[D]').astype(np.int32)
     # Temperature has weird zero values, drop them
-    df['Temperature'].replace([0, 0.0], np.nan, inplace=True)
+    df['Temperature'] = df['Temperature'].replace([0, 0.0], np.nan)
 
     return df
 
+@timed('load_uw_rollups')
+def load_uw_rollups(force_refresh=False):
+    ''' Loads the raw ATG rooftop obs like load_uw_data and precomputes every
+    resolution in rollups.ROLLUPS from them, plus the daily analytics.
+
+    Variables:
+        force_refresh = refetch every day instead of reading the cache
+
+    Returns:
+        rollups = dictionary of resolution name -> dataframe, and 'analytics'
+        -> the UW_ANALYTICS summary
+
+    '''
+    dates = get_uw_dates()
+    raw = UW_DAY_CACHE.load(dates, get_uw_frame, force_refresh=force_refresh)
+    if UW_HISTORY is not None:
+        # keep the history store caught up with the finalized days
+        final = [date for date in dates if UWDayCache.is_final(date)]
+        if final:
+            cutoff = pd.Timestamp(final[-1]).normalize() + timedelta(days=1)
+            new = raw[raw['Time'] < cutoff]
+            last = UW_HISTORY.last_time()
+            if last is not None:
+                new = new[new['Time'] > last]
+            UW_HISTORY.append(new)
+        UW_ANALYTICS.catch_up(UW_HISTORY)
+    rollups = compute_rollups(raw)
+    rollups['analytics'] = UW_ANALYTICS.update(raw)
+    return rollups
+
+# Latest rooftop rollups shared by every session, see SharedFrameCache
+UW_FRAME_CACHE = SharedFrameCache(load_uw_rollups, max_age=UW_FRAME_MAX_AGE,
+    path=UW_SHARED_CACHE)
+
+def get_uw_range(start_date, end_date, resolution):
+    ''' Gets the rooftop data between two dates at one resolution. The past
+    week comes from the shared rollups, anything older from the history store
+    when long-history mode is on.
+
+    Variables:
+        start_date = first day of the range
+        end_date = last day of the range, inclusive
+        resolution = key into rollups.ROLLUPS
+
+    Returns:
+        df = dataframe indexed by Time with a Time column
+
+    '''
+    recent = UW_FRAME_CACHE.get()[resolution]
+    if UW_HISTORY is None or start_date is None or not len(recent):
+        return recent
+    start_date = pd.Timestamp(start_date).normalize()
+    recent_start = recent.index[0].normalize()
+    if start_date >= recent_start:
+        return recent
+    end = pd.Timestamp(end_date).normalize() + timedelta(days=1)
+    if end <= recent_start:
+        # all of it is older than the recent week
+        return UW_HISTORY.query_rollup(start_date, end, resolution)
+    older = UW_HISTORY.query_rollup(start_date, recent_start, resolution)
+    return pd.concat([older, recent])
+
+@lru_cache(maxsize=None)
 def get_api_key():
-    """Fetch the API key from your configuration file.
+    """Fetch the API key from your configuration file. The file is only read
+    once per process.
 
     Expects a configuration file named "secrets.ini" with structure:
 
@@ -98,71 +337,54 @@ def get_api_key():
     config.read("secrets.ini")
     return config["openweather"]["api_key"]
 
+# Shared Openweather client, responses are cached and concurrent requests
+# for the same data are coalesced
+OPENWEATHER_CLIENT = OpenWeatherClient(get_api_key)
+
+@timed('get_weather_data')
 def get_weather_data(query_url):
     """Makes an API request to a URL and returns the data as a Python object.
+    Goes through the shared client, so the request is rate limited, cached
+    and coalesced, with its timeouts, retries and circuit breaker.
 
     Args:
         query_url (str): URL formatted for OpenWeather's city name endpoint
 
     Returns:
         dict: Weather information for a specific city
+
+    Raises:
+        OpenWeatherError: the request failed or the response was unreadable
     """
-    # Makes the HTTP GET request
-    try:
-        response = request.urlopen(query_url)
-    except error.HTTPError as http_error:
-        # API key is invalid
-        if http_error.code == 401:  # 401 - Unauthorized
-            sys.exit("Access denied. Check your API key.")
-        # City doesn't exist
-        elif http_error.code == 404:  # 404 - Not Found
-            sys.exit("Can't find weather data for this city.")
-        # Unkown error
-        else:
-            sys.exit(f"Something went wrong... ({http_error.code})")
-    # Extracts the data frm the response
-    data = response.read()
-    # loads the JSON data
-    try:
-        return json.loads(data)
-    # Bad JSON data
-    except json.JSONDecodeError:
-        sys.exit("Couldn't read the server response.")
+    parts = parse.urlsplit(query_url)
+    params = dict(parse.parse_qsl(parts.query))
+    # the client adds its own key
+    params.pop('appid', None)
+    return _get_openweather(parts.path.rstrip('/').rsplit('/', 1)[-1], params, "")
 
+@timed('get_forecast_data')
 def get_forecast_data(weather_data, imperial=False):
-    api_key = get_api_key()
     # Get the coordinates
     lat = weather_data['coord']['lat']
     lon = weather_data['coord']['lon']
     # units
     units = "imperial" if imperial else "metric"
-    # MAke the forecast url
-    forecast_url = (
-        f"{BASE_FORECAST_API_URL}?lat={lat}&lon={lon}"
-        f"&units={units}&appid={api_key}"
-    )
+    return _get_openweather('forecast', {'lat': lat, 'lon': lon, 'units': units},
+        "Forecast: ")
 
-    # Make the API call
-    try:
-        response = request.urlopen(forecast_url)
-    except error.HTTPError as http_error:
-        # API key is invalid
-        if http_error.code == 401:  # 401 - Unauthorized
-            sys.exit("Forecast: Access denied. Check your API key.")
-        # City doesn't exist
-        elif http_error.code == 404:  # 404 - Not Found
-            sys.exit("Forecast: Can't find forecast data for this city.")
-        # Unkown error
-        else:
-            sys.exit(f"Forecast: Something went wrong... ({http_error.code})")
-    # Extracts the data frm the response
-    data = response.read()
-    # loads the JSON data
+def _get_openweather(endpoint, params, prefix):
     try:
-        return json.loads(data)
-    # Bad JSON data
-    except json.JSONDecodeError:
-        sys.exit("Forecast: Couldn't read the server response.")
+        return OPENWEATHER_CLIENT.get(endpoint, **params)
+    except OpenWeatherError as exc:
+        # 401, 404 or unreadable, the client has the message
+        code, message = exc.code, str(exc)
+        if not prefix:
+            raise
+    except Exception as exc:
+        # timed out, unreachable or the circuit is open
+        code = getattr(exc, 'code', None)
+        message = f"Something went wrong... ({code or exc})"
+    raise OpenWeatherError(prefix + message, code)
 
 def get_current_wx(current_data):
     ''' Extracts desired data from the Openweather JSON data containing
@@ -201,48 +423,81 @@ def get_current_wx(current_data):
     }
     return current_wx
 
-def get_forecast_dataframe(forecast_wx):
+# Where each forecast column is found in an entry of the forecast list, and
+# the columns get_forecast_dataframe returns by default
+FORECAST_FIELDS = {
+    'Date': ('dt',),
+    'Temperature': ('main', 'temp'),
+    'Temperature Min': ('main', 'temp_min'),
+    'Temperature Max': ('main', 'temp_max'),
+    'Pressure': ('main', 'pressure'),
+    'Relative Humidity': ('main', 'humidity'),
+    'Weather': ('weather', 0, 'main'),
+    'Weather Description': ('weather', 0, 'description'),
+    'Clouds': ('clouds', 'all'),
+    'Wind Speed': ('wind', 'speed'),
+    'Wind Direction': ('wind', 'deg'),
+    'Wind Gust': ('wind', 'gust'),
+    'Pop': ('pop',)
+}
+FORECAST_COLUMNS = ['Date', 'Temperature', 'Pressure', 'Relative Humidity',
+    'Weather Description', 'Wind Speed', 'Wind Direction', 'Pop']
+# Rounded to whole numbers for display
+FORECAST_ROUNDED = ('Temperature', 'Wind Speed', 'Wind Gust')
+
+def _forecast_extractor(fields):
+    ''' Builds a function returning the values of fields from one forecast
+    entry as a tuple. Fields under the same key, e.g. everything in 'main',
+    share one lookup of that key.
+    '''
+    groups = {}
+    for i, field in enumerate(fields):
+        top, *rest = FORECAST_FIELDS[field]
+        groups.setdefault(top, []).append((i, rest))
+
+    def extract(entry):
+        values = [None] * len(fields)
+        for top, paths in groups.items():
+            node = entry.get(top)
+            for i, rest in paths:
+                value = node
+                for key in rest:
+                    try:
+                        value = value[key]
+                    except (KeyError, IndexError, TypeError):
+                        value = None
+                        break
+                values[i] = value
+        return values
+    return extract
+
+def get_forecast_dataframe(forecast_wx, fields=FORECAST_COLUMNS, rounded=True):
     '''Takes in the 5 day, 3 hourly forecast JSON data from Openweather
-    and unpacks it to make a pandas dataframe
+    and unpacks it to make a pandas dataframe. The list of forecast steps is
+    walked once, pulling out only the requested fields.
 
     Variables:
-        forecast_data = JSON data returned from API call
+        forecast_wx = JSON data returned from API call, or a list of them for
+            several cities, which adds a City column
+        fields = columns to extract, keys of FORECAST_FIELDS
+        rounded = round the FORECAST_ROUNDED columns for display
     Returns:
-        df = pandas dataframe with desired data
+        df = pandas dataframe with desired data, Date as datetime64 (UTC)
     '''
-    # Get the datetimes
-    dts = [date['dt_txt'] for date in forecast_wx['list']]
-    dts = pd.to_datetime(dts)
-    dts = dts.strftime('%m/%d/%Y %H:%M')
-    # Get the other quantities
-    temperature = np.round([date['main']['temp'] for date in forecast_wx['list']])
-    temp_min = [date['main']['temp_min'] for date in forecast_wx['list']]
-    temp_max = [date['main']['temp_max'] for date in forecast_wx['list']]
-    pressure = [date['main']['pressure'] for date in forecast_wx['list']]
-    humidity = [date['main']['humidity'] for date in forecast_wx['list']]
-    weather = [date['weather'][0]['main'] for date in forecast_wx['list']]
-    weather_description = [date['weather'][0]['description'] for date in forecast_wx['list']]
-    clouds = [date['clouds']['all'] for date in forecast_wx['list']]
-    wind_speed = np.round([date['wind']['speed'] for date in forecast_wx['list']])
-    wind_direction = [date['wind']['deg'] for date in forecast_wx['list']]
-    wind_gust = np.round([date['wind']['gust'] for date in forecast_wx['list']])
-    pop = [date['pop'] for date in forecast_wx['list']]
-
-    df = pd.DataFrame(
-        data={
-            'Date':dts,
-            'Temperature': temperature,
-            # 'Temperature Min': temp_min,
-            # 'Temperature Max': temp_max,
-            'Pressure': pressure,
-            'Relative Humidity': humidity,
-            # 'Weather': weather,
-            'Weather Description': weather_description,
-            # 'Clouds': clouds,
-            'Wind Speed': wind_speed,
-            'Wind Direction': wind_direction,
-            # 'Wind Gust': wind_gust,
-            'Pop': pop
-            }
-        )
+    extract = _forecast_extractor(fields)
+    if isinstance(forecast_wx, (list, tuple)):
+        # one pass over every city's steps, then the city names alongside
+        rows = [extract(entry) for city_wx in forecast_wx for entry in city_wx['list']]
+        df = pd.DataFrame.from_records(rows, columns=list(fields))
+        df.insert(0, 'City', np.repeat([city_wx.get('city', {}).get('name')
+            for city_wx in forecast_wx], [len(city_wx['list']) for city_wx in forecast_wx]))
+    else:
+        rows = list(map(extract, forecast_wx['list']))
+        df = pd.DataFrame.from_records(rows, columns=list(fields))
+    if 'Date' in df:
+        dates = np.array(df['Date'].values, dtype=np.int64).astype('datetime64[s]')
+        df['Date'] = dates.astype('datetime64[ns]')
+    for col in FORECAST_ROUNDED if rounded else ():
+        if col in df:
+            df[col] = np.round(df[col].astype(np.float64))
     return df
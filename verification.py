@@ -0,0 +1,288 @@
+''' Forecast verification against the ATG rooftop.
+
+Every fetched Openweather forecast is appended to an archive keyed by issue
+time (when it was fetched) and valid time, in the rooftop's units. The
+verification joins archived forecasts to the rooftop observations nearest
+their valid time with a sorted as-of join and reports bias and mean absolute
+error by lead time.
+
+Usage:
+    python verification.py report [--days 30] [--dir DIR]
+
+'''
+import argparse
+import logging
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from rollups import ROLLUPS
+from uw_wx import UW_CACHE_DIR, get_forecast_dataframe, get_uw_range
+# Constants
+UW_FORECAST_DIR = os.environ.get('UW_FORECAST_DIR', os.path.join(UW_CACHE_DIR, 'forecasts'))
+# One archived forecast step, in the rooftop's units (UNITS_DICT in app.py)
+FORECAST_DTYPE = np.dtype([
+    ('Issued', 'M8[ns]'),
+    ('Valid', 'M8[ns]'),
+    ('Temperature', 'f4'),
+    ('Pressure', 'f4'),
+    ('Relative Humidity', 'f4'),
+    ('Wind Speed', 'f4'),
+    ('Wind Direction', 'f4'),
+    ('Gust', 'f4'),
+    ('Pop', 'f4')
+])
+FORECAST_VARIABLES = list(FORECAST_DTYPE.names[2:])
+# Openweather's forecast reaches 5 days out
+MAX_LEAD = pd.Timedelta(days=5)
+# Variables verified, lead time bins and how far an observation may be from
+# the valid time
+VERIFY_VARIABLES = ['Temperature', 'Pressure', 'Relative Humidity', 'Wind Speed',
+    'Wind Direction', 'Gust']
+LEAD_STEP_HOURS = 3
+VERIFY_TOLERANCE = pd.Timedelta(minutes=30)
+MPS_TO_KTS = 1.943844
+MPH_TO_KTS = 0.868976
+
+logger = logging.getLogger(__name__)
+
+def to_rooftop_units(df, units='imperial'):
+    ''' Converts decoded forecast columns from Openweather units to the
+    rooftop's: Temperature in F, Wind Speed and Gust in kts, Pressure stays
+    hPa.
+
+    Variables:
+        df = dataframe from get_forecast_dataframe
+        units = the Openweather units the forecast was requested in,
+            'imperial', 'metric' or 'standard'
+
+    Returns:
+        df = converted copy
+
+    '''
+    df = df.copy()
+    temperature = df['Temperature'].astype(np.float64)
+    if units == 'metric':
+        df['Temperature'] = temperature * 9 / 5 + 32
+    elif units == 'standard':
+        df['Temperature'] = (temperature - 273.15) * 9 / 5 + 32
+    wind = MPH_TO_KTS if units == 'imperial' else MPS_TO_KTS
+    for col in ('Wind Speed', 'Gust'):
+        df[col] = df[col].astype(np.float64) * wind
+    return df
+
+class ForecastArchive:
+    ''' Append-only archive of forecast steps, one file of fixed-size
+    FORECAST_DTYPE records per month of issue time. Records are only ever
+    appended, in issue order, so the files are sorted by issue time and a
+    reader never sees a row change. A partial record left by a crash is
+    ignored.
+
+    Variables:
+        root = directory holding the monthly files (YYYY-MM.bin)
+
+    '''
+    def __init__(self, root=UW_FORECAST_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def partitions(self):
+        ''' Returns the months in the archive, oldest first. '''
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return []
+        months = []
+        for name in names:
+            try:
+                months.append(pd.Timestamp(datetime.strptime(name, '%Y-%m.bin')))
+            except ValueError:
+                continue
+        return sorted(months)
+
+    def _path(self, month):
+        return os.path.join(self.root, month.strftime('%Y-%m') + '.bin')
+
+    def _load(self, month):
+        try:
+            size = os.path.getsize(self._path(month))
+        except OSError:
+            return np.empty(0, dtype=FORECAST_DTYPE)
+        count = size // FORECAST_DTYPE.itemsize
+        if not count:
+            return np.empty(0, dtype=FORECAST_DTYPE)
+        return np.memmap(self._path(month), dtype=FORECAST_DTYPE, mode='r', shape=(count,))
+
+    def last_issued(self):
+        ''' Issue time of the newest forecast, None if empty. '''
+        for month in reversed(self.partitions()):
+            records = self._load(month)
+            if len(records):
+                return pd.Timestamp(records['Issued'][-1])
+        return None
+
+    def append(self, forecast_wx, issued=None, units='imperial'):
+        ''' Archives a forecast response. A forecast issued no later than the
+        newest one already archived is skipped.
+
+        Variables:
+            forecast_wx = Openweather forecast JSON
+            issued = when the forecast was fetched, default is now (UTC)
+            units = the units it was requested in
+
+        Returns:
+            n = number of steps archived
+
+        '''
+        issued = pd.Timestamp(datetime.utcnow() if issued is None else issued)
+        df = get_forecast_dataframe(forecast_wx, ['Date', 'Temperature', 'Pressure',
+            'Relative Humidity', 'Wind Speed', 'Wind Direction', 'Wind Gust', 'Pop'],
+            rounded=False).rename(columns={'Date': 'Valid', 'Wind Gust': 'Gust'})
+        df = to_rooftop_units(df, units)
+        records = np.empty(len(df), dtype=FORECAST_DTYPE)
+        records['Issued'] = issued.to_datetime64()
+        records['Valid'] = df['Valid'].values
+        for col in FORECAST_VARIABLES:
+            records[col] = pd.to_numeric(df[col], errors='coerce').values
+        with self._lock:
+            last = self.last_issued()
+            if not len(records) or (last is not None and issued <= last):
+                return 0
+            os.makedirs(self.root, exist_ok=True)
+            with open(self._path(issued.replace(day=1).normalize()), 'ab') as f:
+                f.write(records.tobytes())
+        return len(records)
+
+    def query(self, start, end, by='Valid'):
+        ''' Reads the forecast steps with start <= `by` < end. Months are
+        picked from the range and rows found by binary search on the issue
+        time, a valid time range only widens the issue range by MAX_LEAD.
+
+        Variables:
+            start = start of the range
+            end = end of the range, exclusive
+            by = 'Valid' or 'Issued'
+
+        Returns:
+            df = dataframe with a column per FORECAST_DTYPE field
+
+        '''
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        issued_start, issued_end = (start - MAX_LEAD, end) if by == 'Valid' else (start, end)
+        frames = []
+        for month in self.partitions():
+            if month + pd.DateOffset(months=1) <= issued_start or month >= issued_end:
+                continue
+            records = self._load(month)
+            lo, hi = np.searchsorted(records['Issued'],
+                [issued_start.to_datetime64(), issued_end.to_datetime64()])
+            records = np.array(records[lo:hi])
+            if by == 'Valid':
+                valid = records['Valid']
+                records = records[(valid >= start.to_datetime64()) & (valid < end.to_datetime64())]
+            frames.append(pd.DataFrame(records))
+        if not frames:
+            return pd.DataFrame(np.empty(0, dtype=FORECAST_DTYPE))
+        return pd.concat(frames, ignore_index=True)
+
+def verify(forecasts, obs, variables=VERIFY_VARIABLES, tolerance=VERIFY_TOLERANCE,
+    lead_step=LEAD_STEP_HOURS):
+    ''' Verifies forecasts against observations. Each forecast step is matched
+    to the observation nearest its valid time with one sorted as-of join,
+    then the errors are grouped by lead time.
+
+    Variables:
+        forecasts = dataframe from ForecastArchive.query
+        obs = rooftop observations indexed by Time, e.g. a rollup
+        variables = columns to verify, in both dataframes
+        tolerance = steps without an observation this close are left out
+        lead_step = width of the lead time bins in hours
+
+    Returns:
+        df = dataframe indexed by lead time in hours (the end of each bin)
+        with "<variable> Bias" (mean forecast - observed), "<variable> MAE"
+        and the number of matched steps in Count
+
+    '''
+    forecasts = forecasts.sort_values('Valid', kind='mergesort')
+    obs = obs[variables].sort_index()
+    merged = pd.merge_asof(forecasts, obs, left_on='Valid', right_index=True,
+        direction='nearest', tolerance=tolerance, suffixes=('', ' Observed'))
+    lead = (merged['Valid'] - merged['Issued']).values / np.timedelta64(1, 'h')
+    lead = pd.Index(np.maximum(np.ceil(lead / lead_step), 1) * lead_step, name='Lead (h)')
+    columns = {}
+    matched = None
+    for col in variables:
+        error = (merged[col].values.astype(np.float64)
+            - merged[col + ' Observed'].values.astype(np.float64))
+        if col == 'Wind Direction':
+            # the short way round, 350 vs 10 degrees is 20 off, not 340
+            error = (error + 180) % 360 - 180
+        error = pd.Series(error, index=lead)
+        grouped = error.groupby(level=0)
+        columns[col + ' Bias'] = grouped.mean()
+        columns[col + ' MAE'] = error.abs().groupby(level=0).mean()
+        valid = error.notna()
+        matched = valid if matched is None else matched | valid
+    df = pd.DataFrame(columns)
+    df['Count'] = matched.groupby(level=0).sum()
+    return df
+
+def verify_archive(archive, start, end, resolution='raw'):
+    ''' Verifies the archived forecasts valid between two days against the
+    rooftop data at a resolution from rollups.ROLLUPS.
+
+    Rollups are labelled by the left edge of their bucket, they are matched
+    by the middle of it instead. Forecast valid times fall on bucket edges,
+    where a tie goes to the bucket before, so the one minute raw obs are the
+    default.
+
+    Raises ValueError if there is no rooftop data for the days at all. When
+    it only covers the later days, e.g. the past week without a history
+    store, the earlier days are left out with a warning.
+    '''
+    start = pd.Timestamp(start).normalize()
+    end = pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+    obs = get_uw_range(start, end - pd.Timedelta(days=1), resolution)
+    covered = obs.index[(obs.index >= start) & (obs.index < end)]
+    if not len(covered):
+        raise ValueError(f"No rooftop data between {start:%Y-%m-%d} and "
+            f"{end - pd.Timedelta(days=1):%Y-%m-%d}, set UW_HISTORY_DIR to keep more "
+            "than the past week")
+    if covered[0].normalize() > start:
+        start = covered[0].normalize()
+        logger.warning("Rooftop data only goes back to %s, verifying from there. Set "
+            "UW_HISTORY_DIR to keep more than the past week", f"{start:%Y-%m-%d}")
+    if resolution != 'raw':
+        step = {name: step for name, _, step in ROLLUPS}[resolution]
+        obs = obs.set_axis(obs.index + pd.Timedelta(seconds=step / 2))
+    forecasts = archive.query(start, end)
+    return verify(forecasts, obs)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command')
+    report = sub.add_parser('report', help='bias and MAE by lead time')
+    report.add_argument('--days', type=int, default=30, help='days of valid times to verify')
+    report.add_argument('--dir', default=UW_FORECAST_DIR)
+    args = parser.parse_args()
+    logging.basicConfig(format='%(levelname)s: %(message)s')
+
+    if args.command == 'report':
+        end = pd.Timestamp(datetime.utcnow()).normalize()
+        try:
+            result = verify_archive(ForecastArchive(args.dir),
+                end - pd.Timedelta(days=args.days), end)
+        except ValueError as exc:
+            parser.error(str(exc))
+        with pd.option_context('display.width', 200, 'display.max_columns', None):
+            print(result.round(2))
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+''' Production entry point for a multi-worker WSGI server, e.g.
+
+    gunicorn --workers 4 --bind 0.0.0.0:8000 wsgi:server
+
+Every worker imports this module and starts the background scheduler, but
+only one of them (whichever holds the lock in UW_SCHEDULER_DIR) fetches
+upstream data. The rooftop rollups are memory-mapped from UW_SHARED_CACHE
+and the weather snapshots read from UW_SCHEDULER_DIR, so the workers share
+one copy of the data. Fast start is on, so a worker never makes a request
+wait on an upstream fetch.
+
+Don't use gunicorn's --preload, the scheduler thread has to be started in
+each worker, not in the master before it forks.
+'''
+import os
+import threading
+# Defaults for serving, before the modules reading them are imported
+os.environ.setdefault('UW_FAST_START', '1')
+from uw_wx import UW_CACHE_DIR
+os.environ.setdefault('UW_SCHEDULER_DIR', os.path.join(UW_CACHE_DIR, 'scheduler'))
+
+from app import SCHEDULER, app, warm_figure_templates
+
+server = app.server
+SCHEDULER.start()
+threading.Thread(target=warm_figure_templates, daemon=True).start()